@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from retry import is_transient
+version = '20261016'
+# Adaptive session concurrency for -w auto (20261016)
+
+DEFAULT_MIN = 4
+DEFAULT_MAX = 256
+# Same as the fixed -w default, so auto mode never starts slower than before
+DEFAULT_START = 16
+# Logins per decision: at least MIN_WINDOW, otherwise half the current limit
+MIN_WINDOW = 8
+# A window with this share of timeouts/resets, and at least MIN_ERRORS of them, backs off without waiting for the window to fill
+ERROR_RATE = 0.1
+MIN_ERRORS = 2
+# Median login this many times the best median seen so far means AAA or the path is queueing
+LATENCY_FACTOR = 2.0
+DECREASE = 0.5
+# Slow start doubles the limit per healthy window, afterwards it grows by this fraction (at least 1)
+INCREASE = 0.125
+
+# -w value: a session count or "auto"
+def workers_arg(value):
+    if value == "auto":
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a number of sessions or 'auto', got '{value}'")
+
+# Session limit that follows the outcome of each login: raised while login latency and connect errors stay healthy,
+# halved when timeouts/resets or login latency rise. Thread-safe; also the session gate of the thread engine
+class AdaptiveLimit:
+    def __init__(self, minimum=DEFAULT_MIN, maximum=DEFAULT_MAX, start=DEFAULT_START):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(self.maximum, max(self.minimum, start))
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.latencies = []
+        self.errors = 0
+        self.baseline = None
+        self.slow_start = True
+        self.started = time.monotonic()
+        self.decreased = self.started
+        # (seconds since start, limit, reason) for every change, written to the connection report
+        self.history = [(0.0, self.limit, "start")]
+
+    @property
+    def window(self):
+        return max(MIN_WINDOW, self.limit // 2)
+
+    # RunMetrics observer: a finished login is a latency sample, a tcp or login phase failing with a timeout or
+    # reset is an error sample; auth rejections and refused connections say nothing about load
+    def observe(self, ip, phase, seconds, error=None):
+        if phase not in ("tcp", "login") or (error is None and phase != "login"):
+            return
+        if error is not None and not is_transient(error):
+            return
+        with self.condition:
+            # Logins started before the last decrease ran under the old limit
+            if time.monotonic() - seconds < self.decreased:
+                return
+            if error is None:
+                self.latencies.append(seconds)
+            else:
+                self.errors += 1
+            self._adjust()
+
+    def _adjust(self):
+        logger = logging.getLogger(__name__)
+        samples = len(self.latencies) + self.errors
+        overloaded = self.errors >= max(MIN_ERRORS, ERROR_RATE * max(samples, self.window))
+        if samples < self.window and not overloaded:
+            return
+        median = statistics.median(self.latencies) if self.latencies else None
+        stats = f"login p50 {median:.2f}s, " if median is not None else ""
+        stats += f"errors {self.errors}/{samples}"
+        if not overloaded and median is not None and self.baseline and median > LATENCY_FACTOR * self.baseline:
+            overloaded = True
+            stats += f", baseline {self.baseline:.2f}s"
+        if overloaded:
+            limit = max(self.minimum, int(self.limit * DECREASE))
+            self.slow_start = False
+            self.decreased = time.monotonic()
+        elif self.slow_start:
+            limit = min(self.maximum, self.limit * 2)
+        else:
+            limit = min(self.maximum, self.limit + max(1, int(self.limit * INCREASE)))
+        if median is not None and not overloaded and (self.baseline is None or median < self.baseline):
+            self.baseline = median
+        self.latencies = []
+        self.errors = 0
+        if limit == self.limit:
+            return
+        reason = f"{'backoff' if overloaded else 'ramp up'}: {stats}"
+        logger.info(f"Concurrency {self.limit} -> {limit} ({reason})")
+        self.history.append((round(time.monotonic() - self.started, 1), limit, reason))
+        self.limit = limit
+        self.condition.notify_all()
+
+    def peak(self):
+        return max(limit for _, limit, _ in self.history)
+
+    def summary(self):
+        return f"start {self.history[0][1]}, peak {self.peak()}, final {self.limit}, {len(self.history) - 1} changes"
+
+    # Thread gate around one connection attempt
+    def __enter__(self):
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify()
+
+# asyncio.Semaphore look-alike that admits sessions up to the current AdaptiveLimit, for the async engine and AsyncBatchScheduler
+class AsyncAdaptiveLimit:
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.waiters = deque()
+
+    async def acquire(self):
+        while self.in_flight >= self.limit.limit:
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+                raise
+        self.in_flight += 1
+        return True
+
+    # A raised limit is picked up here too, every release wakes as many waiters as there are free slots
+    def release(self):
+        self.in_flight -= 1
+        free = self.limit.limit - self.in_flight
+        while free > 0 and self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
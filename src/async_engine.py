@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+import asyncio
+import errno
+import logging
+import re
+import socket
+from netmiko.ssh_autodetect import SSH_MAPPER_BASE
+from pipeline import split_output, group_finished, PipelineDesync
+from capture import read_command
+try:
+    import asyncssh
+except ImportError:
+    asyncssh = None
+version = '20261016'
+# asyncio + asyncssh collection engine for --engine async (20261016)
+
+# Connection defaults aligned with Netmiko (conn_timeout, send_command read_timeout)
+CONN_TIMEOUT = 10
+READ_TIMEOUT = 10.0
+READ_CHUNK = 65536
+PROMPT_TERMINATORS = "#>$%]"
+PAGER_PATTERN = re.compile(r"-+\s*More\s*-+|<--- More --->", re.IGNORECASE)
+NEWLINE_PATTERN = re.compile("(\r\r\r\n|\r\r\n|\r\n|\n\r)")
+PROMPT_SETTLE = 0.2
+
+# Session preparation per Netmiko device type, mirrors each driver's session_preparation()
+# Device types not listed here are handed back to the Netmiko thread path by pyshcmd
+ASYNC_PLATFORMS = {
+    "cisco_ios": {"prepare": ["terminal width 511", "terminal length 0"], "enable": True},
+    "cisco_xe": {"prepare": ["terminal width 511", "terminal length 0"], "enable": True},
+    "cisco_nxos": {"prepare": ["terminal length 0", "terminal width 511"], "enable": True},
+    "f5_tmsh": {"prepare": ["tmsh", "modify cli preference pager disabled display-threshold 0"], "enable": False},
+    "f5_ltm": {"prepare": ["tmsh", "modify cli preference pager disabled display-threshold 0"], "enable": False},
+    "f5_linux": {"prepare": [], "enable": False},
+}
+
+# Output patterns that make SSHDetect discard a candidate (netmiko.ssh_autodetect._autodetect_std)
+INVALID_RESPONSES = [
+    r"% Invalid input detected",
+    r"syntax error, expecting",
+    r"Error: Unrecognized command",
+    r"%Error",
+    r"command not found",
+    r"Syntax Error: unexpected argument",
+    r"% Unrecognized command found at",
+    r"% Unknown command, the error locates at",
+]
+
+# Exceptions that map to Netmiko's NetMikoAuthenticationException / NetmikoTimeoutException
+if asyncssh is not None:
+    AUTH_ERRORS = (asyncssh.PermissionDenied,)
+    CONNECT_ERRORS = (asyncssh.Error, OSError, asyncio.TimeoutError)
+else:
+    AUTH_ERRORS = ()
+    CONNECT_ERRORS = (OSError, asyncio.TimeoutError)
+
+def is_available():
+    return asyncssh is not None
+
+# Interactive SSH shell session driven by prompt matching, the asyncio counterpart of a Netmiko connection
+class AsyncSession:
+    def __init__(self, ip, port, username, password, secret="", conn_timeout=CONN_TIMEOUT, read_timeout=READ_TIMEOUT, jump=None):
+        self.ip = ip
+        self.port = port
+        self.username = username
+        self.password = password
+        self.secret = secret
+        self.conn_timeout = conn_timeout
+        self.read_timeout = read_timeout
+        # jumphost.AsyncJumpHost; its shared connection is held as tunnel from open_socket() to close()
+        self.jump = jump
+        self.tunnel = None
+        self.conn = None
+        self.process = None
+        self.prompt = ""
+        self.base_prompt = ""
+        self.remote_version = ""
+
+    # Slot on one of the jump host's transports, waited for while every channel is in use
+    async def wait_jump(self):
+        if self.tunnel is None:
+            self.tunnel = await self.jump.acquire()
+
+    # Connect the TCP socket separately so its latency can be told apart from the SSH login; behind a jump host
+    # the channel is opened by open() over the transport from wait_jump()
+    async def open_socket(self):
+        if self.jump:
+            await self.wait_jump()
+            return None
+        loop = asyncio.get_running_loop()
+        infos = await loop.getaddrinfo(self.ip, self.port, type=socket.SOCK_STREAM)
+        family, type_, proto, _, address = infos[0]
+        sock = socket.socket(family, type_, proto)
+        sock.setblocking(False)
+        try:
+            await asyncio.wait_for(loop.sock_connect(sock, address), timeout=self.conn_timeout)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    async def open(self, sock=None):
+        options = {"tunnel": self.tunnel} if self.tunnel else {"sock": sock}
+        try:
+            self.conn = await asyncio.wait_for(
+                asyncssh.connect(
+                    self.ip, port=self.port, username=self.username, password=self.password,
+                    known_hosts=None, preferred_auth="keyboard-interactive,password", **options
+                ),
+                timeout=self.conn_timeout
+            )
+        except asyncssh.ChannelOpenError as e:
+            # The jump host could not reach the device: not retried, as a refused direct connect
+            raise OSError(errno.EHOSTUNREACH, f"Jump host {self.jump.name} cannot connect to {self.ip}:{self.port}: {e.reason}") from None
+        self.remote_version = self.conn.get_extra_info("server_version", "") or ""
+        self.process = await self.conn.create_process(
+            term_type="vt100", term_size=(511, 24), encoding="utf-8", errors="replace"
+        )
+        await self.find_prompt()
+
+    async def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            try:
+                await asyncio.wait_for(self.conn.wait_closed(), timeout=self.conn_timeout)
+            except (asyncio.TimeoutError, OSError):
+                pass
+            self.conn = None
+        if self.tunnel is not None:
+            tunnel, self.tunnel = self.tunnel, None
+            await self.jump.release(tunnel)
+
+    # Read until the buffer ends with a prompt line matching pattern; with echo, only output from the
+    # command echo on counts, so a late prompt left over from the previous exchange is skipped (Netmiko cmd_verify)
+    async def read_until_prompt(self, pattern, timeout=None, echo=None):
+        buffer = ""
+        start = 0 if not echo else None
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.read_timeout)
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError(f"Pattern not detected: {pattern.pattern!r} in output from {self.ip}")
+            chunk = await asyncio.wait_for(self.process.stdout.read(READ_CHUNK), timeout=remaining)
+            if not chunk:
+                raise ConnectionResetError(f"Channel closed by {self.ip}")
+            buffer += chunk
+            if start is None:
+                start = buffer.find(echo)
+                if start < 0:
+                    start = None
+                    continue
+            last_line = buffer[start:].replace("\r", "").rsplit("\n", 1)[-1]
+            if pattern.search(last_line):
+                return buffer[start:]
+            # Autodetect runs before paging is disabled, so page through like a user would
+            if PAGER_PATTERN.search(last_line):
+                self.process.stdin.write(" ")
+
+    async def find_prompt(self):
+        self.process.stdin.write("\n")
+        output = await self.read_until_prompt(re.compile(rf"[{re.escape(PROMPT_TERMINATORS)}]\s*$"))
+        # The login banner prompt and the prompt echoed for our newline can arrive separately, drain both
+        while True:
+            try:
+                chunk = await asyncio.wait_for(self.process.stdout.read(READ_CHUNK), timeout=PROMPT_SETTLE)
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                raise ConnectionResetError(f"Channel closed by {self.ip}")
+            output += chunk
+        self.prompt = output.replace("\r", "").rstrip().rsplit("\n", 1)[-1].strip()
+        self.base_prompt = self.prompt[:-1] if self.prompt else ""
+        return self.prompt
+
+    def prompt_pattern(self):
+        # Cisco abbreviates the prompt in config mode, so match on the leading part like Netmiko does
+        return re.compile(rf"{re.escape(self.base_prompt[:16])}.*[{re.escape(PROMPT_TERMINATORS)}]\s*$")
+
+    async def send_command(self, command, timeout=None):
+        self.process.stdin.write(command + "\n")
+        output = await self.read_until_prompt(self.prompt_pattern(), timeout=timeout, echo=command.strip() or None)
+        return self.clean_output(command, output)
+
+    # --capture: the output goes into buffer chunk by chunk instead of being returned whole; the timeout is per chunk
+    async def capture_command(self, command, buffer, timeout=None):
+        self.process.stdin.write(command + "\n")
+        return await read_command(self.process.stdout, command, self.base_prompt, buffer, timeout or self.read_timeout)
+
+    # Pipelined mode: write the whole group at once and split the combined output on prompt + echo boundaries.
+    # Returns outputs in order, fewer than commands if the read timed out; each command gets the read timeout to finish
+    async def send_commands(self, commands, timeout=None):
+        self.process.stdin.write("".join(command + "\n" for command in commands))
+        pattern = self.prompt_pattern()
+        loop = asyncio.get_running_loop()
+        buffer = ""
+        chunks = []
+        deadline = loop.time() + (timeout or self.read_timeout)
+        while len(chunks) < len(commands):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                chunk = await asyncio.wait_for(self.process.stdout.read(READ_CHUNK), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                raise ConnectionResetError(f"Channel closed by {self.ip}")
+            buffer += chunk
+            done = split_output(buffer, commands, self.prompt, pattern)
+            if len(done) > len(chunks):
+                deadline = loop.time() + (timeout or self.read_timeout)
+            chunks = done
+        outputs = [self.clean_output(command, chunk) for command, chunk in zip(commands, chunks)]
+        if len(chunks) < len(commands):
+            await self.drain_group(commands, buffer, pattern, outputs, timeout)
+        return outputs
+
+    # Read the rest of a stalled group up to the prompt after its last command, so the commands run one by one
+    # afterwards get their own output; PipelineDesync if the prompt does not come back as it was
+    async def drain_group(self, commands, buffer, pattern, outputs, timeout=None):
+        loop = asyncio.get_running_loop()
+        prompt = self.prompt
+        deadline = loop.time() + (timeout or self.read_timeout)
+        while not group_finished(buffer, commands, pattern):
+            remaining = deadline - loop.time()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                chunk = await asyncio.wait_for(self.process.stdout.read(READ_CHUNK), timeout=remaining)
+            except asyncio.TimeoutError:
+                raise PipelineDesync(f"No prompt after '{commands[-1]}' on {self.ip}", outputs) from None
+            if not chunk:
+                raise ConnectionResetError(f"Channel closed by {self.ip}")
+            buffer += chunk
+        # A command that changed the prompt leaves the channel in another mode
+        if await self.find_prompt() != prompt:
+            raise PipelineDesync(f"Prompt changed after '{commands[-1]}' on {self.ip}", outputs)
+
+    # Normalize linefeeds, strip the echoed command and the trailing prompt (Netmiko send_command defaults)
+    def clean_output(self, command, output):
+        output = NEWLINE_PATTERN.sub("\n", output.replace("\x08", "")).replace("\r", "\n")
+        if output.startswith(command.strip()):
+            output = output.split("\n", 1)[1] if "\n" in output else ""
+        lines = output.split("\n")
+        if self.base_prompt and self.base_prompt[:16] in lines[-1]:
+            output = "\n".join(lines[:-1])
+        return output
+
+    async def prepare(self, device_type):
+        platform = ASYNC_PLATFORMS[device_type]
+        for command in platform["prepare"]:
+            self.process.stdin.write(command + "\n")
+            output = await self.read_until_prompt(re.compile(rf"[{re.escape(PROMPT_TERMINATORS)}]\s*$"), echo=command)
+            # Entering tmsh changes the prompt, so relearn it from the last line
+            self.prompt = output.replace("\r", "").rstrip().rsplit("\n", 1)[-1].strip()
+            self.base_prompt = self.prompt[:-1]
+
+    async def enable(self, device_type):
+        if not ASYNC_PLATFORMS[device_type]["enable"] or self.prompt.endswith("#"):
+            return
+        self.process.stdin.write("enable\n")
+        output = await self.read_until_prompt(re.compile(rf"(ssword.*|[{re.escape(PROMPT_TERMINATORS)}])\s*$", re.IGNORECASE), echo="enable")
+        if re.search(r"ssword", output.replace("\r", "").rsplit("\n", 1)[-1], re.IGNORECASE):
+            self.process.stdin.write(self.secret + "\n")
+            output = await self.read_until_prompt(re.compile(rf"[{re.escape(PROMPT_TERMINATORS)}]\s*$"))
+        self.prompt = output.replace("\r", "").rstrip().rsplit("\n", 1)[-1].strip()
+        self.base_prompt = self.prompt[:-1]
+        if not self.prompt.endswith("#"):
+            raise ValueError(f"Failed to enter enable mode on {self.ip}")
+
+    # Same candidate order, commands and scoring as SSHDetect.autodetect(), on the already open shell
+    async def autodetect(self):
+        logger = logging.getLogger(__name__)
+        results_cache = {}
+        potential_matches = {}
+        for device_type, autodetect_dict in SSH_MAPPER_BASE:
+            search_patterns = autodetect_dict.get("search_patterns") or []
+            priority = autodetect_dict.get("priority", 99)
+            re_flags = autodetect_dict.get("re_flags", re.IGNORECASE)
+            accuracy = 0
+            if autodetect_dict["dispatch"] == "_autodetect_remote_version":
+                if any(re.search(p, self.remote_version, flags=re_flags) for p in search_patterns):
+                    accuracy = priority
+            else:
+                cmd = autodetect_dict.get("cmd", "")
+                if not cmd or not search_patterns:
+                    continue
+                if cmd not in results_cache:
+                    try:
+                        results_cache[cmd] = await self.send_command(cmd)
+                    except asyncio.TimeoutError:
+                        results_cache[cmd] = ""
+                response = results_cache[cmd]
+                if any(re.search(p, response, flags=re.I) for p in INVALID_RESPONSES):
+                    continue
+                if any(re.search(p, response, flags=re_flags) for p in search_patterns):
+                    accuracy = priority
+            if accuracy:
+                potential_matches[device_type] = accuracy
+                if accuracy >= 99:
+                    break
+        if not potential_matches:
+            return None
+        best_match = sorted(potential_matches.items(), key=lambda t: t[1], reverse=True)[0][0]
+        best_match = {"cisco_wlc_85": "cisco_wlc", "cisco_xr_2": "cisco_xr"}.get(best_match, best_match)
+        logger.debug(f"Autodetect candidates for {self.ip}: {potential_matches}")
+        return best_match
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+try:
+    import resource
+except ImportError:
+    resource = None
+import pyshcmd as pyshcmd
+import run_batch as run_batch
+import fakedev as fakedev
+from result_sink import ResultSink
+from adaptive import AdaptiveLimit, workers_arg
+version = '20261016'
+# Benchmark of the collection engines against a local fake device fleet (20261016)
+
+SIZES = "10,100,1000,5000"
+# Direct targets call pyshcmd.send_command_to_devices, batch targets call run_batch.run_shared_batch
+TARGETS = {
+    "thread": ("direct", "thread"),
+    "async": ("direct", "async"),
+    "batch-thread": ("batch", "thread"),
+    "batch-async": ("batch", "async"),
+}
+SAMPLE_INTERVAL = 0.05
+
+# Start fakedev.py in its own process so the fake fleet does not share the client's GIL; it serves rows [start, start + count) of fleet_csv
+def start_fleet_process(fleet_csv, start, count, lines=20, seed=0, aaa_capacity=0):
+    cmd = [sys.executable, os.path.join(os.path.dirname(__file__), "fakedev.py"),
+           "--fleet", fleet_csv, "--start", str(start), "-n", str(count), "-l", str(lines), "--seed", str(seed),
+           "--aaa-capacity", str(aaa_capacity)]
+    return subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+
+# Spread the fleet over several fakedev processes and wait until every slice is listening
+# aaa_capacity applies to each process, every fakedev process has its own fake AAA server
+def start_fleet(devices, fleet_csv, processes, lines=20, seed=0, aaa_capacity=0):
+    processes = max(1, min(processes, len(devices)))
+    size = math.ceil(len(devices) / processes)
+    slices = [(start, min(size, len(devices) - start)) for start in range(0, len(devices), size)]
+    fleet = [start_fleet_process(fleet_csv, start, count, lines, seed, aaa_capacity) for start, count in slices]
+    for proc, (start, count) in zip(fleet, slices):
+        proc.stdout.readline()  # fleet prints one line once all listeners are up
+        last = devices[start + count - 1]
+        with socket.create_connection((last["ip"], int(last["port"])), timeout=10):
+            pass
+    return fleet
+
+def stop_fleet(fleet):
+    for proc in fleet:
+        proc.terminate()
+    for proc in fleet:
+        proc.wait()
+
+# Highest thread count seen while a case runs, not counting the sampler itself
+class ThreadSampler:
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self.running = threading.Event()
+        self.thread = threading.Thread(target=self._sample, name="thread-sampler", daemon=True)
+
+    def _sample(self):
+        while self.running.is_set():
+            self.peak = max(self.peak, threading.active_count() - 1)
+            time.sleep(self.interval)
+
+    def start(self):
+        self.running.set()
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running.clear()
+        self.thread.join()
+        return self.peak
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+# Run one case in a fresh interpreter so peak RSS, thread count and module state belong to this case only
+def run_case(target, devices, concurrency, workdir, csv_count=4, save_json=False, verbose=False, pipeline=0):
+    logging.basicConfig(level=logging.WARNING if verbose else logging.CRITICAL, format="%(asctime)s: %(levelname)s: %(name)s: %(message)s")
+    kind, engine = TARGETS[target]
+    casedir = os.path.join(workdir, f"{target}_{len(devices)}")
+    os.makedirs(casedir, exist_ok=True)
+    pyshcmd.CONFIG_DIR_FULL = casedir
+    pyshcmd.OUTPUT_DIR_FULL = os.path.join(casedir, pyshcmd.OUTPUT_DIR)
+    pyshcmd.REPORT_DIR_FULL = os.path.join(casedir, pyshcmd.REPORT_DIR)
+    pyshcmd.JOURNAL_DIR_FULL = os.path.join(casedir, pyshcmd.JOURNAL_DIR)
+
+    if kind == "batch":
+        csv_files = []
+        for i in range(min(csv_count, len(devices))):
+            csv_file = f"bench{i + 1}.csv"
+            fakedev.write_fleet_csv(csv_file, devices[i::csv_count], config_dir=casedir)
+            csv_files.append(csv_file)
+        # Single attempt, no journal and no duration history, like the direct targets: the fake fleet's timings stay out of cache/
+        batch_args = ["-b", "unused", "-e", engine, "-w", str(concurrency), "--no-detect-cache", "--metrics", "none",
+                      "--retries", "0", "--no-journal", "--no-history", "--pipeline", str(pipeline)]
+        args = run_batch.build_parser().parse_args(batch_args + (["-json"] if save_json else []))
+
+    sampler = ThreadSampler().start()
+    start = time.perf_counter()
+    if kind == "direct":
+        # Same streaming sink as pyshcmd main, so results are not held in memory for the whole run
+        sink = ResultSink(json_path=pyshcmd.json_output_path("bench", pyshcmd.DATETIME, "option1") if save_json else None)
+        with sink:
+            limit = AdaptiveLimit() if concurrency == "auto" else None
+            _, detected_types = pyshcmd.send_command_to_devices(devices, max_workers=concurrency, engine=engine, sink=sink, pipeline=pipeline,
+                                                                limit=limit)
+        statuses = [entry[3] for entry in detected_types.values()]
+    else:
+        states = run_batch.run_shared_batch(csv_files, args) or {}
+        statuses = [entry[3] for state in states.values() for entry in state["detected_types"].values()]
+    elapsed = time.perf_counter() - start
+    peak_threads = sampler.stop()
+    return {
+        "target": target,
+        "devices": len(devices),
+        "concurrency": concurrency,
+        "success": statuses.count("Success"),
+        "failed": len(devices) - statuses.count("Success"),
+        "wall": round(elapsed, 3),
+        "devices_per_sec": round(len(devices) / elapsed, 2) if elapsed else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_threads": peak_threads,
+    }
+
+def run_isolated(target, devices, concurrency, workdir, csv_count, save_json, verbose, pipeline=0):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(run_case, target, devices, concurrency, workdir, csv_count, save_json, verbose, pipeline).result()
+
+def load_baseline(filename):
+    with open(filename, "r") as f:
+        return {(r["target"], r["devices"], r["concurrency"]): r for r in json.load(f)["results"]}
+
+def save_results(results, fleet, filename=None):
+    logger = logging.getLogger(__name__)
+    os.makedirs(pyshcmd.REPORT_DIR_FULL, exist_ok=True)
+    filename = filename or os.path.join(pyshcmd.REPORT_DIR_FULL, f"benchmark_{pyshcmd.DATETIME}.json")
+    with open(filename, "w") as f:
+        json.dump({
+            "generated": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "host": platform.node(),
+            "cpus": os.cpu_count(),
+            "python": platform.python_version(),
+            "fleet": fleet,
+            "results": results,
+        }, f, indent=4)
+    logger.warning(f"Benchmark results saved to {filename}")
+    return filename
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pyshcmd and run_batch against a local fake fleet at several fleet sizes")
+    parser.add_argument("-n", "--sizes", default=SIZES, help=f"Comma separated fleet sizes (default: {SIZES})")
+    parser.add_argument("-p", "--port", type=int, default=20022, help="Fake device port")
+    parser.add_argument("-w", "--workers", type=workers_arg, default=16, help="Thread engine workers / run_batch max sessions, or auto")
+    parser.add_argument("-a", "--sessions", type=workers_arg, default=1000, help="Async engine concurrent sessions, or auto")
+    parser.add_argument("--targets", default="thread,async,batch-thread,batch-async", help=f"Comma separated targets: {', '.join(TARGETS)}")
+    parser.add_argument("--csvs", type=int, default=4, help="Number of CSVs the batch targets split the fleet into")
+    parser.add_argument("-json", "--save-json", action="store_true", help="Also write JSON output during the runs")
+    parser.add_argument("-t", "--device-type", default="cisco_ios", help="Comma separated fake device types, assigned round-robin")
+    parser.add_argument("--cmdfile", default=None, help="Command file in cmd/ sent to every device (default: per device type)")
+    parser.add_argument("-l", "--lines", type=int, default=20, help="Output lines per show command")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before each command answers")
+    parser.add_argument("--auth-delay", type=float, default=0.0, help="Seconds before a password is accepted or rejected")
+    parser.add_argument("--auth-fail-rate", type=float, default=0.0, help="Probability a login is rejected")
+    parser.add_argument("--connect-fail-rate", type=float, default=0.0, help="Probability a connection is reset before login")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Probability a device drops the session on each command")
+    parser.add_argument("--rtt", type=float, default=0.0, help="Emulated link round trip of every device in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the failure injection")
+    parser.add_argument("--aaa-capacity", type=int, default=0, help="Logins each fakedev process's fake AAA server checks at once (default: 0, unlimited)")
+    parser.add_argument("--pipeline", type=int, default=0, help="Pipelined command groups of this size in every target (default: 0, off)")
+    parser.add_argument("--fleet", default=None, help="Fleet CSV in config/ with per-device behaviour columns, instead of a generated fleet")
+    parser.add_argument("--fleet-procs", type=int, default=0, help="fakedev processes serving the fleet (default: one per 1000 devices, up to the CPU count)")
+    parser.add_argument("-o", "--output", default=None, help="Results file (default: report/benchmark_<timestamp>.json)")
+    parser.add_argument("--baseline", default=None, help="Earlier results file to compare devices/sec against")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show warnings and errors of the benchmarked runs")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s: %(levelname)s: %(name)s: %(message)s")
+    targets = args.targets.split(",")
+    unknown = [t for t in targets if t not in TARGETS]
+    if unknown:
+        parser.error(f"unknown target(s): {', '.join(unknown)}")
+    behaviour = {"latency": args.latency, "auth_delay": args.auth_delay, "auth_fail_rate": args.auth_fail_rate,
+                 "connect_fail_rate": args.connect_fail_rate, "drop_rate": args.drop_rate, "rtt": args.rtt}
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+    if args.fleet:
+        devices = fakedev.read_fleet_csv(args.fleet)
+        sizes = sorted({min(size, len(devices)) for size in sizes})
+    else:
+        devices = fakedev.fleet_devices(sizes[-1], port=args.port, device_type=args.device_type, cmdfile=args.cmdfile, behaviour=behaviour)
+    for device in devices:
+        device["port"] = int(device["port"])
+    baseline = load_baseline(args.baseline) if args.baseline else {}
+    fleet_procs = args.fleet_procs or max(1, min(os.cpu_count() or 1, math.ceil(sizes[-1] / 1000)))
+
+    workdir = tempfile.mkdtemp(prefix="pyshcmd_bench_")
+    fleet_csv = os.path.join(workdir, "fleet.csv")
+    fakedev.write_fleet_csv(fleet_csv, devices[:sizes[-1]])
+    fleet = start_fleet(devices[:sizes[-1]], fleet_csv, fleet_procs, args.lines, args.seed, args.aaa_capacity)
+    results = []
+    try:
+        print(f"{'Target':<13} {'Devices':>8} {'Concurrency':>12} {'Success':>8} {'Wall(s)':>10} {'Dev/s':>10} {'PeakRSS(MB)':>12} {'Threads':>8} {'vs base':>8}", flush=True)
+        for size in sizes:
+            for target in targets:
+                concurrency = args.sessions if TARGETS[target][1] == "async" else args.workers
+                result = run_isolated(target, devices[:size], concurrency, workdir, args.csvs, args.save_json, args.verbose, args.pipeline)
+                results.append(result)
+                base = baseline.get((target, size, concurrency))
+                change = f"{(result['devices_per_sec'] / base['devices_per_sec'] - 1) * 100:+.0f}%" if base and base["devices_per_sec"] else "-"
+                rss = result["peak_rss_mb"] if result["peak_rss_mb"] is not None else "-"
+                print(f"{target:<13} {size:>8} {concurrency:>12} {result['success']:>8} {result['wall']:>10.2f} {result['devices_per_sec']:>10.1f} "
+                      f"{rss:>12} {result['peak_threads']:>8} {change:>8}", flush=True)
+    finally:
+        stop_fleet(fleet)
+        shutil.rmtree(workdir, ignore_errors=True)
+    fleet_info = dict(behaviour, source=args.fleet or "generated", device_type=args.device_type, lines=args.lines,
+                      processes=fleet_procs, seed=args.seed, aaa_capacity=args.aaa_capacity)
+    if results:
+        save_results(results, fleet_info, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+import asyncio
+import os
+import re
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+from netmiko.exceptions import ReadTimeout
+version = '20261016'
+# Streaming capture of command output with spill files and a size cap (20261016)
+
+MB = 1024 * 1024
+DEFAULT_SPILL_MB = 1.0
+DEFAULT_CAP_MB = 64.0
+# Seconds without new data before a command times out; a long output keeps the read alive as long as it flows
+READ_TIMEOUT = 10.0
+READ_CHUNK = 65536
+LOOP_DELAY = 0.01
+PROMPT_TERMINATORS = "#>$%]"
+NEWLINE_PATTERN = re.compile("(\r\r\r\n|\r\r\n|\r\n|\n\r)")
+# A line longer than this is written out before its end is seen, only its tail is kept to match the prompt
+MAX_PENDING = 65536
+PROMPT_TAIL = 1024
+REFERENCE_PREFIX = "file://"
+
+# file:// URI of a spilled output's file; a str, so results, JSON and JSONL carry it like any output, but its own type
+# so a device output that happens to start with file:// is never taken for one
+class Reference(str):
+    pass
+
+# A spilled output appears in results, JSON and JSONL as the file:// URI of its file
+def reference(path):
+    return Reference(Path(os.path.abspath(path)).as_uri())
+
+def is_reference(output):
+    return isinstance(output, Reference)
+
+# A spilled output read back from a JSON or JSONL output (--resume), where only the file:// string is left: a
+# reference again when that file exists
+def restore_reference(output):
+    if isinstance(output, str) and output.startswith(REFERENCE_PREFIX) and os.path.isfile(reference_path(output)):
+        return Reference(output)
+    return output
+
+def reference_path(output):
+    return url2pathname(urlparse(output).path)
+
+# Characters of an output, read from the file for a spilled one
+def output_size(output):
+    if is_reference(output):
+        try:
+            return os.path.getsize(reference_path(output))
+        except OSError:
+            return 0
+    return len(output)
+
+# Prompt line of the session, matched on the leading part like Netmiko and the async engine do
+def prompt_pattern(base_prompt):
+    return re.compile(rf"^{re.escape(base_prompt[:16])}.*[{re.escape(PROMPT_TERMINATORS)}]\s*$")
+
+# One command's cleaned output: in memory up to spill characters, then in spill_path; beyond cap characters
+# the rest is read and dropped so the session stays in step, and a truncation marker is appended
+class CaptureBuffer:
+    def __init__(self, spill_path, spill, cap):
+        self.spill_path = spill_path
+        self.spill = min(spill, cap)
+        self.cap = cap
+        self.parts = []
+        self.size = 0
+        self.seen = 0
+        self.file = None
+
+    def write(self, text):
+        self.seen += len(text)
+        text = text[:self.cap - self.size]
+        if not text:
+            return
+        self.size += len(text)
+        if self.file is None and self.size > self.spill:
+            os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+            self.file = open(self.spill_path, "w", encoding="utf-8", newline="")
+            self.file.write("".join(self.parts))
+            self.parts = []
+        if self.file is not None:
+            self.file.write(text)
+        else:
+            self.parts.append(text)
+
+    # The output, or the reference to its file once it went over the spill size
+    def finish(self):
+        marker = f"\n##### OUTPUT TRUNCATED AT {self.cap} OF {self.seen} CHARACTERS\n" if self.seen > self.cap else ""
+        if self.file is None:
+            return "".join(self.parts) + marker
+        self.file.write(marker)
+        self.file.close()
+        self.file = None
+        return reference(self.spill_path)
+
+    # A failed read leaves no partial file behind
+    def abort(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            try:
+                os.remove(self.spill_path)
+            except OSError:
+                pass
+        self.parts = []
+
+# Turns raw channel chunks into what Netmiko's send_command returns (linefeeds normalized, echo line and prompt line
+# stripped) without holding the output: complete lines go to the buffer, the last partial line is kept to spot the prompt
+class OutputStream:
+    def __init__(self, command, pattern, buffer):
+        self.echo = command.strip()
+        self.pattern = pattern
+        self.buffer = buffer
+        self.started = not self.echo
+        self.pending = ""
+
+    # True once the prompt ends the output
+    def feed(self, chunk):
+        self.pending += chunk.replace("\x08", "")
+        if not self.started:
+            # Anything before the echo of our command is left over from earlier (Netmiko cmd_verify)
+            start = self.pending.find(self.echo)
+            if start < 0:
+                self.pending = self.pending[-len(self.echo):]
+                return False
+            end = self.pending.find("\n", start)
+            if end < 0:
+                self.pending = self.pending[start:]
+                return False
+            self.pending = self.pending[end + 1:]
+            self.started = True
+        # Trailing \r and \n are normalized once the next character is known, a \r\n may be split over two chunks
+        split = len(self.pending.rstrip("\r\n"))
+        body, rest = self.pending[:split], self.pending[split:]
+        body = NEWLINE_PATTERN.sub("\n", body).replace("\r", "\n")
+        # The newline before the last line stays pending, so the one before the prompt is never written
+        cut = body.rfind("\n")
+        if cut > 0:
+            self.buffer.write(body[:cut])
+            body = body[cut:]
+        elif len(body) > MAX_PENDING:
+            self.buffer.write(body[:-PROMPT_TAIL])
+            body = body[-PROMPT_TAIL:]
+        self.pending = body + rest
+        if not rest and self.pattern.search(body.lstrip("\n")):
+            self.pending = ""
+            return True
+        return False
+
+# Netmiko counterpart of send_command for --capture: read_channel in chunks until the prompt, straight into buffer
+def send_command(ssh, command, buffer, read_timeout=READ_TIMEOUT):
+    stream = OutputStream(command, prompt_pattern(ssh.base_prompt), buffer)
+    try:
+        ssh.write_channel(ssh.normalize_cmd(command))
+        deadline = time.time() + read_timeout
+        while True:
+            data = ssh.read_channel()
+            if data:
+                if stream.feed(data):
+                    return buffer.finish()
+                deadline = time.time() + read_timeout
+            elif getattr(ssh.remote_conn, "closed", False):
+                raise ConnectionResetError(f"Session closed by {ssh.host}")
+            elif time.time() > deadline:
+                raise ReadTimeout(f"Prompt not detected in output of '{command}' within {read_timeout:g}s of the last data")
+            else:
+                time.sleep(LOOP_DELAY)
+    except BaseException:
+        buffer.abort()
+        raise
+
+# asyncssh counterpart, for AsyncSession.capture_command
+async def read_command(stdout, command, base_prompt, buffer, read_timeout=READ_TIMEOUT):
+    stream = OutputStream(command, prompt_pattern(base_prompt), buffer)
+    try:
+        while True:
+            chunk = await asyncio.wait_for(stdout.read(READ_CHUNK), timeout=read_timeout)
+            if not chunk:
+                raise ConnectionResetError("Channel closed")
+            if stream.feed(chunk):
+                return buffer.finish()
+    except BaseException:
+        buffer.abort()
+        raise
+
+# Capture settings of a run; spill files go to one directory, named after the device and the command
+class Capture:
+    def __init__(self, directory, spill_mb=DEFAULT_SPILL_MB, cap_mb=DEFAULT_CAP_MB):
+        self.directory = directory
+        self.spill = int(spill_mb * MB)
+        self.cap = int(cap_mb * MB)
+
+    def buffer(self, hostname, index, command):
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", command.strip())[:60].strip("_")
+        return CaptureBuffer(os.path.join(self.directory, f"{hostname}_{index:02d}_{slug}.txt"), self.spill, self.cap)
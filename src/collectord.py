@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import logging
+import logging.config
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+import pyshcmd as pyshcmd
+import jumphost
+from session_pool import SessionPool, DEFAULT_IDLE_TIMEOUT, DEFAULT_MAX_IDLE, DEFAULT_HEALTH_INTERVAL
+version = '20261016'
+# Collector daemon running pyshcmd jobs on a pool of open sessions (20261016)
+
+PARENT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+CONFIG_DIR = os.path.join(PARENT_DIR, 'config')
+LOG_DIR = os.path.join(PARENT_DIR, 'log')
+DATETIME = datetime.now().strftime("%Y%m%d_%H%M%S")
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8650
+# Finished jobs kept for GET /jobs
+JOB_HISTORY = 200
+
+# Configure logging using JSON configuration; jobs log here too
+def setup_logging(verbose=False):
+    log_name = Path(os.path.basename(__file__)).stem
+    log_config_path = os.path.join(CONFIG_DIR, "logging.dev.json")
+    log_file_path = os.path.join(LOG_DIR, f'{log_name}_{DATETIME}.log')
+    os.makedirs(LOG_DIR, exist_ok=True)
+
+    with open(log_config_path, 'r') as f:
+        config = json.load(f)
+
+    for handler in config['handlers'].values():
+        if handler['class'] == 'logging.FileHandler':
+            handler['filename'] = log_file_path
+
+    if verbose:
+        config['handlers']['console']['level'] = 'DEBUG'
+
+    logging.config.dictConfig(config)
+    return logging.getLogger(__name__)
+
+# pyshcmd.py arguments of a job, with the CLI's defaults; raises ValueError instead of exiting the daemon
+def parse_job_args(argv):
+    parser = pyshcmd.build_parser()
+
+    def fail(message):
+        raise ValueError(message)
+
+    parser.error = fail
+    if not isinstance(argv, list) or not all(isinstance(arg, str) for arg in argv):
+        raise ValueError("args must be a list of strings")
+    if any(arg in ("-h", "--help") for arg in argv):
+        raise ValueError("help is not available for jobs, see pyshcmd.py -h")
+    args = parser.parse_args(argv)
+    if args.engine != "thread":
+        raise ValueError("pooled sessions are Netmiko sessions, jobs run with -e thread")
+    return args
+
+class Job:
+    def __init__(self, job_id, argv, args):
+        self.id = job_id
+        self.argv = argv
+        self.args = args
+        self.state = "queued"
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.run_id = None
+        self.report = None
+        self.sessions = None
+        self.error = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        return {"id": self.id, "args": self.argv, "state": self.state, "run_id": self.run_id, "report": self.report,
+                "sessions": self.sessions, "error": self.error,
+                "submitted": datetime.fromtimestamp(self.submitted).isoformat(timespec="seconds"),
+                "duration": round(self.finished - self.started, 3) if self.finished else None}
+
+# Runs jobs one at a time on the session pool, so two jobs never wait on the same device session
+class Collector:
+    def __init__(self, pool):
+        self.pool = pool
+        self.queue = queue.Queue()
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.next_id = 1
+        self.last_run_id = None
+        self.worker = threading.Thread(target=self._work, name="collector", daemon=True)
+
+    def start(self):
+        self.worker.start()
+        return self
+
+    def submit(self, argv):
+        args = parse_job_args(argv)
+        with self.lock:
+            job = Job(self.next_id, argv, args)
+            self.next_id += 1
+            self.jobs[job.id] = job
+            while len(self.jobs) > JOB_HISTORY and next(iter(self.jobs.values())).done.is_set():
+                self.jobs.popitem(last=False)
+        self.queue.put(job)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    # Run ids name every output file, two jobs in the same second would overwrite each other
+    def _run_id(self):
+        run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        while run_id == self.last_run_id:
+            time.sleep(0.1)
+            run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.last_run_id = run_id
+        return run_id
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            self.run(job)
+
+    def run(self, job):
+        logger = logging.getLogger(__name__)
+        job.state = "running"
+        job.started = time.time()
+        job.run_id = job.args.resume or self._run_id()
+        pyshcmd.DATETIME = job.run_id
+        before = self.pool.stats()
+        logger.info(f"Job {job.id} started as run {job.run_id}: pyshcmd.py {' '.join(job.argv)}")
+        try:
+            pyshcmd.main(job.args, sessions=self.pool)
+            job.state = "done"
+        except SystemExit:
+            # pyshcmd exits on invalid CSV rows and missing files, the reason is in the log
+            job.state = "failed"
+            job.error = "rejected by pyshcmd, see the daemon log"
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {str(e)}")
+            job.state = "failed"
+            job.error = str(e)
+        finally:
+            job.finished = time.time()
+            after = self.pool.stats()
+            job.sessions = {"reused": after["reused"] - before["reused"], "opened": after["opened"] - before["opened"]}
+            outname = job.args.outname if job.args.outname is not None else Path(job.args.input).stem
+            report = os.path.join(pyshcmd.REPORT_DIR_FULL, f"report_{outname}_{job.run_id}.txt")
+            job.report = report if os.path.exists(report) else None
+            logger.info(f"Job {job.id} {job.state} in {job.finished - job.started:.1f}s: {job.sessions['reused']} sessions reused, "
+                        f"{job.sessions['opened']} opened, {after['idle']} in the pool")
+            job.done.set()
+
+    # Jobs still queued are cancelled, the running one finishes
+    def close(self):
+        while True:
+            try:
+                job = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            job.state = "cancelled"
+            job.done.set()
+        self.queue.put(None)
+        self.worker.join()
+
+class CollectorHandler(BaseHTTPRequestHandler):
+    server_version = f"collectord/{version}"
+
+    def _send(self, status, body):
+        data = json.dumps(body, indent=4).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        collector = self.server.collector
+        path = urlparse(self.path).path.rstrip("/")
+        if path == "/jobs":
+            self._send(200, [job.to_dict() for job in collector.list()])
+        elif path.startswith("/jobs/") and path[len("/jobs/"):].isdigit():
+            job = collector.get(int(path[len("/jobs/"):]))
+            if job is None:
+                self._send(404, {"error": "no such job"})
+            else:
+                self._send(200, job.to_dict())
+        elif path == "/sessions":
+            self._send(200, collector.pool.stats())
+        else:
+            self._send(404, {"error": "not found"})
+
+    # POST /jobs {"args": ["-i", "devices2.csv", "-json"]}; ?wait=1 answers once the job has finished
+    def do_POST(self):
+        collector = self.server.collector
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/jobs":
+            self._send(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            job = collector.submit(body.get("args") if isinstance(body, dict) else None)
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+            return
+        if parse_qs(url.query).get("wait", ["0"])[0] not in ("", "0"):
+            job.done.wait()
+            self._send(200, job.to_dict())
+        else:
+            self._send(202, job.to_dict())
+
+    def log_message(self, format, *args):
+        logging.getLogger(__name__).debug(f"{self.address_string()} {format % args}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Collector daemon: run pyshcmd jobs on a pool of open device sessions, submitted over a local HTTP API")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"Address to listen on (default: {DEFAULT_HOST}, local only)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"HTTP port (default: {DEFAULT_PORT})")
+    parser.add_argument("--idle-timeout", type=float, default=DEFAULT_IDLE_TIMEOUT,
+                        help=f"Seconds an unused session stays open; keep it below the devices' exec-timeout (default: {DEFAULT_IDLE_TIMEOUT:g})")
+    parser.add_argument("--max-idle", type=int, default=DEFAULT_MAX_IDLE,
+                        help=f"Most sessions kept open, the least recently used are closed beyond it (default: {DEFAULT_MAX_IDLE})")
+    parser.add_argument("--health-interval", type=float, default=DEFAULT_HEALTH_INTERVAL,
+                        help=f"Seconds between health checks of the idle sessions (default: {DEFAULT_HEALTH_INTERVAL:g})")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Enable debug logging for console")
+    args = parser.parse_args()
+
+    logger = setup_logging(verbose=args.verbose)
+    pool = SessionPool(args.idle_timeout, args.max_idle, args.health_interval).start()
+    # Pooled sessions behind a jump host are channels of its transports, which stay open until the daemon stops;
+    # an idle one gives its channel back when a device finds every channel in use
+    jumphost.open_run()
+    jumphost.set_reclaim(pool.evict_behind)
+    collector = Collector(pool).start()
+    try:
+        server = ThreadingHTTPServer((args.host, args.port), CollectorHandler)
+    except OSError as e:
+        logger.error(f"Cannot listen on {args.host}:{args.port}: {str(e)}")
+        pool.close()
+        sys.exit(1)
+    server.collector = collector
+    # SIGTERM stops like Ctrl-C: the running job finishes, then every pooled session is closed
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    logger.info(f"Collector daemon listening on http://{args.host}:{args.port}, sessions idle up to {args.idle_timeout:g}s, "
+                f"at most {args.max_idle} kept")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    logger.info("Collector daemon stopping")
+    server.server_close()
+    collector.close()
+    pool.close()
+    jumphost.close_run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+import logging
+from store import output_hash, list_runs, manifest_path, load_manifest
+from capture import is_reference
+version = '20261016'
+# Conditional collection with [probe] commands compared to the previous run (20261016)
+
+# Statuses whose manifest record holds an output hash for every command
+COLLECTED = ("Success", "Unchanged")
+
+def is_probe(command):
+    return getattr(command, "probe", False)
+
+# Probe lines only run with --conditional, other runs keep their usual outputs
+def without_probes(commands):
+    if not any(is_probe(command) for command in commands):
+        return commands
+    return tuple(command for command in commands if not is_probe(command))
+
+# Device records of the latest stored run of a batch before run_id
+def previous_records(store_root, batch, run_id):
+    logger = logging.getLogger(__name__)
+    runs = [run for run in list_runs(store_root, batch) if run < run_id]
+    if not runs:
+        logger.info(f"No earlier run of {batch} in the output store, every device is collected in full")
+        return {}
+    logger.info(f"Conditional collection of {batch} against run {runs[-1]}")
+    return load_manifest(manifest_path(store_root, batch, runs[-1]))
+
+# The probe answered as in the previous run, and that run has a good output for every command of the device
+def probe_unchanged(record, command, output, commands):
+    if not record or is_reference(output) or record.get("connection") not in COLLECTED or record.get("failed"):
+        return False
+    outputs = record.get("outputs", {})
+    return outputs.get(command) == output_hash(output) and all(c in outputs for c in commands)
+
+# Hashes of the previous outputs for the commands an unchanged device skipped, written to the new manifest
+def link_outputs(record, commands, outputs):
+    return {"since": record.get("since"), "outputs": {c: record["outputs"][c] for c in commands if c not in outputs}}
+
+# What the JSON output and text file hold for each command an unchanged device skipped: the store object with
+# its output and the run that collected it
+def linked_outputs(links):
+    return {command: f"Unchanged since {links['since']}: store object {digest}" for command, digest in links["outputs"].items()}
+
+# run_batch: a merged device keeps a probe only if every CSV it is collected for runs it, it can never be
+# unchanged for the others; the probe is dropped as without --conditional
+def shared_probes(commands, member_commands):
+    return tuple(command for command in commands if not is_probe(command) or all(command in member for member in member_commands))
+
+# Decides per device whether the rest of the commands can be skipped; shared by all workers of a run
+class ConditionalCollection:
+    def __init__(self, previous):
+        self.previous = previous
+        self.matched = {}
+
+    def unchanged(self, ip, command, output, commands):
+        if not is_probe(command):
+            return False
+        record = self.previous.get(ip)
+        if probe_unchanged(record, command, output, commands):
+            self.matched[ip] = (record, commands)
+            return True
+        return False
+
+    # Read by the worker for the text file and by the main thread for the sink and journal
+    def links(self, ip, outputs):
+        record, commands = self.matched[ip]
+        return link_outputs(record, commands, outputs)
+
+# run_batch: a merged device is unchanged only if it is unchanged for every CSV it is collected for;
+# members maps ip to [(previous record of that CSV, that CSV's commands), ...]
+class BatchConditional(ConditionalCollection):
+    def __init__(self, members):
+        super().__init__({})
+        self.members = members
+
+    def unchanged(self, ip, command, output, commands):
+        if not is_probe(command):
+            return False
+        members = self.members.get(ip)
+        return bool(members) and all(probe_unchanged(record, command, output, member_commands) for record, member_commands in members)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+import json
+import logging
+import os
+import threading
+import time
+version = '20261016'
+# Persistent cache of autodetected device types (20261016)
+
+PARENT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+CACHE_DIR = 'cache'
+CACHE_DIR_FULL = os.path.join(PARENT_DIR, CACHE_DIR)
+CACHE_FILE = 'detect_cache.json'
+DEFAULT_TTL_HOURS = 168
+
+# One instance per cache file so parallel CSVs in run_batch share entries and the file lock
+_instances = {}
+_instances_lock = threading.Lock()
+
+# Device type cache stored as {"ip:port": {"device_type": ..., "detected_at": epoch}}
+class DetectCache:
+    def __init__(self, path, ttl_hours=DEFAULT_TTL_HOURS, refresh=False):
+        self.path = path
+        self.ttl = ttl_hours * 3600
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.removed = set()
+        self.dirty = False
+        self.load()
+
+    @classmethod
+    def open(cls, path=None, ttl_hours=DEFAULT_TTL_HOURS, refresh=False):
+        path = path or os.path.join(CACHE_DIR_FULL, CACHE_FILE)
+        with _instances_lock:
+            cache = _instances.get(path)
+            if cache is None:
+                cache = _instances[path] = cls(path, ttl_hours, refresh)
+            cache.ttl = ttl_hours * 3600
+            cache.refresh = refresh
+            return cache
+
+    @staticmethod
+    def key(ip, port):
+        return f"{ip}:{port}"
+
+    def _read_file(self):
+        logger = logging.getLogger(__name__)
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable detect cache {self.path}: {str(e)}")
+            return {}
+
+    def load(self):
+        with self.lock:
+            self.entries = self._read_file()
+
+    # Cached device type, or None when missing, older than the TTL or refresh was requested
+    def get(self, ip, port):
+        if self.refresh:
+            return None
+        with self.lock:
+            entry = self.entries.get(self.key(ip, port))
+        if not entry:
+            return None
+        if time.time() - entry.get("detected_at", 0) > self.ttl:
+            return None
+        return entry.get("device_type")
+
+    def set(self, ip, port, device_type):
+        with self.lock:
+            self.entries[self.key(ip, port)] = {"device_type": device_type, "detected_at": time.time()}
+            self.removed.discard(self.key(ip, port))
+            self.dirty = True
+
+    def invalidate(self, ip, port):
+        with self.lock:
+            self.entries.pop(self.key(ip, port), None)
+            self.removed.add(self.key(ip, port))
+            self.dirty = True
+
+    # Merge with what is on disk (another run may have written since we loaded) and replace atomically
+    def save(self):
+        logger = logging.getLogger(__name__)
+        with self.lock:
+            if not self.dirty:
+                return
+            merged = self._read_file()
+            for key in self.removed:
+                merged.pop(key, None)
+            for key, entry in self.entries.items():
+                if entry.get("detected_at", 0) >= merged.get(key, {}).get("detected_at", 0):
+                    merged[key] = entry
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(tmp_path, "w") as f:
+                    json.dump(merged, f, indent=4, sort_keys=True)
+                os.replace(tmp_path, self.path)
+                self.entries = merged
+                self.removed.clear()
+                self.dirty = False
+                logger.debug(f"Detect cache saved to {self.path} ({len(merged)} entries)")
+            except OSError as e:
+                logger.error(f"Error saving detect cache to {self.path}: {str(e)}")
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+import heapq
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+version = '20261016'
+# Per-device duration history for longest-first device ordering (20261016)
+
+PARENT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+CACHE_DIR = 'cache'
+CACHE_DIR_FULL = os.path.join(PARENT_DIR, CACHE_DIR)
+HISTORY_FILE = 'duration_history.json'
+# Durations kept per device; the estimate is their median, so one slow run (retries, busy device) does not move it much
+HISTORY_SIZE = 5
+# Devices not collected for this long are dropped from the file on save
+HISTORY_TTL_DAYS = 30
+# Estimate of a device when neither it, its cmdfile nor its device type has any history
+DEFAULT_ESTIMATE = 10.0
+ORDERS = ["longest", "csv"]
+
+# One instance per history file so parallel CSVs in run_batch --per-csv share entries and the file lock
+_instances = {}
+_instances_lock = threading.Lock()
+
+# cmdfile of a device; a run_batch device merged from several CSVs runs the union of its cmdfiles
+def workload_of(cmdfiles):
+    return "+".join(sorted(set(cmdfiles)))
+
+# (ip, port, workload, device type) of a CSV row; cmdfiles of a merged run_batch device replace the row's own
+def device_key(device, cmdfiles=None):
+    return (device["ip"], device["port"], workload_of(cmdfiles or [device["cmdfile"]]), device.get("device_type", ""))
+
+# Durations stored as {"ip:port:workload": {"workload": ..., "device_type": ..., "durations": [seconds, ...], "updated": epoch}}
+class DurationHistory:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.dirty = False
+        self.load()
+
+    @classmethod
+    def open(cls, path=None):
+        path = path or os.path.join(CACHE_DIR_FULL, HISTORY_FILE)
+        with _instances_lock:
+            history = _instances.get(path)
+            if history is None:
+                history = _instances[path] = cls(path)
+            return history
+
+    @staticmethod
+    def key(ip, port, workload):
+        return f"{ip}:{port}:{workload}"
+
+    def _read_file(self):
+        logger = logging.getLogger(__name__)
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable duration history {self.path}: {str(e)}")
+            return {}
+
+    def load(self):
+        with self.lock:
+            self.entries = self._read_file()
+
+    # Service time of one device (detect, connect, login and commands, without queueing or retry backoff)
+    def record(self, ip, port, workload, device_type, seconds):
+        key = self.key(ip, port, workload)
+        with self.lock:
+            entry = self.entries.get(key) or {"durations": []}
+            durations = (entry["durations"] + [round(seconds, 3)])[-HISTORY_SIZE:]
+            self.entries[key] = {"workload": workload, "device_type": device_type or entry.get("device_type", ""), "durations": durations,
+                                 "updated": time.time()}
+            self.dirty = True
+
+    # [(seconds, source), ...] for [(ip, port, workload, device_type), ...]; source is "history" for a device
+    # seen before, else the median of the devices with the same cmdfile, then device type, then every device
+    def estimate(self, devices):
+        with self.lock:
+            entries = dict(self.entries)
+        medians = {key: statistics.median(entry["durations"]) for key, entry in entries.items() if entry.get("durations")}
+        by_workload = {}
+        by_type = {}
+        for key, seconds in medians.items():
+            by_workload.setdefault(entries[key].get("workload", ""), []).append(seconds)
+            by_type.setdefault(entries[key].get("device_type", ""), []).append(seconds)
+        overall = statistics.median(medians.values()) if medians else DEFAULT_ESTIMATE
+        estimates = []
+        for ip, port, workload, device_type in devices:
+            seconds = medians.get(self.key(ip, port, workload))
+            if seconds is not None:
+                estimates.append((seconds, "history"))
+            elif workload in by_workload:
+                estimates.append((statistics.median(by_workload[workload]), "cmdfile"))
+            elif device_type and device_type in by_type:
+                estimates.append((statistics.median(by_type[device_type]), "device type"))
+            else:
+                estimates.append((overall, "default"))
+        return estimates
+
+    # Merge with what is on disk (another run or shard may have written since we loaded), drop stale devices, replace atomically
+    def save(self):
+        logger = logging.getLogger(__name__)
+        with self.lock:
+            if not self.dirty:
+                return
+            merged = self._read_file()
+            for key, entry in self.entries.items():
+                if entry.get("updated", 0) >= merged.get(key, {}).get("updated", 0):
+                    merged[key] = entry
+            cutoff = time.time() - HISTORY_TTL_DAYS * 86400
+            merged = {key: entry for key, entry in merged.items() if entry.get("updated", 0) >= cutoff}
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(tmp_path, "w") as f:
+                    json.dump(merged, f, indent=4, sort_keys=True)
+                os.replace(tmp_path, self.path)
+                self.entries = merged
+                self.dirty = False
+                logger.debug(f"Duration history saved to {self.path} ({len(merged)} entries)")
+            except OSError as e:
+                logger.error(f"Error saving duration history to {self.path}: {str(e)}")
+
+# Record the devices of a run that completed a full collection from a fresh login. Failed devices say nothing about
+# how long a collection takes; Unchanged devices and sessions reused from the collector daemon's pool take a fraction
+# of it and would make the device look short
+def record_run(history, keys, detected_types, metrics):
+    for ip, port, workload, _ in keys:
+        entry = detected_types.get(ip)
+        if not entry or entry[3] != "Success" or not metrics.device_logged_in(ip):
+            continue
+        seconds = metrics.device_service_time(ip)
+        if seconds:
+            history.record(ip, port, workload, entry[2], seconds)
+
+# Makespan of running jobs of the given durations in this order on a pool of workers, each job going to the first free worker
+def predict_makespan(durations, workers):
+    finish = [0.0] * max(1, min(workers, len(durations)))
+    for seconds in durations:
+        heapq.heappush(finish, heapq.heappop(finish) + seconds)
+    return max(finish) if durations else 0.0
+
+# Items ordered for the run and the schedule summary for the report; "longest" starts the longest estimated jobs
+# first (LPT), so a slow device does not start last and hold the run while the other workers sit idle
+def plan_order(items, keys, history, workers, order="csv"):
+    logger = logging.getLogger(__name__)
+    estimates = history.estimate(keys)
+    seconds = [estimate for estimate, _ in estimates]
+    positions = list(range(len(items)))
+    if order == "longest":
+        # Stable, so devices with the same estimate keep their CSV order
+        positions.sort(key=lambda i: -seconds[i])
+    known = sum(1 for _, source in estimates if source == "history")
+    plan = {
+        "order": order,
+        "workers": workers,
+        "devices": len(items),
+        "known": known,
+        "predicted": predict_makespan([seconds[i] for i in positions], workers),
+        "csv_order": predict_makespan(seconds, workers),
+        "longest_first": predict_makespan(sorted(seconds, reverse=True), workers),
+        "actual": None,
+    }
+    logger.info(f"Device order {order}: {known}/{len(items)} devices with history, predicted makespan {plan['predicted']:.1f}s "
+                f"with {workers} sessions (CSV order {plan['csv_order']:.1f}s)")
+    return [items[i] for i in positions], plan
@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+import asyncio
+import logging
+import argparse
+import csv
+import glob
+import os
+import random
+import sys
+from datetime import datetime
+import asyncssh
+from pipeline import parse_command
+version = '20261016'
+# Local fake SSH network devices for testing and benchmarking (20261016)
+
+PARENT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+CONFIG_DIR_FULL = os.path.join(PARENT_DIR, 'config')
+CMD_DIR_FULL = os.path.join(PARENT_DIR, 'cmd')
+
+# Canned device behaviour, keyed by Netmiko device type; prompts are per CLI mode
+PROFILES = {
+    "cisco_ios": {
+        "modes": {"user": "{hostname}>", "enable": "{hostname}#"},
+        "start": "user",
+        "enable": "enable",
+        "shell": None,
+        "version_commands": {"user": ["show version", "sh ver"], "enable": ["show version", "sh ver"]},
+        "version": "Cisco IOS Software, C2960X Software (C2960X-UNIVERSALK9-M), Version 15.2(7)E4, RELEASE SOFTWARE (fc2)\n{hostname} uptime is 1 year, 2 weeks\n",
+        "invalid": {"user": "% Invalid input detected at '^' marker.\n", "enable": "% Invalid input detected at '^' marker.\n"},
+        "silent": ["terminal length 0", "terminal width 511", "ter len 0"],
+    },
+    "cisco_nxos": {
+        "modes": {"enable": "{hostname}#"},
+        "start": "enable",
+        "enable": "enable",
+        "shell": None,
+        "version_commands": {"enable": ["show version"]},
+        "version": "Cisco Nexus Operating System (NX-OS) Software\nTAC support: http://www.cisco.com/tac\nSoftware\n  NXOS: version 9.3(10)\nHardware\n  cisco Nexus9000 C93180YC-FX Chassis\n  Device name: {hostname}\n",
+        "invalid": {"enable": "% Invalid command at '^' marker.\n"},
+        "silent": ["terminal length 0", "terminal width 511", "ter len 0"],
+    },
+    # Logs into bash, "tmsh" enters the tmsh shell and "quit" leaves it
+    "f5_tmsh": {
+        "modes": {"bash": "[admin@{hostname}:Active:Standalone] ~ # ", "tmsh": "admin@({hostname})(cfg-sync Standalone)(Active)(/Common)(tmos)# "},
+        "start": "bash",
+        "enable": None,
+        "shell": "tmsh",
+        "version_commands": {"bash": ["cat /etc/issue"], "tmsh": ["show sys version"]},
+        "version": "Sys::Version\nMain Package\n  Product     BIG-IP\n  Version     15.1.8\n  Build       0.0.7\n  Edition     Final\n",
+        "invalid": {"bash": "-bash: {word}: command not found\n", "tmsh": "Syntax Error: \"{word}\" unknown property\n"},
+        "silent": ["modify cli preference pager disabled display-threshold 0", "run /util bash -c \"stty cols 255\""],
+    },
+}
+
+# Default cmdfile per device type for generated fleets
+CMDFILES = {
+    "cisco_ios": "cmd_cisco_ios_status.txt",
+    "cisco_nxos": "cmd_cisco_nxos_status.txt",
+    "f5_tmsh": "cmd_f5ltmgtm_status.txt",
+}
+
+# Per-device knobs, also read from optional columns of a fleet CSV; rates are per connection (auth, connect) or per command (drop)
+BEHAVIOUR = {
+    "latency": 0.0,
+    "lines": 20,
+    "auth_delay": 0.0,
+    "auth_fail_rate": 0.0,
+    "connect_fail_rate": 0.0,
+    "drop_rate": 0.0,
+    "rtt": 0.0,
+}
+
+# Every command found in cmd/*.txt gets an answer, anything else is rejected like on a real device
+def load_known_commands(cmd_dir=CMD_DIR_FULL):
+    commands = set()
+    for path in glob.glob(os.path.join(cmd_dir, "*.txt")):
+        with open(path, "r") as f:
+            commands.update(str(parse_command(line.strip())) for line in f if line.strip() and not line.strip().startswith("#"))
+    return commands
+
+KNOWN_COMMANDS = load_known_commands()
+
+# Build the output for one command; known commands return a deterministic block of text
+def command_output(profile, mode, hostname, command, output_lines):
+    if command in profile["version_commands"][mode]:
+        return profile["version"].format(hostname=hostname)
+    if command in profile["silent"]:
+        return ""
+    if command == "show running-config | include hostname":
+        return f"hostname {hostname}\n"
+    if command in KNOWN_COMMANDS:
+        return "".join(f"{hostname} {command} line {i:04d}\n" for i in range(output_lines))
+    return profile["invalid"][mode].format(word=command.split()[0])
+
+# One TACACS/RADIUS server shared by the whole fleet: at most capacity logins are checked at once, each taking
+# auth_delay; a login still queued after timeout seconds gets its connection reset, like a device giving up on AAA
+class FakeAAA:
+    def __init__(self, capacity, timeout=5.0):
+        self.capacity = capacity
+        self.timeout = timeout
+        self.semaphore = None
+
+    async def authenticate(self, delay):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.capacity)
+        await asyncio.wait_for(self.semaphore.acquire(), self.timeout)
+        try:
+            if delay:
+                await asyncio.sleep(delay)
+        finally:
+            self.semaphore.release()
+
+# Unlimited unless --aaa-capacity is set
+AAA = None
+
+# Accept any username with the configured password, optionally after a delay or with injected failures
+class FakeDeviceServer(asyncssh.SSHServer):
+    def __init__(self, password, behaviour, rng):
+        self.password = password
+        self.behaviour = behaviour
+        self.rng = rng
+        self.conn = None
+
+    def connection_made(self, conn):
+        self.conn = conn
+        # Emulates a reset during the SSH handshake
+        if self.rng.random() < self.behaviour["connect_fail_rate"]:
+            asyncio.get_running_loop().call_soon(conn.abort)
+
+    def begin_auth(self, username):
+        return True
+
+    def password_auth_supported(self):
+        return True
+
+    async def validate_password(self, username, password):
+        if AAA:
+            try:
+                await AAA.authenticate(self.behaviour["auth_delay"])
+            except asyncio.TimeoutError:
+                self.conn.abort()
+                return False
+        elif self.behaviour["auth_delay"]:
+            await asyncio.sleep(self.behaviour["auth_delay"])
+        if self.rng.random() < self.behaviour["auth_fail_rate"]:
+            return False
+        return password == self.password
+
+# Jump host that forwards every direct-tcpip channel; prints each transport so a run shows how many key exchanges it cost
+class FakeBastionServer(asyncssh.SSHServer):
+    transports = 0
+    channels = 0
+
+    def __init__(self, password):
+        self.password = password
+        self.channels = 0
+
+    def connection_made(self, conn):
+        FakeBastionServer.transports += 1
+        self.number = FakeBastionServer.transports
+        print(f"{datetime.now().strftime('%H:%M:%S')} Bastion transport {self.number} from {conn.get_extra_info('peername')[0]}", flush=True)
+
+    def connection_lost(self, exc):
+        print(f"{datetime.now().strftime('%H:%M:%S')} Bastion transport {self.number} closed after {self.channels} channels "
+              f"({FakeBastionServer.channels} channels over {FakeBastionServer.transports} transports in total)", flush=True)
+
+    def begin_auth(self, username):
+        return True
+
+    def password_auth_supported(self):
+        return True
+
+    def validate_password(self, username, password):
+        return password == self.password
+
+    def connection_requested(self, dest_host, dest_port, orig_host, orig_port):
+        self.channels += 1
+        FakeBastionServer.channels += 1
+        return True
+
+async def start_bastion(port, password="password", host="127.0.0.1"):
+    return await asyncssh.create_server(lambda: FakeBastionServer(password), host, port,
+                                        server_host_keys=[asyncssh.generate_private_key("ssh-ed25519")])
+
+# Emulated WAN link: everything is delivered rtt/2 late in each direction and in order, so lines
+# typed ahead travel together while one command at a time costs a full round trip
+class DelayedLink:
+    def __init__(self, process, delay):
+        self.process = process
+        self.delay = delay
+        self.lines = asyncio.Queue()
+        self.output = asyncio.Queue()
+        self.tasks = [asyncio.create_task(self._read()), asyncio.create_task(self._write())]
+
+    async def _read(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            line = await self.process.stdin.readline()
+            await self.lines.put((loop.time() + self.delay, line))
+            if not line:
+                break
+
+    async def _write(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            due, data = await self.output.get()
+            await asyncio.sleep(max(0.0, due - loop.time()))
+            self.process.stdout.write(data)
+            self.output.task_done()
+
+    async def readline(self):
+        due, line = await self.lines.get()
+        await asyncio.sleep(max(0.0, due - asyncio.get_running_loop().time()))
+        return line
+
+    def write(self, data):
+        self.output.put_nowait((asyncio.get_running_loop().time() + self.delay, data))
+
+    def abort(self):
+        for task in self.tasks:
+            task.cancel()
+
+    # Let pending output reach the client before the session ends
+    async def close(self):
+        drained = asyncio.ensure_future(self.output.join())
+        await asyncio.wait([drained, self.tasks[1]], return_when=asyncio.FIRST_COMPLETED)
+        drained.cancel()
+        self.abort()
+
+# One interactive CLI session
+async def handle_session(process, hostname, profile, behaviour, enable_secret, rng):
+    mode = profile["start"]
+    # Echo each line when the CLI reads it, not when it arrives, so typed-ahead commands interleave with prompts like on a real device
+    process.channel.set_echo(False)
+    link = DelayedLink(process, behaviour["rtt"] / 2) if behaviour["rtt"] else None
+    readline = link.readline if link else process.stdin.readline
+    write = link.write if link else process.stdout.write
+    try:
+        write(f"\r\n{profile['modes'][mode].format(hostname=hostname)}")
+        while True:
+            line = await readline()
+            if not line:
+                break
+            line = line.replace("\x00", "")
+            write(line.rstrip("\r\n") + "\r\n")
+            command = line.strip()
+            if command in ("exit", "logout") or (command == "quit" and mode != profile["shell"]):
+                break
+            if command == "quit":
+                mode = profile["start"]
+            elif profile["shell"] and command == profile["shell"]:
+                mode = profile["shell"]
+            elif command == "enable" and profile["enable"] and mode != profile["enable"]:
+                write("Password: ")
+                secret = (await readline()).strip()
+                write("\r\n")
+                if secret == enable_secret:
+                    mode = profile["enable"]
+                else:
+                    write("% Access denied\r\n")
+            elif command:
+                if behaviour["latency"]:
+                    await asyncio.sleep(behaviour["latency"])
+                # Emulates a device dropping the session in the middle of the command list
+                if rng.random() < behaviour["drop_rate"]:
+                    if link:
+                        link.abort()
+                    process.channel.get_extra_info("connection").abort()
+                    return
+                output = command_output(profile, mode, hostname, command, behaviour["lines"])
+                write(output.replace("\n", "\r\n"))
+            write(profile["modes"][mode].format(hostname=hostname))
+    except (asyncssh.BreakReceived, asyncssh.TerminalSizeChanged, asyncssh.ConnectionLost):
+        pass
+    finally:
+        if link:
+            await link.close()
+        process.exit(0)
+
+# Start one fake device listening on host:port
+async def start_device(host, port, hostname, device_type="cisco_ios", password="password", enable_secret="", output_lines=20, host_key=None,
+                       behaviour_overrides=None, seed=0):
+    profile = PROFILES[device_type]
+    behaviour = dict(BEHAVIOUR, lines=output_lines)
+    behaviour.update(behaviour_overrides or {})
+    # Seeded per device so failure patterns repeat from run to run
+    rng = random.Random(f"{seed}:{host}:{port}")
+    return await asyncssh.create_server(
+        lambda: FakeDeviceServer(password, behaviour, rng), host, port,
+        server_host_keys=[host_key or asyncssh.generate_private_key("ssh-ed25519")],
+        process_factory=lambda process: handle_session(process, hostname, profile, behaviour, enable_secret, rng),
+        line_editor=True,
+    )
+
+# pyshcmd keys results by IP, so every fake device listens on its own loopback address (127.1.0.1, 127.1.0.2, ...)
+def fleet_ip(index):
+    return f"127.1.{index // 254}.{index % 254 + 1}"
+
+# Knob values of a fleet CSV row, empty or missing columns fall back to defaults
+def row_behaviour(row, defaults=None):
+    behaviour = dict(BEHAVIOUR, **(defaults or {}))
+    for field, default in BEHAVIOUR.items():
+        value = row.get(field)
+        if value not in (None, ""):
+            behaviour[field] = type(default)(value)
+    return behaviour
+
+# Start one listener per device row (pyshcmd CSV format plus optional behaviour columns), sharing one host key
+async def start_devices(devices, defaults=None, seed=0):
+    host_key = asyncssh.generate_private_key("ssh-ed25519")
+    servers = []
+    for device in devices:
+        servers.append(await start_device(device["ip"], int(device["port"]), device["hostname"], device_type=device["device_type"] or "cisco_ios",
+                                          host_key=host_key, behaviour_overrides=row_behaviour(device, defaults), seed=seed))
+    return servers
+
+# Start count devices sharing one port and host key
+async def start_fleet(count, port=10022, device_type="cisco_ios", output_lines=20, start=0, behaviour=None, seed=0):
+    devices = fleet_devices(count, port, device_type, start=start)
+    return await start_devices(devices, dict(behaviour or {}, lines=output_lines), seed)
+
+# Device rows in pyshcmd CSV format for a fleet started with start_fleet; a comma separated
+# device_type is assigned round-robin, cmdfile defaults to the device type's entry in CMDFILES
+def fleet_devices(count, port=10022, device_type="cisco_ios", cmdfile=None, start=0, behaviour=None):
+    device_types = device_type.split(",")
+    devices = []
+    for i in range(start, start + count):
+        row_type = device_types[i % len(device_types)]
+        device = {
+            "username": "admin",
+            "password": "password",
+            "hostname": f"fake{i:05d}",
+            "ip": fleet_ip(i),
+            "port": port,
+            "cmdfile": cmdfile or CMDFILES[row_type],
+            "device_type": row_type
+        }
+        device.update(behaviour or {})
+        devices.append(device)
+    return devices
+
+def write_fleet_csv(csv_file, devices, config_dir=None):
+    with open(os.path.join(config_dir or CONFIG_DIR_FULL, csv_file), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(devices[0]))
+        writer.writeheader()
+        writer.writerows(devices)
+
+def read_fleet_csv(csv_file):
+    with open(os.path.join(CONFIG_DIR_FULL, csv_file), newline="") as f:
+        return list(csv.DictReader(f))
+
+def cli_behaviour(args):
+    return {"latency": args.latency, "auth_delay": args.auth_delay, "auth_fail_rate": args.auth_fail_rate,
+            "connect_fail_rate": args.connect_fail_rate, "drop_rate": args.drop_rate, "rtt": args.rtt}
+
+async def serve(args):
+    defaults = dict(cli_behaviour(args), lines=args.lines)
+    if args.fleet:
+        devices = read_fleet_csv(args.fleet)[args.start:args.start + args.count if args.count else None]
+    else:
+        devices = fleet_devices(args.count or 10, args.port, args.device_type, start=args.start)
+    servers = await start_devices(devices, defaults, args.seed)
+    if args.bastion:
+        await start_bastion(args.bastion)
+        print(f"{datetime.now().strftime('%H:%M:%S')} Bastion listening on 127.0.0.1 port {args.bastion}, password 'password'", flush=True)
+    types = ",".join(sorted({device["device_type"] or "cisco_ios" for device in devices}))
+    print(f"{datetime.now().strftime('%H:%M:%S')} Serving {len(servers)} fake {types} devices on {devices[0]['ip']}-{devices[-1]['ip']} port {devices[0]['port']}", flush=True)
+    await asyncio.Event().wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run local fake SSH network devices for testing pyshcmd")
+    parser.add_argument("-n", "--count", type=int, default=0, help="Number of fake devices (default: 10, or every row of --fleet)")
+    parser.add_argument("-p", "--port", type=int, default=10022, help="Listening port on every device address")
+    parser.add_argument("-t", "--device-type", default="cisco_ios",
+                        help=f"Device type to emulate, comma separated types are assigned round-robin ({', '.join(sorted(PROFILES))})")
+    parser.add_argument("-l", "--lines", type=int, default=20, help="Output lines per show command")
+    parser.add_argument("-c", "--csv", default=None, help="Also write a pyshcmd CSV for the fleet to config/")
+    parser.add_argument("--cmdfile", default=None, help="cmdfile column for the CSV (default: per device type)")
+    parser.add_argument("--start", type=int, default=0, help="Index of the first device, to split one fleet over several processes")
+    parser.add_argument("--fleet", default=None, help="Serve the devices of this CSV in config/, with optional per-device behaviour columns")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before each command answers")
+    parser.add_argument("--auth-delay", type=float, default=0.0, help="Seconds before a password is accepted or rejected")
+    parser.add_argument("--auth-fail-rate", type=float, default=0.0, help="Probability a login is rejected")
+    parser.add_argument("--connect-fail-rate", type=float, default=0.0, help="Probability a connection is reset before login")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Probability the device drops the session on each command")
+    parser.add_argument("--rtt", type=float, default=0.0, help="Emulated link round trip in seconds, half added in each direction")
+    parser.add_argument("--aaa-capacity", type=int, default=0,
+                        help="Logins the shared fake AAA server checks at once, the rest queue (default: 0, unlimited)")
+    parser.add_argument("--aaa-timeout", type=float, default=5.0, help="Seconds a login may queue for AAA before the connection is reset")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the failure injection")
+    parser.add_argument("--bastion", type=int, default=0, metavar="PORT",
+                        help="Also run a jump host on 127.0.0.1:PORT forwarding direct-tcpip channels to the fleet (password 'password')")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    # Clients closing while a prompt is still being written is normal here
+    logging.getLogger("asyncio").setLevel(logging.ERROR)
+    device_types = args.device_type.split(",")
+    unknown = [t for t in device_types if t not in PROFILES]
+    if unknown:
+        parser.error(f"unsupported device type(s): {', '.join(unknown)}")
+    if args.aaa_capacity:
+        global AAA
+        AAA = FakeAAA(args.aaa_capacity, args.aaa_timeout)
+    if args.csv:
+        write_fleet_csv(args.csv, fleet_devices(args.count or 10, args.port, args.device_type, args.cmdfile, args.start, cli_behaviour(args)))
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+if __name__ == "__main__":
+    main()
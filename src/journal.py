@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from capture import restore_reference
+from store import load_manifest, read_object
+from result_sink import json_entries
+version = '20261016'
+# Run journal of finished devices for --resume (20261016)
+
+RESUME_SUFFIX = ".resume"
+
+# Append-only record of finished devices for one batch of one run, shared by all workers
+class RunJournal:
+    def __init__(self, path, metrics=None):
+        self.path = path
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.file = None
+
+    def open(self):
+        logger = logging.getLogger(__name__)
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.file = open(self.path, "a")
+            logger.debug(f"Journal opened at {self.path}")
+        except OSError as e:
+            logger.error(f"Error opening journal {self.path}, run cannot be resumed: {str(e)}")
+        return self
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # entry is the device's detected_types tuple; each line is flushed so a crash loses only devices still in flight.
+    # Outputs stay in the run's own JSONL, JSON or store, where PreviousOutputs reads them back on --resume
+    def record(self, ip, entry, links=None):
+        logger = logging.getLogger(__name__)
+        hostname, input_type, detected_type, connection_status, failed_commands, type_source = entry or (None, "", None, "Failed", [], "csv")
+        line = json.dumps({
+            "ip": ip,
+            "hostname": hostname,
+            "input_type": input_type,
+            "device_type": detected_type,
+            "type_source": type_source,
+            "connection": connection_status,
+            "failed_commands": list(failed_commands),
+            "retries": self.metrics.device_retries(ip) if self.metrics else 0,
+            "duration": self.metrics.device_duration(ip) if self.metrics else None,
+            "completed": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "links": links,
+        })
+        with self.lock:
+            if not self.file:
+                return
+            try:
+                self.file.write(line + "\n")
+                self.file.flush()
+            except OSError as e:
+                logger.error(f"Error writing journal record for {ip}: {str(e)}")
+
+# Last record of each device; a line cut short by a crash is skipped
+def load_journal(path):
+    logger = logging.getLogger(__name__)
+    records = {}
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Skipping incomplete journal line in {path}")
+                    continue
+                records[record["ip"]] = record
+    except FileNotFoundError:
+        return {}
+    except OSError as e:
+        logger.error(f"Error reading journal {path}: {str(e)}")
+    return records
+
+# Failed connections and devices with failed commands are run again on resume
+def is_complete(record):
+    return record.get("connection") in ("Success", "Unchanged") and not record.get("failed_commands")
+
+def entry_of(record):
+    return (record["hostname"], record["input_type"], record["device_type"], record["connection"],
+            list(record["failed_commands"]), record["type_source"])
+
+def _jsonl_entries(path):
+    logger = logging.getLogger(__name__)
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning(f"Skipping incomplete line in {path}")
+                continue
+            yield record["ip"], record["output"]
+
+# Outputs of the devices a resumed run keeps. The resumed run writes the same JSON, JSONL and store manifest paths,
+# so open() moves them aside first; replay() streams them back into the sink and close() removes them
+class PreviousOutputs:
+    def __init__(self, json_path=None, jsonl_path=None, store=None):
+        self.json_path = json_path
+        self.jsonl_path = jsonl_path
+        self.store = store
+        self.aside = {}
+
+    def open(self):
+        logger = logging.getLogger(__name__)
+        paths = {"json": self.json_path, "jsonl": self.jsonl_path, "store": self.store.path if self.store else None}
+        for kind, path in paths.items():
+            if not path:
+                continue
+            aside = f"{path}{RESUME_SUFFIX}"
+            try:
+                # Left by a resume that stopped while replaying: the file at path only holds part of it
+                if not os.path.exists(aside) and os.path.exists(path):
+                    os.replace(path, aside)
+            except OSError as e:
+                logger.error(f"Error moving {path} aside for --resume: {str(e)}")
+                continue
+            if os.path.exists(aside):
+                self.aside[kind] = aside
+        return self
+
+    # (ip, outputs) of the finished devices, from the JSONL or JSON output, then the store for devices in neither;
+    # outputs an Unchanged device linked to an older run stay links
+    def read(self, records):
+        logger = logging.getLogger(__name__)
+        found = set()
+        # Journals written before outputs were left out of them
+        for ip, record in records.items():
+            if "output" in record:
+                found.add(ip)
+                yield ip, {command: restore_reference(output) for command, output in record["output"].items()}
+        for kind, entries in (("jsonl", _jsonl_entries), ("json", json_entries)):
+            if kind not in self.aside:
+                continue
+            try:
+                for ip, outputs in entries(self.aside[kind]):
+                    if ip in records and ip not in found:
+                        found.add(ip)
+                        # The JSON output also holds the pointers written for linked outputs, the sink writes them again
+                        linked = (records[ip].get("links") or {}).get("outputs", {})
+                        yield ip, {command: restore_reference(output) for command, output in outputs.items() if command not in linked}
+            except OSError as e:
+                logger.error(f"Error reading {self.aside[kind]}: {str(e)}")
+            break
+        if "store" in self.aside and len(found) < len(records):
+            try:
+                manifest = load_manifest(self.aside["store"])
+            except (OSError, ValueError) as e:
+                logger.error(f"Error reading {self.aside['store']}: {str(e)}")
+                manifest = {}
+            for ip, record in records.items():
+                if ip in found or ip not in manifest:
+                    continue
+                linked = (record.get("links") or {}).get("outputs", {})
+                try:
+                    outputs = {command: read_object(self.store.root, digest) for command, digest in manifest[ip]["outputs"].items()
+                               if command not in linked}
+                except OSError as e:
+                    logger.error(f"Error reading stored outputs of {ip}: {str(e)}")
+                    continue
+                found.add(ip)
+                yield ip, outputs
+        missing = len(records) - len(found)
+        if missing:
+            logger.warning(f"No output of the interrupted run for {missing} finished devices, they are reported without output")
+
+    def close(self):
+        logger = logging.getLogger(__name__)
+        for aside in self.aside.values():
+            try:
+                os.remove(aside)
+            except OSError as e:
+                logger.error(f"Error removing {aside}: {str(e)}")
+        self.aside = {}
+
+# Put finished devices back into the report, outputs and metrics of the resumed run; outputs come from previous,
+# and its files are removed only once the sink has written them again
+def replay(records, detected_types, sink=None, metrics=None, previous=None):
+    for ip, record in records.items():
+        detected_types[ip] = entry_of(record)
+        if metrics is not None:
+            duration = record.get("duration")
+            metrics.load_devices({ip: {"phases": {"total": duration} if duration is not None else {}, "retries": record.get("retries", 0)}})
+    if sink is None or previous is None:
+        return
+    if records:
+        for ip, outputs in previous.read(records):
+            record = records[ip]
+            sink.put({ip: outputs}, record["hostname"], record["device_type"], record["connection"], record.get("links"), record["failed_commands"])
+        sink.drain()
+    previous.close()
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+import asyncio
+import errno
+import logging
+import os
+import threading
+import paramiko
+try:
+    import asyncssh
+except ImportError:
+    asyncssh = None
+version = '20261016'
+# Jump host multiplexing of device sessions over shared SSH transports (20261016)
+
+DEFAULT_PORT = 22
+DEFAULT_TRANSPORTS = 4
+DEFAULT_CHANNELS = 32
+CONN_TIMEOUT = 10
+KEEPALIVE = 30
+# Seconds between checks for a free channel while every one is in use; closed channels are not signalled, they are found by polling
+POLL_INTERVAL = 0.2
+PASSWORD_ENV = "PYSHCMD_JUMP_PASSWORD"
+# jump_host value of a CSV row reached directly although --jump-host is set
+DIRECT = "direct"
+
+# Settings of the run, set by configure(); the jump host itself comes from the device (CSV column or --jump-host)
+_settings = {"key_file": None, "transports": DEFAULT_TRANSPORTS, "channels": DEFAULT_CHANNELS}
+_jump_hosts = {}
+_async_jump_hosts = {}
+_lock = threading.Lock()
+# Runs using the shared transports: --per-csv runs several pyshcmd runs in one process, the collector daemon holds one for its pooled sessions
+_runs = 0
+# reclaim(jump key) closes one idle session behind that jump host and returns True; set by the collector daemon,
+# whose pooled sessions keep their channels between jobs
+_reclaim = None
+
+def configure(key_file=None, transports=DEFAULT_TRANSPORTS, channels=DEFAULT_CHANNELS):
+    _settings.update(key_file=key_file, transports=max(1, transports), channels=max(1, channels))
+
+def configure_from_args(args):
+    configure(getattr(args, "jump_key", None), getattr(args, "jump_transports", DEFAULT_TRANSPORTS),
+              getattr(args, "jump_channels", DEFAULT_CHANNELS))
+
+# --jump-host as the default of every device without its own jump_host value
+def apply_default(devices, default_spec):
+    if not default_spec:
+        return devices
+    return [dict(device, jump_host=device.get("jump_host") or default_spec) for device in devices]
+
+# Jump host of a device as "[user@]host[:port]", or None when the device is reached directly
+def spec_of(device_dict):
+    spec = (device_dict.get("jump_host") or "").strip()
+    return None if not spec or spec.lower() == DIRECT else spec
+
+# (user, host, port); the user defaults to the device's username
+def parse_spec(spec, default_user):
+    user, _, hostport = spec.rpartition("@")
+    host, _, port = hostport.partition(":")
+    return user or default_user, host, int(port) if port else DEFAULT_PORT
+
+def _key(device_dict):
+    spec = spec_of(device_dict)
+    return parse_spec(spec, device_dict["username"]) if spec else None
+
+# Paramiko jump host shared by every thread of the process, for Netmiko sessions and SSHDetect
+def jump_for(device_dict):
+    key = _key(device_dict)
+    if key is None:
+        return None
+    with _lock:
+        jump = _jump_hosts.get(key)
+        if jump is None:
+            jump = _jump_hosts[key] = JumpHost(*key, _settings["key_file"], _settings["transports"], _settings["channels"])
+        return jump
+
+def set_reclaim(reclaim):
+    global _reclaim
+    _reclaim = reclaim
+
+# A run starts using the jump hosts; args (None for the daemon) set the key file and limits of those opened from then on
+def open_run(args=None):
+    global _runs
+    if args is not None:
+        configure_from_args(args)
+    with _lock:
+        _runs += 1
+
+# The transports are closed once no run uses them any more
+def close_run():
+    global _runs
+    with _lock:
+        _runs = max(0, _runs - 1)
+        if _runs:
+            return
+        jumps = list(_jump_hosts.values())
+        _jump_hosts.clear()
+    for jump in jumps:
+        jump.close()
+
+class JumpHost:
+    def __init__(self, username, host, port=DEFAULT_PORT, key_file=None, transports=DEFAULT_TRANSPORTS, channels=DEFAULT_CHANNELS, timeout=CONN_TIMEOUT):
+        self.username = username
+        self.host = host
+        self.port = port
+        self.key_file = key_file
+        self.password = os.environ.get(PASSWORD_ENV)
+        self.max_transports = transports
+        self.max_channels = channels
+        self.timeout = timeout
+        self.name = f"{username}@{host}:{port}"
+        self.key = (username, host, port)
+        self.condition = threading.Condition()
+        # [{"client", "channels": open channels, "pending": channels being opened}, ...]
+        self.transports = []
+        self.connecting = False
+        # Login rejected by the bastion: raised to every later device instead of trying again and locking the account
+        self.auth_error = None
+        self.opened = 0
+        self.channels_opened = 0
+
+    def _connect(self):
+        logger = logging.getLogger(__name__)
+        client = paramiko.SSHClient()
+        client.load_system_host_keys()
+        # Unknown bastion keys are accepted like Netmiko accepts device keys; a changed known key is still refused
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        try:
+            client.connect(self.host, self.port, self.username, password=self.password, key_filename=self.key_file,
+                           look_for_keys=self.key_file is None, timeout=self.timeout, banner_timeout=self.timeout, auth_timeout=self.timeout)
+        except paramiko.AuthenticationException as e:
+            client.close()
+            self.auth_error = f"Jump host {self.name}: {str(e)}"
+            raise paramiko.AuthenticationException(self.auth_error) from e
+        except OSError as e:
+            client.close()
+            raise OSError(e.errno, f"Jump host {self.name}: {e.strerror or str(e)}") from e
+        client.get_transport().set_keepalive(KEEPALIVE)
+        self.opened += 1
+        logger.info(f"Jump host {self.name}: transport {self.opened} open")
+        return client
+
+    # Drop closed channels and dead transports; called with the condition held
+    def _prune(self):
+        for entry in list(self.transports):
+            transport = entry["client"].get_transport()
+            if transport is None or not transport.is_active():
+                self.transports.remove(entry)
+                entry["client"].close()
+                continue
+            entry["channels"] = [channel for channel in entry["channels"] if not channel.closed]
+
+    # Slot on the transport with a free channel, the least loaded first; a new transport only once every open one is full.
+    # With every channel in use it waits like a semaphore until one is closed, so -w above transports x channels queues
+    def reserve(self):
+        logger = logging.getLogger(__name__)
+        waited = False
+        while True:
+            with self.condition:
+                if self.auth_error:
+                    raise paramiko.AuthenticationException(self.auth_error)
+                self._prune()
+                free = [entry for entry in self.transports if len(entry["channels"]) + entry["pending"] < self.max_channels]
+                if free:
+                    entry = min(free, key=lambda entry: len(entry["channels"]) + entry["pending"])
+                    entry["pending"] += 1
+                    return entry
+                if not self.connecting and len(self.transports) < self.max_transports:
+                    self.connecting = True
+                    break
+                # Only with every transport open, a transport being connected brings free channels anyway
+                full = len(self.transports) >= self.max_transports
+                if not waited:
+                    logger.debug(f"Jump host {self.name}: {self.max_transports} transports x {self.max_channels} channels in use, waiting")
+                    waited = True
+            # A pooled idle session of the collector daemon gives its channel back before anyone waits
+            if not (full and _reclaim and _reclaim(self.key)):
+                with self.condition:
+                    self.condition.wait(POLL_INTERVAL)
+        try:
+            client = self._connect()
+        except BaseException:
+            with self.condition:
+                self.connecting = False
+                self.condition.notify_all()
+            raise
+        # Added before the waiters wake, or they would all find every transport full and connect another one
+        entry = {"client": client, "channels": [], "pending": 1}
+        with self.condition:
+            self.transports.append(entry)
+            self.connecting = False
+            self.condition.notify_all()
+        return entry
+
+    # Socket-like channel to ip:port through the bastion, passed to Netmiko/paramiko as sock; slot from reserve(),
+    # taken here when not given. Only the channel open is bound by the timeout, not the wait for a slot
+    def open_channel(self, ip, port, timeout=None, slot=None):
+        timeout = timeout or self.timeout
+        entry = slot or self.reserve()
+        channel = None
+        try:
+            transport = entry["client"].get_transport()
+            if transport is None:
+                raise ConnectionResetError(f"Jump host {self.name} closed the transport")
+            channel = transport.open_channel("direct-tcpip", (str(ip), port), ("127.0.0.1", 0), timeout=timeout)
+            return channel
+        except paramiko.ChannelException as e:
+            # The bastion could not reach the device (refused, unreachable or timed out on its side): no retry, as for a direct connect
+            raise OSError(errno.EHOSTUNREACH, f"Jump host {self.name} cannot connect to {ip}:{port}: {e.text}") from None
+        finally:
+            with self.condition:
+                entry["pending"] -= 1
+                if channel is not None:
+                    entry["channels"].append(channel)
+                    self.channels_opened += 1
+                self.condition.notify_all()
+
+    def close(self):
+        logger = logging.getLogger(__name__)
+        with self.condition:
+            entries = list(self.transports)
+            self.transports = []
+        for entry in entries:
+            entry["client"].close()
+        if self.opened:
+            logger.info(f"Jump host {self.name}: {self.channels_opened} device channels over {self.opened} transports")
+
+# asyncssh jump host for the async engine, one set per event loop
+def async_jump_for(device_dict):
+    key = _key(device_dict)
+    if key is None:
+        return None
+    jumps = _async_jump_hosts.setdefault(asyncio.get_running_loop(), {})
+    jump = jumps.get(key)
+    if jump is None:
+        jump = jumps[key] = AsyncJumpHost(*key, _settings["key_file"], _settings["transports"], _settings["channels"])
+    return jump
+
+async def close_async():
+    for jump in _async_jump_hosts.pop(asyncio.get_running_loop(), {}).values():
+        await jump.close()
+
+# Same spreading as JumpHost; a device connection holds its slot from acquire() to release()
+class AsyncJumpHost:
+    def __init__(self, username, host, port=DEFAULT_PORT, key_file=None, transports=DEFAULT_TRANSPORTS, channels=DEFAULT_CHANNELS, timeout=CONN_TIMEOUT):
+        self.username = username
+        self.host = host
+        self.port = port
+        self.key_file = key_file
+        self.password = os.environ.get(PASSWORD_ENV)
+        self.max_transports = transports
+        self.max_channels = channels
+        self.timeout = timeout
+        self.name = f"{username}@{host}:{port}"
+        self.condition = asyncio.Condition()
+        # connection -> device connections using it
+        self.transports = {}
+        self.connecting = False
+        self.auth_error = None
+        self.opened = 0
+        self.channels_opened = 0
+
+    async def _connect(self):
+        logger = logging.getLogger(__name__)
+        options = {"client_keys": [self.key_file]} if self.key_file else {}
+        try:
+            conn = await asyncio.wait_for(
+                asyncssh.connect(self.host, port=self.port, username=self.username, password=self.password, known_hosts=None,
+                                 keepalive_interval=KEEPALIVE, **options),
+                timeout=self.timeout
+            )
+        except asyncssh.PermissionDenied as e:
+            self.auth_error = f"Jump host {self.name}: {e.reason}"
+            raise asyncssh.PermissionDenied(self.auth_error) from e
+        except OSError as e:
+            raise OSError(e.errno, f"Jump host {self.name}: {e.strerror or str(e)}") from e
+        self.opened += 1
+        logger.info(f"Jump host {self.name}: transport {self.opened} open")
+        return conn
+
+    def _prune(self):
+        for conn in [conn for conn in self.transports if conn.is_closed()]:
+            del self.transports[conn]
+
+    # Waits like a semaphore while every channel is in use
+    async def acquire(self):
+        async with self.condition:
+            while True:
+                if self.auth_error:
+                    raise asyncssh.PermissionDenied(self.auth_error)
+                self._prune()
+                free = [conn for conn, count in self.transports.items() if count < self.max_channels]
+                if free:
+                    conn = min(free, key=self.transports.get)
+                    self.transports[conn] += 1
+                    self.channels_opened += 1
+                    return conn
+                if not self.connecting and len(self.transports) < self.max_transports:
+                    self.connecting = True
+                    break
+                # Woken by release(); the poll finds transports that died with their connections
+                try:
+                    await asyncio.wait_for(self.condition.wait(), timeout=POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+        try:
+            conn = await self._connect()
+        except BaseException:
+            async with self.condition:
+                self.connecting = False
+                self.condition.notify_all()
+            raise
+        async with self.condition:
+            self.transports[conn] = 1
+            self.channels_opened += 1
+            self.connecting = False
+            self.condition.notify_all()
+        return conn
+
+    async def release(self, conn):
+        async with self.condition:
+            if conn in self.transports:
+                self.transports[conn] -= 1
+            self.condition.notify_all()
+
+    async def close(self):
+        logger = logging.getLogger(__name__)
+        conns = list(self.transports)
+        self.transports = {}
+        for conn in conns:
+            conn.close()
+            try:
+                await asyncio.wait_for(conn.wait_closed(), timeout=self.timeout)
+            except (asyncio.TimeoutError, OSError):
+                pass
+        if self.opened:
+            logger.info(f"Jump host {self.name}: {self.channels_opened} device connections over {self.opened} transports")
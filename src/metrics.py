@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+version = '20261016'
+# Per-device, per-phase and per-command latency metrics with JSON and Prometheus export (20261016)
+
+PHASES = ["preflight", "detect", "jump", "tcp", "login", "enable", "commands", "write", "total"]
+QUANTILES = [0.5, 0.95, 0.99]
+
+# Nearest-rank percentile of an already sorted list
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize(values):
+    values = sorted(values)
+    summary = {
+        "count": len(values),
+        "sum": round(sum(values), 6),
+        "max": round(values[-1], 6) if values else 0.0,
+    }
+    for q in QUANTILES:
+        summary[f"p{int(q * 100)}"] = round(percentile(values, q), 6)
+    return summary
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+# Thread-safe collector shared by all workers of a run; devices are keyed by IP like detected_types
+class RunMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.devices = defaultdict(lambda: {"phases": {}, "commands": [], "retries": 0})
+        self.started = time.time()
+        # Called with (ip, phase, seconds, error) as each timed phase ends, error is None on success
+        self.observers = []
+
+    def add_observer(self, observer):
+        self.observers.append(observer)
+
+    # Phases add up when a device passes through one twice; "total" is set by the outermost timer, which finishes last
+    def record(self, ip, phase, seconds):
+        with self.lock:
+            phases = self.devices[ip]["phases"]
+            if phase == "total":
+                phases[phase] = round(seconds, 6)
+            else:
+                phases[phase] = round(phases.get(phase, 0.0) + seconds, 6)
+
+    # size is the output length in characters
+    def record_command(self, ip, command, seconds, size):
+        with self.lock:
+            self.devices[ip]["commands"].append({"command": command, "seconds": round(seconds, 6), "size": size})
+
+    def record_retry(self, ip):
+        with self.lock:
+            self.devices[ip]["retries"] += 1
+
+    # Time a block as one phase of a device, also when it raises
+    @contextmanager
+    def phase(self, ip, phase):
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            self.record(ip, phase, seconds)
+            for observer in self.observers:
+                observer(ip, phase, seconds, error)
+
+    def device_duration(self, ip):
+        with self.lock:
+            entry = self.devices.get(ip)
+            return entry["phases"].get("total") if entry else None
+
+    # Seconds the device held a session: "total" also counts waiting for a session slot, a jump host channel and retry backoff
+    def device_service_time(self, ip):
+        with self.lock:
+            entry = self.devices.get(ip)
+            if not entry:
+                return None
+            return sum(seconds for phase, seconds in entry["phases"].items() if phase not in ("total", "preflight", "jump")) or None
+
+    # A session reused from the collector daemon's pool has no login phase
+    def device_logged_in(self, ip):
+        with self.lock:
+            entry = self.devices.get(ip)
+            return bool(entry) and "login" in entry["phases"]
+
+    def device_retries(self, ip):
+        with self.lock:
+            entry = self.devices.get(ip)
+            return entry["retries"] if entry else 0
+
+    # Raw per-device samples, also used to merge shard metrics
+    def load_devices(self, devices):
+        with self.lock:
+            for ip, entry in devices.items():
+                self.devices[ip] = {"phases": dict(entry.get("phases", {})), "commands": list(entry.get("commands", [])),
+                                    "retries": entry.get("retries", 0)}
+
+    def snapshot(self, ips=None):
+        with self.lock:
+            return {ip: {"phases": dict(entry["phases"]), "commands": list(entry["commands"]), "retries": entry["retries"]}
+                    for ip, entry in self.devices.items() if ips is None or ip in ips}
+
+    def aggregate(self, devices):
+        phases = defaultdict(list)
+        commands = defaultdict(list)
+        command_size = defaultdict(int)
+        for entry in devices.values():
+            for phase, seconds in entry["phases"].items():
+                phases[phase].append(seconds)
+            for sample in entry["commands"]:
+                commands[sample["command"]].append(sample["seconds"])
+                command_size[sample["command"]] += sample["size"]
+        phase_summary = {phase: summarize(phases[phase]) for phase in PHASES if phase in phases}
+        command_summary = {}
+        for command, values in commands.items():
+            command_summary[command] = summarize(values)
+            command_summary[command]["size"] = command_size[command]
+        return phase_summary, command_summary
+
+    def save_json(self, filename, output_base, ips=None):
+        devices = self.snapshot(ips)
+        phase_summary, command_summary = self.aggregate(devices)
+        with open(filename, "w") as f:
+            json.dump({
+                "batch": output_base,
+                "generated": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "devices_count": len(devices),
+                "retries": sum(entry["retries"] for entry in devices.values()),
+                "phases": phase_summary,
+                "commands": command_summary,
+                "devices": devices,
+            }, f, indent=4)
+
+    # Prometheus node_exporter textfile collector format
+    def save_prometheus(self, filename, output_base, ips=None):
+        devices = self.snapshot(ips)
+        phase_summary, command_summary = self.aggregate(devices)
+        batch = _label(output_base)
+        lines = [
+            "# HELP pyshcmd_phase_seconds Per-device latency of each collection phase.",
+            "# TYPE pyshcmd_phase_seconds summary",
+        ]
+        for phase, summary in phase_summary.items():
+            for q in QUANTILES:
+                lines.append(f'pyshcmd_phase_seconds{{batch="{batch}",phase="{phase}",quantile="{q}"}} {summary[f"p{int(q * 100)}"]}')
+            lines.append(f'pyshcmd_phase_seconds_sum{{batch="{batch}",phase="{phase}"}} {summary["sum"]}')
+            lines.append(f'pyshcmd_phase_seconds_count{{batch="{batch}",phase="{phase}"}} {summary["count"]}')
+        lines += [
+            "# HELP pyshcmd_command_seconds Latency of each command across devices.",
+            "# TYPE pyshcmd_command_seconds summary",
+        ]
+        for command, summary in command_summary.items():
+            label = _label(command)
+            for q in QUANTILES:
+                lines.append(f'pyshcmd_command_seconds{{batch="{batch}",command="{label}",quantile="{q}"}} {summary[f"p{int(q * 100)}"]}')
+            lines.append(f'pyshcmd_command_seconds_sum{{batch="{batch}",command="{label}"}} {summary["sum"]}')
+            lines.append(f'pyshcmd_command_seconds_count{{batch="{batch}",command="{label}"}} {summary["count"]}')
+        lines += [
+            "# HELP pyshcmd_command_output_chars Total output size of each command across devices, in characters.",
+            "# TYPE pyshcmd_command_output_chars gauge",
+        ]
+        for command, summary in command_summary.items():
+            lines.append(f'pyshcmd_command_output_chars{{batch="{batch}",command="{_label(command)}"}} {summary["size"]}')
+        lines += [
+            "# HELP pyshcmd_retries_total Connection attempts repeated after a timeout or reset.",
+            "# TYPE pyshcmd_retries_total counter",
+            f'pyshcmd_retries_total{{batch="{batch}"}} {sum(entry["retries"] for entry in devices.values())}',
+        ]
+        with open(filename, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+# Write metrics_<batch>_<timestamp>.json/.prom next to the connection report
+def save_metrics(metrics, report_dir, output_base, timestamp, metrics_format="json", ips=None):
+    logger = logging.getLogger(__name__)
+    os.makedirs(report_dir, exist_ok=True)
+    saved = []
+    try:
+        if metrics_format in ("json", "both"):
+            filename = os.path.join(report_dir, f"metrics_{output_base}_{timestamp}.json")
+            metrics.save_json(filename, output_base, ips)
+            saved.append(filename)
+        if metrics_format in ("prom", "both"):
+            filename = os.path.join(report_dir, f"metrics_{output_base}_{timestamp}.prom")
+            metrics.save_prometheus(filename, output_base, ips)
+            saved.append(filename)
+        for filename in saved:
+            logger.info(f"Metrics saved to {filename}")
+    except OSError as e:
+        logger.error(f"Error saving metrics for {output_base}: {str(e)}")
+
+def load_metrics_devices(filename):
+    try:
+        with open(filename, "r") as f:
+            return json.load(f).get("devices", {})
+    except (OSError, ValueError):
+        return {}
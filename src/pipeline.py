@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+import re
+import time
+version = '20261016'
+# Pipelined command mode with per-command output splitting (20261016)
+
+# Marks a cmdfile line that must run on its own (changes the prompt or mode, asks for confirmation, very long output)
+NOPIPE_MARKER = "[nopipe]"
+# Marks the cheap command whose output decides, with --conditional, whether the commands after it run (conditional.py)
+PROBE_MARKER = "[probe]"
+READ_TIMEOUT = 10.0
+LOOP_DELAY = 0.025
+
+# A pipelined group stalled and the channel did not come back to the prompt after its last command; outputs holds
+# the commands that did complete, the rest cannot run on the session
+class PipelineDesync(Exception):
+    def __init__(self, message, outputs):
+        super().__init__(message)
+        self.outputs = outputs
+
+# A cmdfile command; behaves as the plain command string everywhere (JSON keys, merges, text files)
+class Command(str):
+    pipeline = True
+    probe = False
+
+def parse_command(line):
+    if line.startswith(NOPIPE_MARKER):
+        command = Command(line[len(NOPIPE_MARKER):].strip())
+        command.pipeline = False
+        return command
+    if line.startswith(PROBE_MARKER):
+        # The probe is compared before anything after it is sent, so it never shares a pipelined group
+        command = Command(line[len(PROBE_MARKER):].strip())
+        command.pipeline = False
+        command.probe = True
+        return command
+    return Command(line)
+
+def pipeline_safe(command):
+    return getattr(command, "pipeline", True)
+
+# Consecutive pipeline-safe commands in groups of up to size; unsafe commands, or everything when size < 2, as groups of one
+def command_groups(commands, size):
+    group = []
+    for command in commands:
+        if size < 2 or not pipeline_safe(command):
+            if group:
+                yield group
+                group = []
+            yield [command]
+            continue
+        group.append(command)
+        if len(group) == size:
+            yield group
+            group = []
+    if group:
+        yield group
+
+# Offsets of each command's echo in the combined output, in order; a device echoes a typed-ahead
+# command right after the prompt that ends the previous command's output
+def echo_offsets(buffer, commands, prompt):
+    offsets = []
+    pos = 0
+    for i, command in enumerate(commands):
+        echo = command.strip()
+        if i == 0:
+            start = buffer.find(echo, pos)
+            if start < 0:
+                break
+        else:
+            match = re.compile(rf"{re.escape(prompt)}[ \t]*({re.escape(echo)})").search(buffer, pos)
+            if not match:
+                break
+            start = match.start(1)
+        offsets.append(start)
+        pos = start + len(echo)
+    return offsets
+
+# Raw per-command output, from the echo up to and including the next prompt line, exactly what a
+# sequential read returns; only commands whose output is complete are returned
+def split_output(buffer, commands, prompt, prompt_pattern):
+    offsets = echo_offsets(buffer, commands, prompt)
+    chunks = [buffer[start:end] for start, end in zip(offsets, offsets[1:])]
+    if len(offsets) == len(commands):
+        tail = buffer[offsets[-1]:].replace("\r", "")
+        if "\n" in tail and prompt_pattern.search(tail.rsplit("\n", 1)[-1]):
+            chunks.append(buffer[offsets[-1]:])
+    return chunks
+
+# True once the last command of the group was echoed and a prompt line followed it, even if some outputs could
+# not be split: nothing typed ahead is left to answer
+def group_finished(buffer, commands, prompt_pattern):
+    start = buffer.rfind(commands[-1].strip())
+    if start < 0:
+        return False
+    tail = buffer[start:].replace("\r", "")
+    return "\n" in tail and bool(prompt_pattern.search(tail.rsplit("\n", 1)[-1]))
+
+# Netmiko: one write for the whole group, then read until every command's output is complete.
+# Returns the cleaned outputs in order, fewer than commands if the read timed out; each command
+# gets read_timeout to finish, as with send_command. After a timeout the rest of the group is drained up to
+# the prompt after its last command, so the commands run one by one afterwards get their own output
+# (PipelineDesync if the prompt does not come back)
+def send_pipelined(ssh, commands, read_timeout=READ_TIMEOUT):
+    prompt = ssh.find_prompt()
+    prompt_pattern = re.compile(re.escape(prompt))
+    ssh.write_channel("".join(ssh.normalize_cmd(command) for command in commands))
+    buffer = ""
+    chunks = []
+    deadline = time.time() + read_timeout
+    while time.time() < deadline:
+        new_data = ssh.read_channel()
+        if new_data:
+            buffer += new_data
+            done = split_output(buffer, commands, prompt, prompt_pattern)
+            if len(done) > len(chunks):
+                deadline = time.time() + read_timeout
+            chunks = done
+            if len(chunks) == len(commands):
+                break
+        elif getattr(ssh.remote_conn, "closed", False):
+            raise ConnectionResetError(f"Session closed by {ssh.host}")
+        else:
+            time.sleep(LOOP_DELAY)
+    outputs = [ssh._sanitize_output(chunk, strip_command=True, command_string=ssh.normalize_cmd(command), strip_prompt=True)
+               for command, chunk in zip(commands, chunks)]
+    if len(chunks) < len(commands):
+        deadline = time.time() + read_timeout
+        while not group_finished(buffer, commands, prompt_pattern):
+            if time.time() >= deadline:
+                raise PipelineDesync(f"No prompt after '{commands[-1]}' on {ssh.host}", outputs)
+            new_data = ssh.read_channel()
+            if new_data:
+                buffer += new_data
+            elif getattr(ssh.remote_conn, "closed", False):
+                raise ConnectionResetError(f"Session closed by {ssh.host}")
+            else:
+                time.sleep(LOOP_DELAY)
+        # A command that changed the prompt leaves the channel in another mode
+        try:
+            current = ssh.find_prompt()
+        except ValueError as e:
+            raise PipelineDesync(str(e), outputs) from e
+        if current != prompt:
+            raise PipelineDesync(f"Prompt changed after '{commands[-1]}' on {ssh.host}", outputs)
+    return outputs
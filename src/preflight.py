@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+import asyncio
+import errno
+import logging
+import os
+import socket
+import time
+import jumphost
+version = '20261016'
+# Pre-flight TCP reachability probe of the devices (20261016)
+
+DEFAULT_TIMEOUT = 2.0
+CONCURRENCY = 500
+# Answers from the network that mean the SSH connection would fail as well; local errors (out of file descriptors,
+# no source address) leave the device to the SSH workers
+UNREACHABLE_ERRNOS = {errno.ECONNREFUSED, errno.EHOSTUNREACH, errno.ENETUNREACH, errno.EHOSTDOWN, errno.ETIMEDOUT, errno.ECONNRESET}
+
+# Reason the device cannot be reached, or None if the port accepted the connection or the probe could not tell
+async def probe(ip, port, timeout=DEFAULT_TIMEOUT):
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(str(ip), port), timeout)
+    except asyncio.TimeoutError:
+        return f"TCP connect to port {port} timed out after {timeout:g}s"
+    except socket.gaierror as e:
+        return f"Name resolution failed: {str(e)}"
+    except OSError as e:
+        if e.errno in UNREACHABLE_ERRNOS:
+            return f"TCP connect to port {port} failed: {os.strerror(e.errno)}"
+        return None
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return None
+
+async def probe_all(devices, timeout=DEFAULT_TIMEOUT, concurrency=CONCURRENCY, metrics=None):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def probe_device(device):
+        async with semaphore:
+            start = time.perf_counter()
+            reason = await probe(device["ip"], device["port"], timeout)
+            if metrics is not None:
+                metrics.record(device["ip"], "preflight", time.perf_counter() - start)
+            return reason
+
+    return await asyncio.gather(*(probe_device(device) for device in devices))
+
+# Split devices into (reachable, [(device, reason), ...]); each ip:port is probed once even if listed twice.
+# Devices behind a jump host are only reachable from it and count as reachable
+def preflight(devices, timeout=DEFAULT_TIMEOUT, concurrency=CONCURRENCY, metrics=None):
+    logger = logging.getLogger(__name__)
+    start = time.perf_counter()
+    jumped = [device for device in devices if jumphost.spec_of(device)]
+    if jumped:
+        logger.info(f"Pre-flight: {len(jumped)} devices behind a jump host not probed")
+        devices = [device for device in devices if not jumphost.spec_of(device)]
+    unique = list({(device["ip"], device["port"]): device for device in devices}.values())
+    reasons = dict(zip(((device["ip"], device["port"]) for device in unique),
+                       asyncio.run(probe_all(unique, timeout, concurrency, metrics))))
+    reachable = []
+    unreachable = []
+    for device in devices:
+        reason = reasons[(device["ip"], device["port"])]
+        if reason:
+            logger.warning(f"Unreachable {device['ip']}:{device['port']} ({device['hostname']}): {reason}")
+            unreachable.append((device, reason))
+        else:
+            reachable.append(device)
+    down = sum(1 for reason in reasons.values() if reason)
+    logger.info(f"Pre-flight: {len(unique) - down}/{len(unique)} devices reachable in {time.perf_counter() - start:.1f}s, "
+                f"{down} unreachable devices skipped")
+    return reachable + jumped, unreachable
@@ -1,16 +1,37 @@
 #!/usr/bin/env python3
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
 from datetime import datetime
+import asyncio
 import time
 import sys
 import os
 import logging
 import logging.config
 import csv
+import shutil
 import json
 import argparse
+import socket
+import threading
 from pathlib import Path
-from netmiko import ConnectHandler, NetMikoAuthenticationException, NetmikoTimeoutException, SSHDetect
+from netmiko import ConnectHandler, NetmikoTimeoutException, SSHDetect
+from netmiko.exceptions import ReadTimeout
+import async_engine
+from result_sink import ResultSink
+from detect_cache import DetectCache
+from metrics import RunMetrics, save_metrics
+from retry import NO_RETRY, SESSION_ERRORS, TransientError, is_transient, policy_from_args, DEFAULT_RETRIES, DEFAULT_BACKOFF, DEFAULT_MAX_BACKOFF
+from journal import RunJournal, PreviousOutputs, load_journal, is_complete, replay
+from pipeline import parse_command, command_groups, send_pipelined, PipelineDesync
+from preflight import preflight, DEFAULT_TIMEOUT as PREFLIGHT_TIMEOUT
+from store import OutputStore, STORE_DIR
+from conditional import ConditionalCollection, previous_records, without_probes, linked_outputs
+import structured
+import jumphost
+from duration_history import DurationHistory, ORDERS, device_key, plan_order, record_run
+from capture import Capture, is_reference, output_size, reference_path, send_command as capture_command, DEFAULT_SPILL_MB, DEFAULT_CAP_MB
+from adaptive import AdaptiveLimit, AsyncAdaptiveLimit, workers_arg, DEFAULT_MIN, DEFAULT_MAX
 version = '20250709'
 # Fixed --output-structure: option1 (timestamp/name), option2 (name_timestamp); removed run_batch_mp.py; single log file pyshcmd_<timestamp>.log; added Netmiko device type autodetection with report_<batch>_<timestamp>.txt; fixed SSHDetect context manager issue; updated log message and report to include input and detected device types; added connection status; removed failed commands from report; renamed connection_report to report_<batch>_<timestamp>.txt; added device count to report; moved report to report/ directory (20250709_1548)
 
@@ -27,6 +48,9 @@ REPORT_DIR = 'report'
 REPORT_DIR_FULL = os.path.join(PARENT_DIR, REPORT_DIR)
 CMD_DIR = 'cmd'
 CMD_DIR_FULL = os.path.join(PARENT_DIR, CMD_DIR)
+JOURNAL_DIR = 'journal'
+JOURNAL_DIR_FULL = os.path.join(PARENT_DIR, JOURNAL_DIR)
+CONN_TIMEOUT = 10
 DATETIME = datetime.now().strftime("%Y%m%d_%H%M%S")
 
 # Configure logging using JSON configuration
@@ -63,30 +87,45 @@ def count_time(func):
         return result
     return wrapper
 
-# Read commands from a text file
+# Parsed cmdfiles shared by every device and every CSV of the run, keyed by path and revalidated by mtime
+_command_cache = {}
+_command_cache_lock = threading.Lock()
+
+# Read commands from file, skipping termination commands; each file is parsed once per run (until it changes).
+# Lines starting with [nopipe] are kept out of pipelined groups, [probe] lines only run with --conditional
 def read_commands(commands_file):
     logger = logging.getLogger(__name__)
     commands_path = os.path.join(CMD_DIR_FULL, commands_file)
     termination_commands = {"exit", "quit"}
     try:
-        with open(commands_path, "r") as f:
-            commands = [
-                line.strip() for line in f
-                if line.strip() and not line.strip().startswith("#")
-                and line.strip().lower() not in termination_commands
-            ]
-        with open(commands_path, "r") as f:
-            for line in f:
-                if line.strip().lower() in termination_commands:
-                    logger.debug(f"Skipped termination command '{line.strip()}' in {commands_path}")
+        stat = os.stat(commands_path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        with _command_cache_lock:
+            cached = _command_cache.get(commands_path)
+            if cached and cached[0] == key:
+                return cached[1]
+            commands = []
+            with open(commands_path, "r") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line or line.startswith("#"):
+                        continue
+                    command = parse_command(line)
+                    if command.lower() in termination_commands:
+                        logger.debug(f"Skipped termination command '{command}' in {commands_path}")
+                        continue
+                    commands.append(command)
+            # A tuple, so devices sharing the entry cannot change each other's command list
+            commands = tuple(commands)
+            _command_cache[commands_path] = (key, commands)
         if not commands:
             logger.error(f"No valid commands found in {commands_path}")
-            return []
+            return ()
         logger.debug(f"Read {len(commands)} commands from {commands_path}")
         return commands
     except OSError as e:
         logger.error(f"Error reading {commands_path}: {str(e)}")
-        return []
+        return ()
 
 # Autodetect device type using Netmiko's SSHDetect
 def autodetect_device_type(device_dict):
@@ -100,6 +139,9 @@ def autodetect_device_type(device_dict):
             "password": device_dict["password"],
             "port": device_dict["port"]
         }
+        jump = jumphost.jump_for(device_dict)
+        if jump:
+            temp_device["sock"] = jump.open_channel(str(device_dict["ip"]), device_dict["port"])
         detector = SSHDetect(**temp_device)
         detected_type = detector.autodetect()
         if detected_type:
@@ -112,54 +154,79 @@ def autodetect_device_type(device_dict):
         logger.error(f"Failed to autodetect device type for {ip}: {str(e)}")
         return None
 
-# Read devices from a CSV file
+# Read and validate device details from CSV in one pass; every bad row is reported before exiting
 def read_devices(csv_file):
     logger = logging.getLogger(__name__)
     csv_path = os.path.join(CONFIG_DIR_FULL, csv_file)
     devices = []
+    errors = []
     required_fields = ["username", "password", "hostname", "ip", "port", "cmdfile"]
+    # Rows share a handful of cmdfiles, so each one is checked on disk once
+    cmdfile_exists = {}
     try:
         with open(csv_path, newline="") as f:
-            reader = csv.DictReader(f)
-            if not all(field in reader.fieldnames for field in required_fields):
-                missing = [field for field in required_fields if field not in reader.fieldnames]
+            reader = csv.reader(f)
+            fieldnames = next(reader, None) or []
+            if not all(field in fieldnames for field in required_fields):
+                missing = [field for field in required_fields if field not in fieldnames]
                 logger.error(f"CSV file {csv_path} missing required fields: {missing}")
                 sys.exit(1)
-            
-            for row in reader:
-                device = {
-                    "username": row["username"],
-                    "password": row["password"],
-                    "hostname": row["hostname"],
-                    "ip": row["ip"],
-                    "port": int(row["port"]),
-                    "cmdfile": row["cmdfile"],
-                    "device_type": row.get("device_type", "")
-                }
-                cmd_file_path = os.path.join(CMD_DIR_FULL, device["cmdfile"])
-                if not os.path.isfile(cmd_file_path):
-                    logger.error(f"Command file {cmd_file_path} for device {device['ip']} does not exist")
-                    sys.exit(1)
+            # Plain csv.reader with column positions, DictReader is the main cost on large inventories
+            positions = [fieldnames.index(field) for field in required_fields]
+            optional = [fieldnames.index(field) if field in fieldnames else None for field in ("device_type", "site", "jump_host")]
+            width = len(fieldnames)
+
+            for values in reader:
+                if not values:
+                    continue
+                if len(values) < width:
+                    values += [""] * (width - len(values))
+                username, password, hostname, ip, port, cmdfile = [values[i] for i in positions]
+                if not (username and hostname and ip and port and cmdfile):
+                    empty = [field for field, i in zip(required_fields, positions) if field != "password" and not values[i]]
+                    errors.append(f"line {reader.line_num}: empty {', '.join(empty)}")
+                    continue
                 try:
-                    if not (1 <= device["port"] <= 65535):
-                        logger.error(f"Invalid port {device['port']} for device {device['ip']}")
-                        sys.exit(1)
+                    port = int(port)
                 except ValueError:
-                    logger.error(f"Port {row['port']} for device {device['ip']} is not a valid integer")
-                    sys.exit(1)
-                devices.append(device)
-        
-        if not devices:
-            logger.error(f"No devices found in {csv_path}")
-            sys.exit(1)
-        logger.debug(f"Read {len(devices)} devices from {csv_path}")
-        return devices
+                    errors.append(f"line {reader.line_num}: port {port} for device {ip} is not a valid integer")
+                    continue
+                if not (1 <= port <= 65535):
+                    errors.append(f"line {reader.line_num}: invalid port {port} for device {ip}")
+                    continue
+                if cmdfile not in cmdfile_exists:
+                    cmdfile_exists[cmdfile] = os.path.isfile(os.path.join(CMD_DIR_FULL, cmdfile))
+                if not cmdfile_exists[cmdfile]:
+                    errors.append(f"line {reader.line_num}: command file {os.path.join(CMD_DIR_FULL, cmdfile)} for device {ip} does not exist")
+                    continue
+                devices.append({
+                    "username": username,
+                    "password": password,
+                    "hostname": hostname,
+                    "ip": ip,
+                    "port": port,
+                    "cmdfile": cmdfile,
+                    "device_type": values[optional[0]] if optional[0] is not None else "",
+                    "site": values[optional[1]] if optional[1] is not None else "",
+                    "jump_host": values[optional[2]] if optional[2] is not None else ""
+                })
     except OSError as e:
         logger.error(f"Error reading {csv_path}: {str(e)}")
         sys.exit(1)
 
+    if errors:
+        for error in errors:
+            logger.error(f"{csv_path} {error}")
+        logger.error(f"{len(errors)} invalid rows in {csv_path}, nothing was run")
+        sys.exit(1)
+    if not devices:
+        logger.error(f"No devices found in {csv_path}")
+        sys.exit(1)
+    logger.debug(f"Read {len(devices)} devices from {csv_path}")
+    return devices
+
 # Save connection report including device types, connection status, and device count
-def save_connection_report(detected_types, output_base, timestamp, output_structure):
+def save_connection_report(detected_types, output_base, timestamp, output_structure, metrics=None, concurrency=None, schedule=None):
     logger = logging.getLogger(__name__)
     os.makedirs(REPORT_DIR_FULL, exist_ok=True)
     filename = os.path.join(REPORT_DIR_FULL, f"report_{output_base}_{timestamp}.txt")
@@ -169,122 +236,638 @@ def save_connection_report(detected_types, output_base, timestamp, output_struct
             f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
             f.write(f"Number of device: {len(detected_types)}\n")
             f.write(f"Batch: {output_base}\n\n")
-            f.write(f"{'IP':<16} {'Hostname':<20} {'Input Device Type':<20} {'Detected Device Type':<20} {'Connection':<12}\n")
-            f.write("-" * 80 + "\n")
-            for ip, (hostname, input_type, detected_type, connection_status, _) in detected_types.items():
-                f.write(f"{ip:<16} {hostname:<20} {input_type or 'None':<20} {detected_type or 'Failed':<20} {connection_status:<12}\n")
+            f.write(f"{'IP':<16} {'Hostname':<20} {'Input Device Type':<20} {'Detected Device Type':<20} {'Type Source':<12} {'Connection':<12} {'Retries':>7} {'Duration(s)':>11}\n")
+            f.write("-" * 113 + "\n")
+            for ip, (hostname, input_type, detected_type, connection_status, _, type_source) in detected_types.items():
+                duration = metrics.device_duration(ip) if metrics else None
+                duration = f"{duration:.2f}" if duration is not None else "-"
+                retries = metrics.device_retries(ip) if metrics else 0
+                f.write(f"{ip:<16} {hostname:<20} {input_type or 'None':<20} {detected_type or 'Failed':<20} {type_source:<12} {connection_status:<12} {retries:>7} {duration:>11}\n")
+            # Session limit chosen by -w auto over the run, one line per change
+            if concurrency:
+                f.write(f"\nConcurrency (-w auto)\n")
+                f.write(f"{'Elapsed(s)':>10} {'Sessions':>8}  Reason\n")
+                f.write("-" * 113 + "\n")
+                for elapsed, limit, reason in concurrency:
+                    f.write(f"{elapsed:>10.1f} {limit:>8}  {reason}\n")
+            # Device order from the duration history, predicted for a fixed session count
+            if schedule:
+                other, other_label = (schedule["csv_order"], "CSV order") if schedule["order"] == "longest" else (schedule["longest_first"], "Longest first")
+                f.write(f"\nSchedule (--order {schedule['order']})\n")
+                f.write("-" * 113 + "\n")
+                f.write(f"Sessions: {schedule['workers']}, devices with history: {schedule['known']}/{schedule['devices']}\n")
+                f.write(f"{'Predicted makespan(s)':<28} {schedule['predicted']:>9.1f}\n")
+                f.write(f"{other_label + ' predicted(s)':<28} {other:>9.1f}\n")
+                if schedule["actual"] is not None:
+                    f.write(f"{'Actual makespan(s)':<28} {schedule['actual']:>9.1f}\n")
         logger.info(f"Connection report saved to {filename}")
     except OSError as e:
         logger.error(f"Error saving connection report to {filename}: {str(e)}")
 
-# Execute commands on a single device
-def execute_commands(device_dict, output_dir, save_txt, detected_types):
+# Save per-device output to a text file
+# links: the commands an Unchanged device skipped, written as pointers to their stored output
+def save_text_output(output_dir, ip, hostname, device_type, commands, results, links=None):
+    logger = logging.getLogger(__name__)
+    filename = os.path.join(output_dir, f"{hostname}.txt")
+    try:
+        with open(filename, "w") as f:
+            f.write(f"##### OUTPUT FOR {ip} {hostname} ({device_type})\n")
+            f.write(f"##### WILL EXECUTE:\n")
+            for command in commands:
+                f.write(f"{command}\n")
+            for command, output in results.items():
+                f.write(f"##### EXECUTE CMD: {command}\n")
+                if is_reference(output):
+                    # A spilled output is copied from its file in chunks, never read whole
+                    with open(reference_path(output), "r", encoding="utf-8", newline="") as spill:
+                        shutil.copyfileobj(spill, f)
+                    f.write("\n\n")
+                else:
+                    f.write(f"{output}\n\n")
+            if links:
+                for command, output in linked_outputs(links).items():
+                    f.write(f"##### EXECUTE CMD: {command}\n")
+                    f.write(f"{output}\n\n")
+        logger.info(f"Text output saved to {filename}")
+    except OSError as e:
+        logger.error(f"Failed to save text output to {filename}: {str(e)}")
+
+# Channel slot on the jump host; waiting for one while all are in use is queueing, timed apart from the connect
+def reserve_channel(jump):
+    try:
+        return jump.reserve()
+    except OSError as e:
+        raise NetmikoTimeoutException(f"TCP connection to device failed: {str(e)}") from e
+
+# Open the TCP connection for Netmiko ourselves so connect time is measured apart from the SSH login;
+# behind a jump host it is a channel over one of the bastion's shared transports
+def open_socket(ip, port, timeout=CONN_TIMEOUT, jump=None, slot=None):
+    try:
+        if jump:
+            return jump.open_channel(ip, port, timeout, slot)
+        return socket.create_connection((ip, port), timeout=timeout)
+    except OSError as e:
+        raise NetmikoTimeoutException(f"TCP connection to device failed: {str(e)}") from e
+
+# A type autodetected by a failed attempt is reused by the next one instead of detecting again
+def known_type_of(device_dict, detected_types):
+    entry = detected_types.get(device_dict.get("ip", "Unknown"))
+    if not device_dict.get("device_type") and entry and entry[2] and entry[5] == "detected":
+        return entry[2], entry[5]
+    return None
+
+# Log and count a transient failure of an attempt; the type it autodetected and the backoff before the next one
+def next_attempt(device_dict, detected_types, metrics, retry, attempt, error):
+    logger = logging.getLogger(__name__)
+    ip = device_dict.get("ip", "Unknown")
+    delay = retry.delay(attempt)
+    metrics.record_retry(ip)
+    logger.warning(f"Transient failure on {ip}: {str(error)}, retry {attempt}/{retry.retries} in {delay:.1f}s")
+    return known_type_of(device_dict, detected_types), delay
+
+# Store the outputs of a pipelined group; commands left without output (read timeout) run one by one afterwards,
+# once the channel was drained up to the prompt after the group's last command.
+# The group shares its round trips, so each command is charged an equal part of the group's time
+def pipelined_results(ip, group, outputs, results, metrics, elapsed):
     logger = logging.getLogger(__name__)
-    start_msg = "===> {} Connection: {} | hostname: {} | input device type: {}, Detected Device Type: {}"
     received_msg = "<=== {} Received: {} for command: {}"
+    for command, output in zip(group, outputs):
+        results[command] = output
+        logger.debug(received_msg.format(datetime.now().time(), ip, command))
+        metrics.record_command(ip, command, elapsed / len(group), len(output))
+    if len(outputs) < len(group):
+        logger.warning(f"Pipelined output from {ip} incomplete at '{group[len(outputs)]}', running {len(group) - len(outputs)} commands one by one")
+    return len(outputs)
+
+# One attempt on one device, shared by the thread and async engines: type lookup, report entry, command results,
+# conditional collection and failure handling; the engines only differ in how they connect and send
+class DeviceRun:
+    def __init__(self, device_dict, detected_types, metrics, known_type=None, detect_cache=None):
+        logger = logging.getLogger(__name__)
+        self.device_dict = device_dict
+        self.detected_types = detected_types
+        self.metrics = metrics
+        self.detect_cache = detect_cache
+        self.ip = device_dict.get("ip", "Unknown")
+        self.hostname = device_dict.get("hostname", self.ip)
+        self.input_device_type = device_dict.get("device_type", "")
+        self.device_type = self.input_device_type
+        self.type_source = "csv"
+        self.results = {}
+        self.failed_commands = []
+        self.connection_status = "Failed"
+        self.retrying = False
+        self.unchanged = False
+        # Use the type found by an earlier attempt or the cached type; None is left for autodetection
+        if known_type:
+            self.device_type, self.type_source = known_type
+        elif not self.input_device_type and detect_cache:
+            self.device_type = detect_cache.get(self.ip, device_dict["port"])
+            if self.device_type:
+                self.type_source = "cache"
+                logger.info(f"Cached device type for {self.ip}: {self.device_type}")
+
+    # detected_types entry of the device; a device that ran every command up to an unchanged [probe] is Unchanged
+    def report(self):
+        status = "Unchanged" if self.unchanged else self.connection_status
+        self.detected_types[self.ip] = (self.hostname, self.input_device_type, self.device_type, status, self.failed_commands, self.type_source)
+
+    # Result of autodetection; False when the device is skipped
+    def detected(self, device_type):
+        logger = logging.getLogger(__name__)
+        self.device_type = device_type
+        self.report()
+        if not device_type:
+            logger.error(f"Skipping {self.ip} due to failed device type autodetection")
+            return False
+        if self.detect_cache:
+            self.detect_cache.set(self.ip, self.device_dict["port"], device_type)
+        return True
+
+    def log_start(self):
+        logger = logging.getLogger(__name__)
+        start_msg = "===> {} Connection: {} | hostname: {} | input device type: {}, Detected Device Type: {}"
+        logger.info(start_msg.format(datetime.now().strftime("%H:%M:%S.%f")[:-3], self.ip, self.hostname, self.input_device_type or "None",
+                                     self.device_type or "Failed"))
+
+    # Commands of the device; [probe] lines only run for --conditional
+    def commands_of(self, commands, conditional):
+        if commands is None:
+            commands = read_commands(self.device_dict["cmdfile"])
+        if conditional is None:
+            commands = without_probes(commands)
+        return commands
+
+    def connected(self):
+        self.connection_status = "Success"
+        self.report()
+
+    def output(self, command, output):
+        logger = logging.getLogger(__name__)
+        received_msg = "<=== {} Received: {} for command: {}"
+        self.results[command] = output
+        logger.debug(received_msg.format(datetime.now().time(), self.ip, command))
+
+    def command_failed(self, command, error):
+        logger = logging.getLogger(__name__)
+        logger.error(f"Failed to execute '{command}' on {self.ip}: {str(error)}")
+        self.failed_commands.append(command)
+        self.results[command] = f"Error: {str(error)}"
+
+    # A stalled pipelined group whose channel did not come back to the prompt: the complete outputs are kept and the
+    # rest of the group fails instead of running one by one, which also keeps the session out of the pool
+    def pipeline_desync(self, group, error, elapsed):
+        done = len(error.outputs)
+        pipelined_results(self.ip, group[:done], error.outputs, self.results, self.metrics, elapsed * done / len(group))
+        for command in group[done:]:
+            self.command_failed(command, error)
+        return len(group)
+
+    # Time a command run one by one; True once a [probe] answered as in the previous run, the rest is skipped
+    def command_done(self, command, command_start, conditional, commands):
+        logger = logging.getLogger(__name__)
+        self.metrics.record_command(self.ip, command, time.perf_counter() - command_start, output_size(self.results[command]))
+        if conditional and conditional.unchanged(self.ip, command, self.results[command], commands):
+            self.unchanged = True
+            logger.info(f"No change on {self.ip} since the previous run ('{command}'), skipped {len(commands) - len(self.results)} commands")
+        return self.unchanged
+
+    # Stored outputs the commands skipped after an unchanged [probe] point to
+    def links(self, conditional):
+        return conditional.links(self.ip, self.results) if self.unchanged else None
+
+    # Timeouts and resets get another attempt while the retry policy allows one
+    def retry_if_transient(self, error, retryable):
+        if retryable and is_transient(error):
+            self.retrying = True
+            raise TransientError(error) from error
+
+    # Outputs of a device whose session failed: once logged in, the commands not run yet fail with the reason,
+    # before that every command does
+    def session_failed(self, reason, commands):
+        logger = logging.getLogger(__name__)
+        if self.connection_status == "Success":
+            logger.error(f"Lost connection to {self.ip}: {reason}")
+            for command in commands:
+                if command not in self.results:
+                    self.failed_commands.append(command)
+                    self.results[command] = f"Error: {reason}"
+            self.report()
+            return self.results
+        logger.error(f"Failed to connect to {self.ip}: {reason}")
+        self.report()
+        return {command: f"Error: {reason}" for command in commands}
+
+    # A cached type that cannot connect may be stale, detect it again next run
+    def invalidate_stale_type(self):
+        logger = logging.getLogger(__name__)
+        if self.type_source == "cache" and self.connection_status != "Success" and not self.retrying:
+            logger.warning(f"Invalidating cached device type {self.device_type} for {self.ip}")
+            self.detect_cache.invalidate(self.ip, self.device_dict["port"])
+
+# Execute commands on a single device, timing the whole device as the "total" phase; timeouts and resets are retried with backoff.
+# With an AdaptiveLimit each attempt waits for a session slot, the backoff holds none
+def execute_commands(device_dict, output_dir, save_txt, detected_types, detect_cache=None, commands=None, metrics=None, retry=None, pipeline=0,
+                     limit=None, conditional=None, capture=None, sessions=None):
+    metrics = metrics if metrics is not None else RunMetrics()
+    retry = retry or NO_RETRY
     ip = device_dict.get("ip", "Unknown")
-    hostname = device_dict.get("hostname", ip)
-    input_device_type = device_dict.get("device_type", "")
-    results = {}
-    failed_commands = []
-    connection_status = "Failed"
-    
-    # Perform autodetection if device_type is empty
-    if not input_device_type:
-        detected_type = autodetect_device_type(device_dict)
-        if detected_type:
-            device_dict["device_type"] = detected_type
-            detected_types[ip] = (hostname, input_device_type, detected_type, connection_status, failed_commands)
-        else:
-            logger.error(f"Skipping {ip} due to failed device type autodetection")
-            detected_types[ip] = (hostname, input_device_type, None, connection_status, failed_commands)
+    known_type = None
+    with metrics.phase(ip, "total"):
+        for attempt in range(1, retry.retries + 2):
+            try:
+                with limit or nullcontext():
+                    return _execute_commands(dict(device_dict), output_dir, save_txt, detected_types, detect_cache, commands, metrics,
+                                             retryable=attempt <= retry.retries, known_type=known_type, pipeline=pipeline,
+                                             conditional=conditional, capture=capture, sessions=sessions)
+            except TransientError as e:
+                known_type, delay = next_attempt(device_dict, detected_types, metrics, retry, attempt, e)
+                time.sleep(delay)
+
+def _execute_commands(device_dict, output_dir, save_txt, detected_types, detect_cache, commands, metrics, retryable=False, known_type=None,
+                      pipeline=0, conditional=None, capture=None, sessions=None):
+    logger = logging.getLogger(__name__)
+    run = DeviceRun(device_dict, detected_types, metrics, known_type, detect_cache)
+    ip = run.ip
+
+    # Autodetection if device_type is empty and not cached, on a session of its own
+    if not run.device_type:
+        run.type_source = "detected"
+        with metrics.phase(ip, "detect"):
+            detected_type = autodetect_device_type(device_dict)
+        if not run.detected(detected_type):
             return {ip: {}}
-    else:
-        detected_types[ip] = (hostname, input_device_type, input_device_type, connection_status, failed_commands)
-    
-    device_type = device_dict["device_type"]
-    logger.info(start_msg.format(datetime.now().strftime("%H:%M:%S.%f")[:-3], ip, hostname, input_device_type or "None", device_type or "Failed"))
+    device_dict["device_type"] = run.device_type
+    run.report()
+    run.log_start()
 
-    commands = read_commands(device_dict["cmdfile"])
+    commands = run.commands_of(commands, conditional)
     if not commands:
         logger.error(f"No commands to execute for {ip}")
         return {ip: {}}
 
     try:
-        with ConnectHandler(
-            device_type=device_dict["device_type"],
+        # A warm session of the collector daemon skips connect, login and enable
+        ssh = sessions.checkout(device_dict) if sessions else None
+        reused = ssh is not None
+        if not reused:
+            jump = jumphost.jump_for(device_dict)
+            slot = None
+            if jump:
+                with metrics.phase(ip, "jump"):
+                    slot = reserve_channel(jump)
+            with metrics.phase(ip, "tcp"):
+                sock = open_socket(str(device_dict["ip"]), device_dict["port"], jump=jump, slot=slot)
+            try:
+                with metrics.phase(ip, "login"):
+                    ssh = ConnectHandler(
+                        device_type=device_dict["device_type"],
+                        ip=str(device_dict["ip"]),
+                        username=device_dict["username"],
+                        password=device_dict["password"],
+                        port=device_dict["port"],
+                        sock=sock
+                    )
+            except Exception:
+                sock.close()
+                raise
+        session = sessions.lease(device_dict, ssh, reused) if sessions else ssh
+        with session:
+            if reused:
+                logger.debug(f"Reusing pooled session to {ip}")
+            else:
+                with metrics.phase(ip, "enable"):
+                    ssh.enable()
+            run.connected()
+            with metrics.phase(ip, "commands"):
+                for group in command_groups(commands, pipeline):
+                    done = 0
+                    if len(group) > 1:
+                        group_start = time.perf_counter()
+                        try:
+                            outputs = send_pipelined(ssh, group)
+                            done = pipelined_results(ip, group, outputs, run.results, metrics, time.perf_counter() - group_start)
+                        except SESSION_ERRORS:
+                            raise
+                        except PipelineDesync as e:
+                            done = run.pipeline_desync(group, e, time.perf_counter() - group_start)
+                        except Exception as e:
+                            logger.warning(f"Pipelined read failed on {ip}: {str(e)}")
+                    for command in group[done:]:
+                        command_start = time.perf_counter()
+                        try:
+                            if capture:
+                                run.output(command, capture_command(ssh, command, capture.buffer(run.hostname, commands.index(command), command)))
+                            else:
+                                run.output(command, ssh.send_command(command))
+                        except SESSION_ERRORS:
+                            raise
+                        except Exception as e:
+                            # A dropped session only shows up as a read timeout, the remaining commands cannot run on it
+                            if getattr(ssh.remote_conn, "closed", False):
+                                raise ConnectionResetError(f"Session closed by {ip}") from e
+                            run.command_failed(command, e)
+                        if run.command_done(command, command_start, conditional, commands):
+                            break
+                    if run.unchanged:
+                        break
+            # Unchanged only in the report and outputs, the session itself succeeded
+            run.report()
+            # After a failed command the session may still be sending that output, it is not pooled
+            if sessions and run.failed_commands:
+                session.reusable = False
+    except SESSION_ERRORS + (ReadTimeout,) as e:
+        # Auth failures and other hard errors are reported right away, timeouts and resets get another attempt
+        run.retry_if_transient(e, retryable)
+        # A reset before login comes as a bare EOFError
+        return {ip: run.session_failed(str(e).strip() or type(e).__name__, commands)}
+    finally:
+        run.invalidate_stale_type()
+
+    if save_txt:
+        with metrics.phase(ip, "write"):
+            save_text_output(output_dir, ip, run.hostname, run.device_type, commands, run.results, run.links(conditional))
+    return {ip: run.results}
+
+# Execute commands on a single device on the event loop (async engine); the session slot is given back while backing off
+async def execute_commands_async(device_dict, output_dir, save_txt, detected_types, semaphore, executor, detect_cache=None, commands=None, metrics=None,
+                                 retry=None, pipeline=0, conditional=None, capture=None):
+    metrics = metrics if metrics is not None else RunMetrics()
+    retry = retry or NO_RETRY
+    ip = device_dict.get("ip", "Unknown")
+    known_type = None
+    with metrics.phase(ip, "total"):
+        for attempt in range(1, retry.retries + 2):
+            try:
+                return await _execute_commands_async(dict(device_dict), output_dir, save_txt, detected_types, semaphore, executor, detect_cache,
+                                                     commands, metrics, retryable=attempt <= retry.retries, known_type=known_type,
+                                                     pipeline=pipeline, conditional=conditional, capture=capture)
+            except TransientError as e:
+                known_type, delay = next_attempt(device_dict, detected_types, metrics, retry, attempt, e)
+                await asyncio.sleep(delay)
+
+async def _execute_commands_async(device_dict, output_dir, save_txt, detected_types, semaphore, executor, detect_cache, commands, metrics,
+                                  retryable=False, known_type=None, pipeline=0, conditional=None, capture=None):
+    logger = logging.getLogger(__name__)
+    loop = asyncio.get_running_loop()
+    run = DeviceRun(device_dict, detected_types, metrics, known_type, detect_cache)
+    ip = run.ip
+    # Detected on the session once it is open; a device that fails to connect is reported as in the thread engine
+    if not run.device_type:
+        run.type_source = "detected"
+
+    # Device types without an async driver run through Netmiko in the shared thread pool
+    if run.device_type and run.device_type not in async_engine.ASYNC_PLATFORMS:
+        logger.debug(f"No async driver for {run.device_type}, using Netmiko for {ip}")
+        async with semaphore:
+            return await run_netmiko_fallback(device_dict, run.device_type, run.type_source, output_dir, save_txt, detected_types, executor, detect_cache,
+                                              commands, metrics, retryable, pipeline, conditional, capture)
+
+    commands = run.commands_of(commands, conditional)
+    async with semaphore:
+        session = async_engine.AsyncSession(
             ip=str(device_dict["ip"]),
+            port=device_dict["port"],
             username=device_dict["username"],
             password=device_dict["password"],
-            port=device_dict["port"]
-        ) as ssh:
-            ssh.enable()
-            connection_status = "Success"
-            detected_types[ip] = (hostname, input_device_type, device_type, connection_status, failed_commands)
-            for command in commands:
-                try:
-                    output = ssh.send_command(command)
-                    results[command] = output
-                    logger.debug(received_msg.format(datetime.now().time(), ip, command))
-                except Exception as e:
-                    logger.error(f"Failed to execute '{command}' on {ip}: {str(e)}")
-                    failed_commands.append(command)
-                    results[command] = f"Error: {str(e)}"
-            detected_types[ip] = (hostname, input_device_type, device_type, connection_status, failed_commands)
-        
-        if save_txt:
-            filename = os.path.join(output_dir, f"{hostname}.txt")
+            jump=jumphost.async_jump_for(device_dict)
+        )
+        try:
+            if session.jump:
+                with metrics.phase(ip, "jump"):
+                    await session.wait_jump()
+            with metrics.phase(ip, "tcp"):
+                sock = await session.open_socket()
+            with metrics.phase(ip, "login"):
+                await session.open(sock=sock)
+            # Autodetection on the same session if device_type is empty and not cached
+            if not run.device_type:
+                with metrics.phase(ip, "detect"):
+                    detected_type = await session.autodetect()
+                if detected_type:
+                    logger.info(f"Autodetected device type for {ip}: {detected_type}")
+                else:
+                    logger.error(f"Failed to autodetect device type for {ip}: No matching device type found")
+                if not run.detected(detected_type):
+                    return {ip: {}}
+            run.report()
+            run.log_start()
+            if not commands:
+                logger.error(f"No commands to execute for {ip}")
+                return {ip: {}}
+
+            if run.device_type not in async_engine.ASYNC_PLATFORMS:
+                logger.debug(f"No async driver for detected type {run.device_type}, using Netmiko for {ip}")
+                await session.close()
+                return await run_netmiko_fallback(device_dict, run.device_type, run.type_source, output_dir, save_txt, detected_types, executor, commands=commands,
+                                                  metrics=metrics, retryable=retryable, pipeline=pipeline, conditional=conditional, capture=capture)
+
+            with metrics.phase(ip, "enable"):
+                await session.prepare(run.device_type)
+                await session.enable(run.device_type)
+            run.connected()
+            with metrics.phase(ip, "commands"):
+                for group in command_groups(commands, pipeline):
+                    done = 0
+                    if len(group) > 1:
+                        group_start = time.perf_counter()
+                        try:
+                            outputs = await session.send_commands(group)
+                            done = pipelined_results(ip, group, outputs, run.results, metrics, time.perf_counter() - group_start)
+                        except PipelineDesync as e:
+                            done = run.pipeline_desync(group, e, time.perf_counter() - group_start)
+                    for command in group[done:]:
+                        command_start = time.perf_counter()
+                        try:
+                            if capture:
+                                run.output(command, await session.capture_command(command, capture.buffer(run.hostname, commands.index(command), command)))
+                            else:
+                                run.output(command, await session.send_command(command))
+                        except asyncio.TimeoutError as e:
+                            run.command_failed(command, e)
+                        if run.command_done(command, command_start, conditional, commands):
+                            break
+                    if run.unchanged:
+                        break
+            run.report()
+        except async_engine.CONNECT_ERRORS as e:
+            run.retry_if_transient(e, retryable)
+            if not run.device_type:
+                logger.error(f"Failed to autodetect device type for {ip}: {str(e)}")
+                run.detected(None)
+                return {ip: {}}
+            results = run.session_failed(str(e), commands)
+            if run.connection_status != "Success":
+                return {ip: results}
+        finally:
+            await session.close()
+            run.invalidate_stale_type()
+
+    if save_txt:
+        with metrics.phase(ip, "write"):
+            await loop.run_in_executor(executor, save_text_output, output_dir, ip, run.hostname, run.device_type, commands, run.results,
+                                       run.links(conditional))
+    return {ip: run.results}
+
+# Run a device through the Netmiko thread path with a known device type, keeping the report's input type and type source
+async def run_netmiko_fallback(device_dict, device_type, type_source, output_dir, save_txt, detected_types, executor, detect_cache=None, commands=None, metrics=None,
+                               retryable=False, pipeline=0, conditional=None, capture=None):
+    loop = asyncio.get_running_loop()
+    ip = device_dict.get("ip", "Unknown")
+    input_device_type = device_dict.get("device_type", "")
+    fallback_device = dict(device_dict, device_type=device_type)
+    result = await loop.run_in_executor(executor, _execute_commands, fallback_device, output_dir, save_txt, detected_types, None, commands, metrics or RunMetrics(),
+                                        retryable, None, pipeline, conditional, capture)
+    hostname, _, detected_type, connection_status, failed_commands, _ = detected_types[ip]
+    detected_types[ip] = (hostname, input_device_type, detected_type, connection_status, failed_commands, type_source)
+    if type_source == "cache" and connection_status not in ("Success", "Unchanged"):
+        logging.getLogger(__name__).warning(f"Invalidating cached device type {device_type} for {ip}")
+        detect_cache.invalidate(ip, device_dict["port"])
+    return result
+
+# Report entry and outputs of a device the pre-flight probe found unreachable; it never takes an SSH worker
+def unreachable_result(device_dict, reason, detected_types, commands=None):
+    ip = device_dict["ip"]
+    if commands is None:
+        commands = read_commands(device_dict["cmdfile"])
+    input_device_type = device_dict.get("device_type", "")
+    detected_types[ip] = (device_dict.get("hostname", ip), input_device_type, input_device_type or None, "Unreachable", [], "csv")
+    # Without a probe output the next --conditional run collects the device in full
+    commands = without_probes(commands)
+    return {ip: {command: f"Error: {reason}" for command in commands}}
+
+# Record a finished device in the journal and hand its result to the sink, or keep it in data when no sink is used;
+# an Unchanged device carries the store links of the outputs it skipped
+def collect_result(result, data, detected_types, sink=None, journal=None, conditional=None):
+    links = {}
+    if conditional is not None:
+        links = {ip: conditional.links(ip, result[ip]) for ip in result if detected_types.get(ip, (None,) * 6)[3] == "Unchanged"}
+    if journal is not None:
+        for ip in result:
+            journal.record(ip, detected_types.get(ip), links.get(ip))
+    if sink is None:
+        data.update(result)
+        return
+    for ip in result:
+        hostname, _, device_type, connection_status, failed_commands, _ = detected_types.get(ip, (None, None, None, None, None, None))
+        sink.put({ip: result[ip]}, hostname, device_type, connection_status, links.get(ip), failed_commands)
+
+# Send commands to multiple devices on a single event loop
+async def send_command_to_devices_async(devices, max_sessions=16, output_dir="", save_txt=False, sink=None, detect_cache=None, metrics=None, retry=None,
+                                        journal=None, pipeline=0, limit=None, conditional=None, capture=None):
+    logger = logging.getLogger(__name__)
+    data = {}
+    detected_types = {}
+    if limit:
+        semaphore = AsyncAdaptiveLimit(limit)
+        max_sessions = limit.maximum
+    else:
+        semaphore = asyncio.Semaphore(max_sessions)
+
+    # Blocking work (file writes, Netmiko fallback) stays off the event loop
+    with ThreadPoolExecutor(max_workers=min(max_sessions, 32)) as executor:
+        task_list = [
+            asyncio.create_task(execute_commands_async(device, output_dir, save_txt, detected_types, semaphore, executor, detect_cache, metrics=metrics,
+                                                       retry=retry, pipeline=pipeline, conditional=conditional, capture=capture))
+            for device in devices
+        ]
+        logger.debug(f"Scheduled {len(task_list)} tasks on event loop")
+        # Drop our references so finished tasks and their outputs can be freed once handed to the sink
+        completed = asyncio.as_completed(task_list)
+        del task_list
+
+        for task in completed:
             try:
-                with open(filename, "w") as f:
-                    f.write(f"##### OUTPUT FOR {ip} {hostname} ({device_type})\n")
-                    f.write(f"##### WILL EXECUTE:\n")
-                    for command in commands:
-                        f.write(f"{command}\n")
-                    for command, output in results.items():
-                        f.write(f"##### EXECUTE CMD: {command}\n")
-                        f.write(f"{output}\n\n")
-                logger.info(f"Text output saved to {filename}")
-            except OSError as e:
-                logger.error(f"Failed to save text output to {filename}: {str(e)}")
-        
-        return {ip: results}
-    except (NetMikoAuthenticationException, NetmikoTimeoutException) as e:
-        logger.error(f"Failed to connect to {ip}: {str(e)}")
-        detected_types[ip] = (hostname, input_device_type, device_type, connection_status, failed_commands)
-        return {ip: {cmd: f"Error: {str(e)}" for cmd in commands}}
-
-# Send commands to multiple devices
-def send_command_to_devices(devices, max_workers=4, output_dir="", save_txt=False):
+                result = await task
+                logger.debug(f"Completed task for {list(result.keys())[0]}")
+                collect_result(result, data, detected_types, sink, journal, conditional)
+            except Exception as e:
+                logger.error(f"Unexpected error: {str(e)}")
+    await jumphost.close_async()
+
+    return data, detected_types
+
+# Send commands to multiple devices; with an AdaptiveLimit the number of sessions follows the limit instead of max_workers;
+# sessions is the collector daemon's SessionPool, used by the thread engine
+def send_command_to_devices(devices, max_workers=4, output_dir="", save_txt=False, engine="thread", sink=None, detect_cache=None, metrics=None, retry=None,
+                            journal=None, pipeline=0, limit=None, conditional=None, capture=None, sessions=None):
     logger = logging.getLogger(__name__)
+    if limit:
+        # The limit learns from the tcp and login phases of every device
+        metrics = metrics if metrics is not None else RunMetrics()
+        metrics.add_observer(limit.observe)
+    if engine == "async":
+        if not async_engine.is_available():
+            logger.error("Async engine requires asyncssh: pip install asyncssh")
+            sys.exit(1)
+        return asyncio.run(send_command_to_devices_async(devices, max_sessions=max_workers, output_dir=output_dir, save_txt=save_txt, sink=sink, detect_cache=detect_cache, metrics=metrics,
+                                                         retry=retry, journal=journal, pipeline=pipeline, limit=limit,
+                                                         conditional=conditional, capture=capture))
+
     data = {}
     detected_types = {}
     
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    with ThreadPoolExecutor(max_workers=limit.maximum if limit else max_workers) as executor:
         future_list = [
-            executor.submit(execute_commands, device, output_dir, save_txt, detected_types)
+            executor.submit(execute_commands, device, output_dir, save_txt, detected_types, detect_cache, metrics=metrics, retry=retry, pipeline=pipeline,
+                            limit=limit, conditional=conditional, capture=capture, sessions=sessions)
             for device in devices
         ]
         logger.debug(f"Submitted {len(future_list)} tasks to executor")
+        # Drop our references so finished futures and their outputs can be freed once handed to the sink
+        completed = as_completed(future_list)
+        del future_list
 
-        for future in as_completed(future_list):
+        for future in completed:
             try:
                 result = future.result()
                 logger.debug(f"Completed task for {list(result.keys())[0]}")
-                data.update(result)
+                collect_result(result, data, detected_types, sink, journal, conditional)
             except Exception as e:
                 logger.error(f"Unexpected error: {str(e)}")
     
     return data, detected_types
 
-# Save output to JSON
-def save_json_output(data, output_base, timestamp, output_structure):
-    logger = logging.getLogger(__name__)
+# Path of the batch-level JSON/JSONL output file
+def json_output_path(output_base, timestamp, output_structure, ext="json"):
     os.makedirs(OUTPUT_DIR_FULL, exist_ok=True)
     if output_structure == "option1":
         os.makedirs(os.path.join(OUTPUT_DIR_FULL, timestamp), exist_ok=True)
-        filename = os.path.join(OUTPUT_DIR_FULL, timestamp, f"{output_base}.json")
+        return os.path.join(OUTPUT_DIR_FULL, timestamp, f"{output_base}.{ext}")
     else:  # option2
-        filename = os.path.join(OUTPUT_DIR_FULL, f"{output_base}_{timestamp}.json")
+        return os.path.join(OUTPUT_DIR_FULL, f"{output_base}_{timestamp}.{ext}")
+
+# Content-addressed store of a batch run under output/store/
+def output_store(output_base, timestamp):
+    return OutputStore(os.path.join(OUTPUT_DIR_FULL, STORE_DIR), output_base, timestamp)
+
+# Directory of the outputs --capture writes to files; root keeps shards writing to the final output directory
+def capture_output_dir(output_base, timestamp, output_structure, root=None):
+    root = root or OUTPUT_DIR_FULL
+    if output_structure == "option1":
+        return os.path.join(root, timestamp, f"{output_base}_capture")
+    else:  # option2
+        return os.path.join(root, f"{output_base}_{timestamp}_capture")
+
+# Path of the run journal read by --resume
+def journal_path(output_base, timestamp):
+    return os.path.join(JOURNAL_DIR_FULL, f"journal_{output_base}_{timestamp}.jsonl")
+
+# Create the per-device text output directory
+def text_output_dir(output_base, timestamp, output_structure):
+    logger = logging.getLogger(__name__)
+    if output_structure == "option1":
+        output_dir = os.path.join(OUTPUT_DIR_FULL, timestamp, output_base)
+    else:  # option2
+        output_dir = os.path.join(OUTPUT_DIR_FULL, f"{output_base}_{timestamp}")
+    os.makedirs(output_dir, exist_ok=True)
+    logger.info(f"Output directory created: {output_dir}")
+    return output_dir
+
+# Save output to JSON
+def save_json_output(data, output_base, timestamp, output_structure):
+    logger = logging.getLogger(__name__)
+    filename = json_output_path(output_base, timestamp, output_structure)
     try:
         with open(filename, "w") as f:
             json.dump(data, f, indent=4)
@@ -292,47 +875,196 @@ def save_json_output(data, output_base, timestamp, output_structure):
     except OSError as e:
         logger.error(f"Error saving JSON output to {filename}: {str(e)}")
 
+# Command line options, also used by collectord.py to read job arguments with the same defaults
+def build_parser():
+    parser = argparse.ArgumentParser(description="Execute commands on network devices with configurable output structure and device type autodetection")
+    parser.add_argument("-i", "--input", required=True, help="CSV file name as input in config/ directory")
+    parser.add_argument("-o", "--outname", default=None, help="Base name for output folder and JSON file")
+    parser.add_argument("--cmdfile", default=None, help="Command file in cmd/ run on every device instead of the CSV's cmdfile column")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Enable debug logging")
+    parser.add_argument("-json", "--save-json", action="store_true", help="Save output to JSON file in output/ directory")
+    parser.add_argument("-jsonl", "--save-jsonl", action="store_true", help="Save output to JSON Lines file (one record per device) in output/ directory")
+    parser.add_argument("-txt", "--save-txt", action="store_true", help="Save per-device output to text files in output/ directory")
+    parser.add_argument("--store", action="store_true",
+                       help="Save outputs to the content-addressed store in output/store/ (each distinct output compressed once, one manifest per run)")
+    parser.add_argument("--parse", action="store_true",
+                       help="Parse outputs with TextFSM templates (ntc-templates and config/parse_templates.json) in a process pool into <name>.parsed.json")
+    parser.add_argument("--parse-workers", type=int, default=structured.DEFAULT_WORKERS,
+                       help=f"Parse processes (default: {structured.DEFAULT_WORKERS}, CPU count - 1)")
+    parser.add_argument("--parse-map", default=structured.DEFAULT_MAP,
+                       help=f"JSON file in config/ mapping device type and command to a template in templates/ (default: {structured.DEFAULT_MAP})")
+    parser.add_argument("--conditional", action="store_true",
+                       help="Run each device's [probe] cmdfile line first and skip the commands after it if the probe output matches the last --store run")
+    parser.add_argument("-w", "--workers", type=workers_arg, default=16,
+                       help="Number of parallel device connections, or auto to adjust it to login latency and connect errors during the run")
+    parser.add_argument("--auto-min", type=int, default=DEFAULT_MIN, help=f"Lowest session count for -w auto (default: {DEFAULT_MIN})")
+    parser.add_argument("--auto-max", type=int, default=DEFAULT_MAX, help=f"Highest session count for -w auto (default: {DEFAULT_MAX})")
+    parser.add_argument("--preflight", action="store_true",
+                       help="Probe every device's SSH port first and report the ones not answering as Unreachable without an SSH attempt")
+    parser.add_argument("--preflight-timeout", type=float, default=PREFLIGHT_TIMEOUT,
+                       help=f"Seconds a pre-flight TCP connect may take (default: {PREFLIGHT_TIMEOUT})")
+    parser.add_argument("-e", "--engine", choices=["thread", "async"], default="thread",
+                       help="Collection engine: thread (Netmiko, one thread per session) or async (asyncssh, all sessions on one event loop)")
+    parser.add_argument("-s", "--output-structure", choices=["option1", "option2"], default="option1", 
+                       help="Output folder structure: option1 (yyyymmdd_hhmmss/name.json) or option2 (name_yyyymmdd_hhmmss.json)")
+    parser.add_argument("--refresh-detect", action="store_true", help="Ignore cached device types, autodetect again and update the cache")
+    parser.add_argument("--no-detect-cache", action="store_true", help="Do not read or write the autodetect cache in cache/")
+    parser.add_argument("--detect-cache-ttl", type=float, default=168, help="Hours a cached device type stays valid (default: 168)")
+    parser.add_argument("--metrics", choices=["json", "prom", "both", "none"], default="json",
+                       help="Per-phase latency metrics in report/: json, prom (Prometheus textfile), both or none (default: json)")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES,
+                       help=f"Extra attempts for devices failing with a timeout or connection reset, auth failures are never retried (default: {DEFAULT_RETRIES})")
+    parser.add_argument("--retry-backoff", type=float, default=DEFAULT_BACKOFF,
+                       help=f"Seconds before the first retry, doubled on each further retry with jitter (default: {DEFAULT_BACKOFF})")
+    parser.add_argument("--retry-max-backoff", type=float, default=DEFAULT_MAX_BACKOFF,
+                       help=f"Upper bound in seconds for one retry backoff (default: {DEFAULT_MAX_BACKOFF})")
+    parser.add_argument("--resume", default=None, metavar="RUN_ID",
+                       help="Resume run yyyymmdd_hhmmss from its journal: finished devices are kept, pending and failed ones run again")
+    parser.add_argument("--no-journal", action="store_true", help="Do not write the run journal in journal/ (the run cannot be resumed)")
+    parser.add_argument("--capture", action="store_true",
+                       help="Read command output in chunks; outputs over --capture-spill go to files in <name>_capture/ and are referenced by file:// path")
+    parser.add_argument("--capture-spill", type=float, default=DEFAULT_SPILL_MB, metavar="MB",
+                       help=f"Output size kept in memory with --capture, larger outputs are written to a file (default: {DEFAULT_SPILL_MB:g})")
+    parser.add_argument("--capture-cap", type=float, default=DEFAULT_CAP_MB, metavar="MB",
+                       help=f"Largest output kept with --capture, the rest is dropped and marked as truncated (default: {DEFAULT_CAP_MB:g})")
+    parser.add_argument("--jump-host", default=None, metavar="[USER@]HOST[:PORT]",
+                       help="Reach devices through this SSH jump host, sessions multiplexed as channels over a few shared transports; "
+                            f"a CSV jump_host column overrides it per device, 'direct' skips it (password from ${jumphost.PASSWORD_ENV})")
+    parser.add_argument("--jump-key", default=None, help="Private key file for the jump host (default: ssh-agent and ~/.ssh keys)")
+    parser.add_argument("--jump-transports", type=int, default=jumphost.DEFAULT_TRANSPORTS,
+                       help=f"Most SSH transports opened to one jump host (default: {jumphost.DEFAULT_TRANSPORTS})")
+    parser.add_argument("--jump-channels", type=int, default=jumphost.DEFAULT_CHANNELS,
+                       help=f"Most device sessions on one jump host transport, keep it under the bastion's MaxSessions (default: {jumphost.DEFAULT_CHANNELS})")
+    parser.add_argument("--order", choices=ORDERS, default="csv",
+                       help="Device start order: csv (CSV order) or longest (longest collection in the duration history first) (default: csv)")
+    parser.add_argument("--no-history", action="store_true",
+                       help="Do not read or write the duration history in cache/; devices run in CSV order")
+    parser.add_argument("--pipeline", type=int, default=0, metavar="N",
+                       help="Write up to N commands to a session at once and split the output per command; [nopipe] cmdfile lines run alone (default: 0, off)")
+    return parser
+
 @count_time
-def main(args=None):
+def main(args=None, sessions=None):
     if args is None:
-        parser = argparse.ArgumentParser(description="Execute commands on network devices with configurable output structure and device type autodetection")
-        parser.add_argument("-i", "--input", required=True, help="CSV file name as input in config/ directory")
-        parser.add_argument("-o", "--outname", default=None, help="Base name for output folder and JSON file")
-        parser.add_argument("-v", "--verbose", action="store_true", help="Enable debug logging")
-        parser.add_argument("-json", "--save-json", action="store_true", help="Save output to JSON file in output/ directory")
-        parser.add_argument("-txt", "--save-txt", action="store_true", help="Save per-device output to text files in output/ directory")
-        parser.add_argument("-w", "--workers", type=int, default=16, help="Number of parallel device connections")
-        parser.add_argument("-s", "--output-structure", choices=["option1", "option2"], default="option1", 
-                           help="Output folder structure: option1 (yyyymmdd_hhmmss/name.json) or option2 (name_yyyymmdd_hhmmss.json)")
-        args = parser.parse_args()
+        args = build_parser().parse_args()
+
+    global DATETIME
+    resume = getattr(args, "resume", None)
+    if resume:
+        DATETIME = resume
 
     inname = Path(args.input).stem
     outname = args.outname if args.outname is not None else inname
 
-    setup_logging(verbose=args.verbose)
+    # Jobs of the collector daemon log to the daemon's log file
+    if sessions is None:
+        setup_logging(verbose=args.verbose)
     logger = logging.getLogger(__name__)
 
-    if args.save_txt:
-        if args.output_structure == "option1":
-            output_dir = os.path.join(OUTPUT_DIR_FULL, DATETIME, outname)
-        else:  # option2
-            output_dir = os.path.join(OUTPUT_DIR_FULL, f"{outname}_{DATETIME}")
-        os.makedirs(output_dir, exist_ok=True)
-        logger.info(f"Output directory created: {output_dir}")
-    else:
-        output_dir = ""
+    output_dir = text_output_dir(outname, DATETIME, args.output_structure) if args.save_txt else ""
 
     devices = read_devices(args.input)
+    devices = jumphost.apply_default(devices, getattr(args, "jump_host", None))
+    cmdfile = getattr(args, "cmdfile", None)
+    if cmdfile:
+        if not os.path.isfile(os.path.join(CMD_DIR_FULL, cmdfile)):
+            logger.error(f"Command file {os.path.join(CMD_DIR_FULL, cmdfile)} does not exist")
+            sys.exit(1)
+        devices = [dict(device, cmdfile=cmdfile) for device in devices]
+    conditional = None
+    if getattr(args, "conditional", False):
+        if not getattr(args, "store", False):
+            logger.error("--conditional compares with the previous run in the output store and needs --store")
+            sys.exit(1)
+        conditional = ConditionalCollection(previous_records(os.path.join(OUTPUT_DIR_FULL, STORE_DIR), outname, DATETIME))
+    capture = None
+    if getattr(args, "capture", False):
+        capture = Capture(capture_output_dir(outname, DATETIME, args.output_structure), args.capture_spill, args.capture_cap)
+        logger.info(f"Streaming capture: outputs over {args.capture_spill:g} MB written to {capture.directory}, cut at {args.capture_cap:g} MB")
+    parse_pool = None
+    if getattr(args, "parse", False):
+        if not structured.is_available():
+            logger.error("--parse requires textfsm: pip install textfsm ntc-templates")
+            sys.exit(1)
+        parse_pool = structured.ParsePool(args.parse_workers, args.parse_map)
 
-    result, detected_types = send_command_to_devices(
-        devices, max_workers=args.workers, output_dir=output_dir, save_txt=args.save_txt
+    # Device results are streamed to disk as they complete instead of being held for the whole batch
+    json_path = json_output_path(outname, DATETIME, args.output_structure) if args.save_json else None
+    jsonl_path = json_output_path(outname, DATETIME, args.output_structure, ext="jsonl") if args.save_jsonl else None
+    store = output_store(outname, DATETIME) if getattr(args, "store", False) else None
+    sink = ResultSink(
+        json_path=json_path,
+        jsonl_path=jsonl_path,
+        store=store,
+        parsed=structured.ParsedOutput(json_output_path(outname, DATETIME, args.output_structure, ext="parsed.json"), parse_pool) if parse_pool else None
     )
+    detect_cache = None
+    if not args.no_detect_cache:
+        detect_cache = DetectCache.open(ttl_hours=args.detect_cache_ttl, refresh=args.refresh_detect)
+    metrics = RunMetrics()
+    # Devices finished by the interrupted run are taken from its journal, only pending and failed ones connect again
+    finished = {}
+    previous = None
+    if resume:
+        # Read back from the interrupted run's outputs, which the sink is about to rewrite
+        previous = PreviousOutputs(json_path, jsonl_path, store).open()
+        records = load_journal(journal_path(outname, DATETIME))
+        if not records:
+            logger.warning(f"No journal for {outname} in run {DATETIME}, running every device")
+        ips = {device["ip"] for device in devices}
+        finished = {ip: record for ip, record in records.items() if ip in ips and is_complete(record)}
+        devices = [device for device in devices if device["ip"] not in finished]
+        logger.info(f"Resuming run {DATETIME}: {len(finished)} devices finished, {len(devices)} pending or failed devices to run")
+    journal = None
+    if not getattr(args, "no_journal", False):
+        journal = RunJournal(journal_path(outname, DATETIME), metrics).open()
+        logger.info(f"Journal at {journal.path}, an interrupted run can be resumed with --resume {DATETIME}")
+    limit = None
+    if args.workers == "auto":
+        limit = AdaptiveLimit(getattr(args, "auto_min", DEFAULT_MIN), getattr(args, "auto_max", DEFAULT_MAX))
+        logger.info(f"Adaptive concurrency: {limit.limit} sessions to start, between {limit.minimum} and {limit.maximum}")
+    history = None if getattr(args, "no_history", False) else DurationHistory.open()
+    schedule = None
+    detected_types = {}
+    with sink:
+        replay(finished, detected_types, sink, metrics, previous)
+        if getattr(args, "preflight", False):
+            devices, unreachable = preflight(devices, getattr(args, "preflight_timeout", PREFLIGHT_TIMEOUT), metrics=metrics)
+            for device, reason in unreachable:
+                collect_result(unreachable_result(device, reason, detected_types), {}, detected_types, sink, journal)
+        if history and devices:
+            devices, schedule = plan_order(devices, [device_key(device) for device in devices], history,
+                                           limit.limit if limit else args.workers, getattr(args, "order", "csv"))
+        start = time.perf_counter()
+        jumphost.open_run(args)
+        try:
+            _, run_detected_types = send_command_to_devices(
+                devices, max_workers=args.workers, output_dir=output_dir, save_txt=args.save_txt, engine=args.engine, sink=sink,
+                detect_cache=detect_cache, metrics=metrics, retry=policy_from_args(args), journal=journal, pipeline=getattr(args, "pipeline", 0),
+                limit=limit, conditional=conditional, capture=capture, sessions=sessions
+            )
+        finally:
+            jumphost.close_run()
+        if schedule:
+            schedule["actual"] = time.perf_counter() - start
+        detected_types.update(run_detected_types)
+    if parse_pool:
+        parse_pool.close()
+    if limit:
+        logger.info(f"Adaptive concurrency: {limit.summary()}")
+    if journal:
+        journal.close()
+    if detect_cache:
+        detect_cache.save()
+    if history:
+        record_run(history, [device_key(device) for device in devices], detected_types, metrics)
+        history.save()
 
     if detected_types:
-        save_connection_report(detected_types, outname, DATETIME, args.output_structure)
-
-    if args.save_json:
-        save_json_output(result, outname, DATETIME, args.output_structure)
+        save_connection_report(detected_types, outname, DATETIME, args.output_structure, metrics, limit.history if limit else None, schedule)
+    metrics_format = getattr(args, "metrics", "json")
+    if metrics_format != "none":
+        save_metrics(metrics, REPORT_DIR_FULL, outname, DATETIME, metrics_format)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
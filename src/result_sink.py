@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+import json
+import logging
+import queue
+import threading
+from conditional import linked_outputs
+version = '20261016'
+# Streaming result writer for JSON, JSON Lines, the output store and parsed output (20261016)
+
+QUEUE_SIZE = 1000
+_STOP = object()
+
+# Top-level entries of a JSON output written by ResultSink (or a parsed output), one device at a time: each entry starts
+# on a line indented by 4 spaces, so the file is never read whole; an entry cut short by a crash is skipped
+def json_entries(path):
+    logger = logging.getLogger(__name__)
+    lines = []
+
+    def entry():
+        text = "".join(lines).rstrip().rstrip(",")
+        try:
+            return json.loads("{" + text + "}")
+        except ValueError:
+            logger.warning(f"Skipping incomplete entry in {path}")
+            return {}
+
+    with open(path, "r") as f:
+        for line in f:
+            if line.startswith('    "') or line.rstrip() == "}":
+                if lines:
+                    yield from entry().items()
+                # The closing brace of the file ends the last entry
+                lines = [line] if line.startswith(" ") else []
+            elif lines:
+                lines.append(line)
+    if lines:
+        yield from entry().items()
+
+# Append one record per device to the JSON and/or JSONL file, and/or an OutputStore, from a dedicated writer thread;
+# a ParsedOutput gets each device's outputs for the parse pool
+class ResultSink:
+    def __init__(self, json_path=None, jsonl_path=None, queue_size=QUEUE_SIZE, store=None, parsed=None):
+        self.json_path = json_path
+        self.jsonl_path = jsonl_path
+        self.store = store
+        self.parsed = parsed
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self._writer, name="result-sink", daemon=True)
+        self.count = 0
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    # Called by SSH workers; only blocks if the writer is queue_size records behind
+    def put(self, result, hostname=None, device_type=None, connection_status=None, links=None, failed=None):
+        self.queue.put((result, hostname, device_type, connection_status, links, failed))
+
+    # Wait until every record put so far is written
+    def drain(self):
+        self.queue.join()
+
+    def close(self):
+        self.queue.put(_STOP)
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _writer(self):
+        logger = logging.getLogger(__name__)
+        json_file = jsonl_file = None
+        json_entries = 0
+        try:
+            if self.json_path:
+                json_file = open(self.json_path, "w")
+                json_file.write("{\n")
+            if self.jsonl_path:
+                jsonl_file = open(self.jsonl_path, "w")
+            if self.store:
+                self.store.open()
+            if self.parsed:
+                self.parsed.open()
+        except Exception as e:
+            logger.error(f"Error opening result sink: {str(e)}")
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            result, hostname, device_type, connection_status, links, failed = item
+            try:
+                for ip, outputs in result.items():
+                    if json_file:
+                        # Same layout as json.dump(data, indent=4), one top-level key at a time; the commands an
+                        # Unchanged device skipped point to their stored output
+                        entry = json.dumps({ip: dict(outputs, **linked_outputs(links)) if links else outputs}, indent=4)[2:-2]
+                        json_file.write(("" if json_entries == 0 else ",\n") + entry)
+                        json_entries += 1
+                        json_file.flush()
+                    if jsonl_file:
+                        record = {"ip": ip, "hostname": hostname, "device_type": device_type,
+                                  "connection": connection_status, "output": outputs}
+                        if links:
+                            record["links"] = links
+                        jsonl_file.write(json.dumps(record) + "\n")
+                        jsonl_file.flush()
+                    if self.store and self.store.manifest:
+                        self.store.add(ip, hostname, device_type, connection_status, outputs, links, failed)
+                    if self.parsed and self.parsed.file:
+                        self.parsed.add(ip, device_type, outputs, failed)
+                    self.count += 1
+            except Exception as e:
+                # Any error drops only this record; the writer keeps draining so put() and close() never block on a dead thread
+                logger.error(f"Error writing result for {list(result.keys())}: {str(e)}")
+            finally:
+                self.queue.task_done()
+        try:
+            if json_file:
+                json_file.write("\n}\n")
+                json_file.close()
+                logger.info(f"JSON output saved to {self.json_path}")
+            if jsonl_file:
+                jsonl_file.close()
+                logger.info(f"JSON Lines output saved to {self.jsonl_path}")
+            if self.store:
+                self.store.close()
+            if self.parsed:
+                # Waits for the devices still in the parse pool
+                self.parsed.close()
+        except Exception as e:
+            logger.error(f"Error closing result sink: {str(e)}")
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+import asyncio
+import random
+import socket
+import paramiko
+from netmiko import NetMikoAuthenticationException, NetmikoTimeoutException
+from netmiko.exceptions import ReadTimeout
+try:
+    import asyncssh
+except ImportError:
+    asyncssh = None
+version = '20261016'
+# Retry policy with backoff for transient connection failures (20261016)
+
+# Off unless asked for: a device fails on its first timeout or reset, as before retries existed
+DEFAULT_RETRIES = 0
+DEFAULT_BACKOFF = 1.0
+DEFAULT_MAX_BACKOFF = 30.0
+
+TIMEOUT_ERRORS = (TimeoutError, socket.timeout, asyncio.TimeoutError, NetmikoTimeoutException, ReadTimeout)
+RESET_ERRORS = (ConnectionResetError, ConnectionAbortedError, BrokenPipeError, EOFError)
+# Paramiko reports a peer that drops the transport as a plain SSHException ("Error reading SSH protocol banner", "Socket is closed")
+LOST_ERRORS = RESET_ERRORS + (paramiko.SSHException,) + ((asyncssh.DisconnectError,) if asyncssh else ())
+# Errors that mean the Netmiko session is gone, as opposed to one command failing
+SESSION_ERRORS = (OSError, EOFError, paramiko.SSHException)
+
+def is_auth_error(exc):
+    if isinstance(exc, (NetMikoAuthenticationException, paramiko.AuthenticationException)):
+        return True
+    return asyncssh is not None and isinstance(exc, asyncssh.PermissionDenied)
+
+# Timeouts and connection resets are worth another attempt; auth failures, refused and unreachable hosts are not.
+# The chain is followed because open_socket() wraps socket errors in NetmikoTimeoutException
+def is_transient(exc):
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if is_auth_error(exc):
+            return False
+        if exc.__cause__ is not None:
+            exc = exc.__cause__
+            continue
+        # Socket errors from the OS carry an errno (refused, unreachable); paramiko's "Socket is closed" does not
+        if isinstance(exc, OSError) and exc.errno is None:
+            return True
+        return isinstance(exc, TIMEOUT_ERRORS + LOST_ERRORS)
+    return False
+
+# Raised by an attempt that failed transiently and may be retried; carries the original error
+class TransientError(Exception):
+    def __init__(self, error):
+        super().__init__(str(error).strip() or type(error).__name__)
+        self.error = error
+
+# Attempt count and backoff schedule shared by both engines
+class RetryPolicy:
+    def __init__(self, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, max_backoff=DEFAULT_MAX_BACKOFF):
+        self.retries = max(0, retries)
+        self.backoff = max(0.0, backoff)
+        self.max_backoff = max(self.backoff, max_backoff)
+
+    # Exponential step capped at max_backoff, half of it fixed and half random so devices failing together spread out
+    def delay(self, attempt):
+        step = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return step / 2 + random.uniform(0, step / 2)
+
+NO_RETRY = RetryPolicy(retries=0)
+
+def policy_from_args(args):
+    return RetryPolicy(getattr(args, "retries", DEFAULT_RETRIES), getattr(args, "retry_backoff", DEFAULT_BACKOFF),
+                       getattr(args, "retry_max_backoff", DEFAULT_MAX_BACKOFF))
@@ -3,20 +3,39 @@ import os
 import logging
 import logging.config
 import argparse
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime
 from types import SimpleNamespace
 import sys
 import json
+import asyncio
+import math
+import time
+import multiprocessing
 import pyshcmd as pyshcmd
+import shard as shard
+from result_sink import ResultSink
+from detect_cache import DetectCache
+from scheduler import BatchScheduler, AsyncBatchScheduler, merge_devices
+from metrics import RunMetrics, save_metrics
+from retry import policy_from_args, DEFAULT_RETRIES, DEFAULT_BACKOFF, DEFAULT_MAX_BACKOFF
+from journal import RunJournal, PreviousOutputs, load_journal, is_complete, replay
+from preflight import preflight, DEFAULT_TIMEOUT as PREFLIGHT_TIMEOUT
+from adaptive import AdaptiveLimit, workers_arg, DEFAULT_MIN, DEFAULT_MAX
+from conditional import BatchConditional, previous_records, link_outputs, without_probes, shared_probes
+from store import STORE_DIR_FULL
+import structured
+import jumphost
+from duration_history import DurationHistory, ORDERS, device_key, plan_order, record_run
+from capture import Capture, DEFAULT_SPILL_MB, DEFAULT_CAP_MB
 version = '20250627'
 # Fixed --output-structure: option1 (timestamp/name), option2 (name_timestamp); removed run_batch_mp.py; added --verbose; aligned setup_logging with pyshcmd.py using JSON config (20250627_1508)
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
 
 # Configure logging using JSON configuration
-def setup_logging(verbose=False):
+def setup_logging(verbose=False, log_suffix=""):
     log_configs = {
         "dev": "logging.dev.json",
         "prod": "logging.prod.json"
@@ -24,7 +43,7 @@ def setup_logging(verbose=False):
     log_name = Path(os.path.basename(__file__)).stem
     log_config = log_configs.get('dev', "logging.dev.json")
     log_config_path = os.path.join(PARENT_DIR, CONFIG_DIR, log_config)
-    log_file_path = os.path.join(PARENT_DIR, LOG_DIR, f'{log_name}_{DATETIME}.log')
+    log_file_path = os.path.join(PARENT_DIR, LOG_DIR, f'{log_name}_{DATETIME}{log_suffix}.log')
     os.makedirs(LOG_DIR, exist_ok=True)
 
     with open(log_config_path, 'r') as f:
@@ -72,7 +91,13 @@ def validate_csv_files(csv_files):
             logger.error(f"CSV file {csv_path} does not exist")
     return valid_csvs
 
-def run_pyshcmd(csv_file, max_workers=16, verbose=False, save_json=False, save_txt=False, output_structure="option1"):
+def run_pyshcmd(csv_file, max_workers=16, verbose=False, save_json=False, save_txt=False, output_structure="option1", engine="thread", save_jsonl=False,
+                refresh_detect=False, no_detect_cache=False, detect_cache_ttl=168, metrics="json", retries=DEFAULT_RETRIES,
+                retry_backoff=DEFAULT_BACKOFF, retry_max_backoff=DEFAULT_MAX_BACKOFF, resume=None, no_journal=False, pipeline=0,
+                auto_min=DEFAULT_MIN, auto_max=DEFAULT_MAX, preflight=False, preflight_timeout=PREFLIGHT_TIMEOUT, store=False,
+                conditional=False, parse=False, parse_workers=structured.DEFAULT_WORKERS, parse_map=structured.DEFAULT_MAP,
+                capture=False, capture_spill=DEFAULT_SPILL_MB, capture_cap=DEFAULT_CAP_MB, jump_host=None, jump_key=None,
+                jump_transports=jumphost.DEFAULT_TRANSPORTS, jump_channels=jumphost.DEFAULT_CHANNELS, order="csv", no_history=False):
     logger = logging.getLogger(__name__)
     try:
         logger.info(f"Starting execution for {csv_file}")
@@ -82,9 +107,39 @@ def run_pyshcmd(csv_file, max_workers=16, verbose=False, save_json=False, save_t
             outname=None,  # Use default (CSV stem)
             verbose=verbose,
             save_json=save_json,
+            save_jsonl=save_jsonl,
             save_txt=save_txt,
             workers=max_workers,
-            output_structure=output_structure
+            output_structure=output_structure,
+            engine=engine,
+            refresh_detect=refresh_detect,
+            no_detect_cache=no_detect_cache,
+            detect_cache_ttl=detect_cache_ttl,
+            metrics=metrics,
+            retries=retries,
+            retry_backoff=retry_backoff,
+            retry_max_backoff=retry_max_backoff,
+            resume=resume,
+            no_journal=no_journal,
+            pipeline=pipeline,
+            auto_min=auto_min,
+            auto_max=auto_max,
+            preflight=preflight,
+            preflight_timeout=preflight_timeout,
+            store=store,
+            conditional=conditional,
+            parse=parse,
+            parse_workers=parse_workers,
+            parse_map=parse_map,
+            capture=capture,
+            capture_spill=capture_spill,
+            capture_cap=capture_cap,
+            jump_host=jump_host,
+            jump_key=jump_key,
+            jump_transports=jump_transports,
+            jump_channels=jump_channels,
+            order=order,
+            no_history=no_history
         )
         
         pyshcmd.main(args)
@@ -95,17 +150,348 @@ def run_pyshcmd(csv_file, max_workers=16, verbose=False, save_json=False, save_t
         logger.error(f"Error executing {csv_file}: {str(e)}")
         return csv_file, 1, "", str(e)
 
-def main():
+# Split one merged job's result back into each member CSV's report, text file, JSON sink and journal
+def distribute_result(job, result, states, save_txt):
+    job_detected = job.pop("detected_types", {})
+    for csv_file, device, commands in job["members"]:
+        state = states[csv_file]
+        ip = device["ip"]
+        # Already taken from this CSV's journal on --resume, the device only ran for another CSV
+        if ip in state["finished"]:
+            continue
+        results = result.get(ip, {})
+        csv_results = {cmd: results[cmd] for cmd in commands if cmd in results}
+        _, _, detected_type, connection_status, failed_commands, type_source = job_detected.get(
+            ip, (None, None, None, "Failed", [], "csv"))
+        state["detected_types"][ip] = (device["hostname"], device["device_type"], detected_type, connection_status,
+                                       [cmd for cmd in failed_commands if cmd in commands], type_source)
+        # Unchanged for the shared session means unchanged for every member, each links its own commands to its previous run
+        links = link_outputs(state["previous"][ip], commands, csv_results) if connection_status == "Unchanged" else None
+        if save_txt and connection_status in ("Success", "Unchanged"):
+            pyshcmd.save_text_output(state["output_dir"], ip, device["hostname"], detected_type, commands, csv_results, links)
+        state["sink"].put({ip: csv_results}, device["hostname"], detected_type, connection_status, links, state["detected_types"][ip][4])
+        if state["journal"]:
+            state["journal"].record(ip, state["detected_types"][ip], links)
+
+def run_jobs_thread(jobs, scheduler, states, save_txt, detect_cache, metrics=None, retry=None, pipeline=0, conditional=None, capture=None):
+    logger = logging.getLogger(__name__)
+
+    def run_job(job):
+        job["detected_types"] = {}
+        return pyshcmd.execute_commands(dict(job["device"]), "", False, job["detected_types"], detect_cache, commands=job["commands"],
+                                         metrics=metrics, retry=retry, pipeline=pipeline, conditional=conditional, capture=capture)
+
+    for job, future in scheduler.run(jobs, run_job):
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.error(f"Unexpected error for {job['device']['ip']}: {str(e)}")
+            result = {}
+        distribute_result(job, result, states, save_txt)
+
+async def run_jobs_async(jobs, scheduler, states, save_txt, detect_cache, metrics=None, retry=None, pipeline=0, conditional=None, capture=None):
+    logger = logging.getLogger(__name__)
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=min(scheduler.max_sessions, 32)) as executor:
+        async def run_job(job, limit):
+            job["detected_types"] = {}
+            return await pyshcmd.execute_commands_async(dict(job["device"]), "", False, job["detected_types"], limit, executor,
+                                                        detect_cache, commands=job["commands"], metrics=metrics, retry=retry, pipeline=pipeline,
+                                                        conditional=conditional, capture=capture)
+
+        async for job, result in scheduler.run_async(jobs, run_job):
+            if isinstance(result, Exception):
+                logger.error(f"Unexpected error for {job['device']['ip']}: {str(result)}")
+                result = {}
+            await loop.run_in_executor(executor, distribute_result, job, result, states, save_txt)
+    await jumphost.close_async()
+
+# Run every CSV of the batch through one scheduler; each CSV still gets its own JSON, text files and report
+def run_shared_batch(csv_files, args, shard_spec=None):
+    logger = logging.getLogger(__name__)
+    csv_devices = {}
+    for csv_file in csv_files:
+        try:
+            csv_devices[csv_file] = jumphost.apply_default(pyshcmd.read_devices(csv_file), args.jump_host)
+        except SystemExit:
+            logger.error(f"Failed to process {csv_file}: invalid CSV, skipped")
+    if not csv_devices:
+        logger.error("No devices to process")
+        return
+
+    # Without --conditional the [probe] lines are dropped before merging, so they never reach a session, text file or output
+    read_commands = pyshcmd.read_commands if args.conditional else lambda cmdfile: without_probes(pyshcmd.read_commands(cmdfile))
+    jobs = merge_devices(csv_devices, read_commands)
+    if shard_spec:
+        index, count = shard_spec
+        jobs = [job for job in jobs if shard.shard_of(job["device"], count) == index]
+        logger.info(f"Shard {index}/{count}: {len(jobs)} devices assigned")
+    metrics = RunMetrics()
+    resume = getattr(args, "resume", None)
+    # One parse pool for every CSV of the batch
+    parse_pool = structured.ParsePool(args.parse_workers, args.parse_map) if args.parse else None
+    states = {}
+    # Sinks and journals are closed however the run ends, so the writer threads finish and the files are complete
+    try:
+        for csv_file in csv_devices:
+            outname = Path(csv_file).stem
+            journal_path = pyshcmd.journal_path(outname, pyshcmd.DATETIME)
+            json_path = pyshcmd.json_output_path(outname, pyshcmd.DATETIME, args.output_structure) if args.save_json else None
+            jsonl_path = pyshcmd.json_output_path(outname, pyshcmd.DATETIME, args.output_structure, ext="jsonl") if args.save_jsonl else None
+            store = pyshcmd.output_store(outname, pyshcmd.DATETIME) if args.store else None
+            finished = {}
+            previous = None
+            if resume:
+                # Read back from the interrupted run's outputs, which the sink is about to rewrite
+                previous = PreviousOutputs(json_path, jsonl_path, store).open()
+                ips = {device["ip"] for device in csv_devices[csv_file]}
+                finished = {ip: record for ip, record in load_journal(journal_path).items() if ip in ips and is_complete(record)}
+            states[csv_file] = {
+                "outname": outname,
+                "output_dir": pyshcmd.text_output_dir(outname, pyshcmd.DATETIME, args.output_structure) if args.save_txt else "",
+                "sink": ResultSink(
+                    json_path=json_path,
+                    jsonl_path=jsonl_path,
+                    store=store,
+                    parsed=structured.ParsedOutput(pyshcmd.json_output_path(outname, pyshcmd.DATETIME, args.output_structure, ext="parsed.json"),
+                                                   parse_pool) if parse_pool else None
+                ).start(),
+                "detected_types": {},
+                "finished": finished,
+                "journal": None if args.no_journal else RunJournal(journal_path, metrics).open(),
+                # Shards stage their outputs apart but compare with the merged runs in the main store
+                "previous": previous_records(STORE_DIR_FULL, outname, pyshcmd.DATETIME) if args.conditional else {}
+            }
+            replay(finished, states[csv_file]["detected_types"], states[csv_file]["sink"], metrics, previous)
+        if resume:
+            # A device shared by several CSVs runs again as soon as one of them has not finished it
+            pending = [job for job in jobs if any(device["ip"] not in states[csv_file]["finished"] for csv_file, device, _ in job["members"])]
+            logger.info(f"Resuming run {pyshcmd.DATETIME}: {len(jobs) - len(pending)} devices finished, {len(pending)} pending or failed devices to run")
+            jobs = pending
+        if args.preflight:
+            # Unreachable devices go straight to every member CSV's report and outputs
+            _, unreachable = preflight([job["device"] for job in jobs], args.preflight_timeout, metrics=metrics)
+            reasons = {(device["ip"], device["port"]): reason for device, reason in unreachable}
+            reachable = []
+            for job in jobs:
+                reason = reasons.get((job["device"]["ip"], job["device"]["port"]))
+                if reason is None:
+                    reachable.append(job)
+                    continue
+                job["detected_types"] = {}
+                result = pyshcmd.unreachable_result(job["device"], reason, job["detected_types"], job["commands"])
+                distribute_result(job, result, states, args.save_txt)
+            jobs = reachable
+
+        conditional = None
+        if args.conditional:
+            # Previous record and commands of every CSV still collecting the device
+            members = {job["device"]["ip"]: [(states[csv_file]["previous"].get(device["ip"]), commands)
+                                              for csv_file, device, commands in job["members"]
+                                              if device["ip"] not in states[csv_file]["finished"]]
+                       for job in jobs}
+            for job in jobs:
+                job["commands"] = shared_probes(job["commands"], [commands for _, commands in members[job["device"]["ip"]]])
+            conditional = BatchConditional(members)
+
+        capture = None
+        if args.capture:
+            # A merged device's spill files are shared by its CSVs, so they go to one directory for the batch; shards
+            # write there directly, the references in their JSON stay valid after --merge
+            capture_dir = pyshcmd.capture_output_dir(Path(args.batch).stem, pyshcmd.DATETIME, args.output_structure,
+                                                     root=os.path.join(pyshcmd.PARENT_DIR, pyshcmd.OUTPUT_DIR))
+            capture = Capture(capture_dir, args.capture_spill, args.capture_cap)
+            logger.info(f"Streaming capture: outputs over {args.capture_spill:g} MB written to {capture_dir}, cut at {args.capture_cap:g} MB")
+
+        detect_cache = None
+        if not args.no_detect_cache:
+            detect_cache = DetectCache.open(ttl_hours=args.detect_cache_ttl, refresh=args.refresh_detect)
+        group_caps = {"subnet": args.subnet_cap, "site": args.site_cap}
+        retry = policy_from_args(args)
+        limit = None
+        if args.max_sessions == "auto":
+            limit = AdaptiveLimit(args.auto_min, args.auto_max)
+            metrics.add_observer(limit.observe)
+        # Shards always keep JSON metrics, --merge rebuilds the batch metrics and report durations from them
+        metrics_format = args.metrics
+        if shard_spec and metrics_format in ("none", "prom"):
+            metrics_format = "json" if metrics_format == "none" else "both"
+        # A merged device's duration is that of the union of its CSVs' cmdfiles
+        keys = [device_key(job["device"], [device["cmdfile"] for _, device, _ in job["members"]]) for job in jobs]
+        history = None if args.no_history else DurationHistory.open()
+        schedule = None
+        if history and jobs:
+            jobs, schedule = plan_order(jobs, keys, history, limit.limit if limit else args.max_sessions, args.order)
+        sessions = f"auto ({limit.minimum}-{limit.maximum}, starting at {limit.limit})" if limit else args.max_sessions
+        logger.info(f"Scheduling {len(jobs)} devices from {len(csv_devices)} CSV files: max sessions {sessions}, "
+                    f"per-subnet cap {args.subnet_cap or 'none'} (/{args.subnet_prefix}), per-site cap {args.site_cap or 'none'}")
+        start = time.perf_counter()
+        jumphost.open_run(args)
+        try:
+            if args.engine == "async":
+                scheduler = AsyncBatchScheduler(args.max_sessions, group_caps, args.subnet_prefix, limit)
+                asyncio.run(run_jobs_async(jobs, scheduler, states, args.save_txt, detect_cache, metrics, retry, args.pipeline, conditional, capture))
+            else:
+                scheduler = BatchScheduler(args.max_sessions, group_caps, args.subnet_prefix, limit)
+                run_jobs_thread(jobs, scheduler, states, args.save_txt, detect_cache, metrics, retry, args.pipeline, conditional, capture)
+        finally:
+            jumphost.close_run()
+        if schedule:
+            schedule["actual"] = time.perf_counter() - start
+        if detect_cache:
+            detect_cache.save()
+        if history:
+            detected_types = {}
+            for state in states.values():
+                detected_types.update(state["detected_types"])
+            record_run(history, keys, detected_types, metrics)
+            history.save()
+        if limit:
+            logger.info(f"Adaptive concurrency: {limit.summary()}")
+
+    finally:
+        for state in states.values():
+            state["sink"].close()
+            if state["journal"]:
+                state["journal"].close()
+        if parse_pool:
+            parse_pool.close()
+
+    for csv_file, state in states.items():
+        if state["detected_types"]:
+            pyshcmd.save_connection_report(state["detected_types"], state["outname"], pyshcmd.DATETIME, args.output_structure, metrics,
+                                           limit.history if limit else None, schedule)
+            if shard_spec:
+                shard.save_shard_state(state["detected_types"], state["outname"], pyshcmd.DATETIME, limit.history if limit else None, schedule)
+            if metrics_format != "none":
+                save_metrics(metrics, pyshcmd.REPORT_DIR_FULL, state["outname"], pyshcmd.DATETIME, metrics_format,
+                             ips=set(state["detected_types"]))
+        logger.info(f"Successfully processed {csv_file}")
+    return states
+
+# Entry point of one --processes worker: own interpreter, own logging, own shard staging directory
+def run_shard_process(csv_files, args, index, count, run_id):
+    global DATETIME
+    DATETIME = run_id
+    setup_logging(verbose=args.verbose, log_suffix=f"_shard{index}of{count}")
+    shard.use_shard_dirs(run_id, index, count)
+    run_shared_batch(csv_files, args, shard_spec=(index, count))
+    return index
+
+# Split the batch over worker processes by device hash, then merge their outputs into the normal layout
+def run_processes(csv_files, args, run_id):
+    logger = logging.getLogger(__name__)
+    count = args.processes
+    # The global and per-group caps apply to the whole batch, so each process gets its share
+    shard_args = SimpleNamespace(**vars(args))
+    if args.max_sessions == "auto":
+        shard_args.auto_min = max(1, math.ceil(args.auto_min / count))
+        shard_args.auto_max = max(1, math.ceil(args.auto_max / count))
+    else:
+        shard_args.max_sessions = max(1, math.ceil(args.max_sessions / count))
+    shard_args.subnet_cap = math.ceil(args.subnet_cap / count) if args.subnet_cap else 0
+    shard_args.site_cap = math.ceil(args.site_cap / count) if args.site_cap else 0
+    shard_args.parse_workers = max(1, math.ceil(args.parse_workers / count))
+    sessions = f"auto {shard_args.auto_min}-{shard_args.auto_max}" if args.max_sessions == "auto" else shard_args.max_sessions
+    logger.info(f"Starting {count} worker processes for run {run_id}, {sessions} sessions each")
+    with ProcessPoolExecutor(max_workers=count, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(run_shard_process, csv_files, shard_args, index, count, run_id) for index in range(1, count + 1)]
+        for future in as_completed(futures):
+            try:
+                logger.info(f"Shard {future.result()}/{count} finished")
+            except Exception as e:
+                logger.error(f"Shard process failed: {str(e)}")
+    shard.merge_shards(run_id, [Path(csv_file).stem for csv_file in csv_files], args.output_structure, args.metrics)
+
+# Command line options, also used by benchmark.py to build run_shared_batch arguments with the same defaults
+def build_parser():
     parser = argparse.ArgumentParser(description="Run pyshcmd for CSV files listed in a batch file with optional JSON/text output and structure")
     parser.add_argument("-b", "--batch", required=True, help="Batch file in config/ (e.g., run_batch1.txt)")
     parser.add_argument("-json", "--save-json", action="store_true", help="Save output to JSON file in output/ directory")
+    parser.add_argument("-jsonl", "--save-jsonl", action="store_true", help="Save output to JSON Lines file for each CSV in output/ directory")
     parser.add_argument("-txt", "--save-txt", action="store_true", help="Save per-device output to text files in output/ directory")
+    parser.add_argument("--store", action="store_true",
+                       help="Save outputs of each CSV to the content-addressed store in output/store/ (one manifest per CSV and run)")
+    parser.add_argument("--parse", action="store_true",
+                       help="Parse outputs with TextFSM templates in one process pool for the batch into <name>.parsed.json per CSV")
+    parser.add_argument("--parse-workers", type=int, default=structured.DEFAULT_WORKERS,
+                       help=f"Parse processes (default: {structured.DEFAULT_WORKERS}, CPU count - 1); with --processes each process gets its share")
+    parser.add_argument("--parse-map", default=structured.DEFAULT_MAP,
+                       help=f"JSON file in config/ mapping device type and command to a template in templates/ (default: {structured.DEFAULT_MAP})")
+    parser.add_argument("--capture", action="store_true",
+                       help="Read command output in chunks; outputs over --capture-spill go to files in <batch>_capture/ and are referenced by file:// path")
+    parser.add_argument("--capture-spill", type=float, default=DEFAULT_SPILL_MB, metavar="MB",
+                       help=f"Output size kept in memory with --capture, larger outputs are written to a file (default: {DEFAULT_SPILL_MB:g})")
+    parser.add_argument("--capture-cap", type=float, default=DEFAULT_CAP_MB, metavar="MB",
+                       help=f"Largest output kept with --capture, the rest is dropped and marked as truncated (default: {DEFAULT_CAP_MB:g})")
+    parser.add_argument("--conditional", action="store_true",
+                       help="Run each device's [probe] cmdfile line first and skip the commands after it if the probe output matches the CSV's last --store run")
     parser.add_argument("-v", "--verbose", action="store_true", help="Enable debug logging for console")
     parser.add_argument("-s", "--output-structure", choices=["option1", "option2"], default="option1", 
                        help="Output folder structure: option1 (yyyymmdd_hhmmss/name.json) or option2 (name_yyyymmdd_hhmmss.json)")
+    parser.add_argument("-e", "--engine", choices=["thread", "async"], default="thread",
+                       help="Collection engine passed to pyshcmd: thread (Netmiko) or async (asyncssh)")
+    parser.add_argument("--refresh-detect", action="store_true", help="Ignore cached device types, autodetect again and update the cache")
+    parser.add_argument("--no-detect-cache", action="store_true", help="Do not read or write the autodetect cache in cache/")
+    parser.add_argument("--detect-cache-ttl", type=float, default=168, help="Hours a cached device type stays valid (default: 168)")
+    parser.add_argument("--per-csv", action="store_true", help="Legacy mode: run each CSV as its own pyshcmd run with its own worker pool")
+    parser.add_argument("-w", "--max-sessions", type=workers_arg, default=16,
+                       help="Global cap on concurrent device sessions across the whole batch, or auto to adjust it to login latency and connect errors")
+    parser.add_argument("--auto-min", type=int, default=DEFAULT_MIN, help=f"Lowest session cap for -w auto (default: {DEFAULT_MIN})")
+    parser.add_argument("--auto-max", type=int, default=DEFAULT_MAX, help=f"Highest session cap for -w auto (default: {DEFAULT_MAX})")
+    parser.add_argument("--preflight", action="store_true",
+                       help="Probe every device's SSH port first and report the ones not answering as Unreachable without an SSH attempt")
+    parser.add_argument("--preflight-timeout", type=float, default=PREFLIGHT_TIMEOUT,
+                       help=f"Seconds a pre-flight TCP connect may take (default: {PREFLIGHT_TIMEOUT})")
+    parser.add_argument("--subnet-cap", type=int, default=0, help="Max concurrent sessions per subnet (0 = no cap)")
+    parser.add_argument("--subnet-prefix", type=int, default=24, help="Prefix length used to group devices for --subnet-cap")
+    parser.add_argument("--site-cap", type=int, default=0, help="Max concurrent sessions per value of the optional CSV 'site' column (0 = no cap)")
+    parser.add_argument("--processes", type=int, default=1, help="Split devices by hash over N worker processes and merge their outputs")
+    parser.add_argument("--shard", default=None, help="Run only shard i/N of the batch (e.g. 2/4), outputs go to output/shards/<run-id>/")
+    parser.add_argument("--run-id", default=None, help="Timestamp shared by all shards of one run (yyyymmdd_hhmmss, default: now)")
+    parser.add_argument("--merge", action="store_true", help="Merge output/shards/<run-id>/ into the normal output and report layout")
+    parser.add_argument("--metrics", choices=["json", "prom", "both", "none"], default="json",
+                       help="Per-phase latency metrics for each CSV in report/: json, prom (Prometheus textfile), both or none (default: json)")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES,
+                       help=f"Extra attempts for devices failing with a timeout or connection reset, auth failures are never retried (default: {DEFAULT_RETRIES})")
+    parser.add_argument("--retry-backoff", type=float, default=DEFAULT_BACKOFF,
+                       help=f"Seconds before the first retry, doubled on each further retry with jitter (default: {DEFAULT_BACKOFF})")
+    parser.add_argument("--retry-max-backoff", type=float, default=DEFAULT_MAX_BACKOFF,
+                       help=f"Upper bound in seconds for one retry backoff (default: {DEFAULT_MAX_BACKOFF})")
+    parser.add_argument("--resume", default=None, metavar="RUN_ID",
+                       help="Resume run yyyymmdd_hhmmss from its journals: finished devices are kept, pending and failed ones run again")
+    parser.add_argument("--no-journal", action="store_true", help="Do not write run journals in journal/ (the run cannot be resumed)")
+    parser.add_argument("--jump-host", default=None, metavar="[USER@]HOST[:PORT]",
+                       help="Reach devices through this SSH jump host, every session of the batch multiplexed over a few shared transports; "
+                            f"a CSV jump_host column overrides it per device, 'direct' skips it (password from ${jumphost.PASSWORD_ENV})")
+    parser.add_argument("--jump-key", default=None, help="Private key file for the jump host (default: ssh-agent and ~/.ssh keys)")
+    parser.add_argument("--jump-transports", type=int, default=jumphost.DEFAULT_TRANSPORTS,
+                       help=f"Most SSH transports opened to one jump host, per process (default: {jumphost.DEFAULT_TRANSPORTS})")
+    parser.add_argument("--jump-channels", type=int, default=jumphost.DEFAULT_CHANNELS,
+                       help=f"Most device sessions on one jump host transport, keep it under the bastion's MaxSessions (default: {jumphost.DEFAULT_CHANNELS})")
+    parser.add_argument("--order", choices=ORDERS, default="csv",
+                       help="Device start order: csv (CSV order) or longest (longest collection in the duration history first) (default: csv)")
+    parser.add_argument("--no-history", action="store_true",
+                       help="Do not read or write the duration history in cache/; devices run in CSV order")
+    parser.add_argument("--pipeline", type=int, default=0, metavar="N",
+                       help="Write up to N commands to a session at once and split the output per command; [nopipe] cmdfile lines run alone (default: 0, off)")
+    return parser
+
+def main():
+    parser = build_parser()
     args = parser.parse_args()
 
-    logger = setup_logging(verbose=args.verbose)
+    if args.parse and not structured.is_available():
+        parser.error("--parse requires textfsm: pip install textfsm ntc-templates")
+    if args.conditional and not args.store:
+        parser.error("--conditional compares with the previous run in the output store and needs --store")
+    if args.resume and args.run_id and args.resume != args.run_id:
+        parser.error(f"--resume {args.resume} and --run-id {args.run_id} name different runs")
+    args.run_id = args.run_id or args.resume
+    if args.run_id:
+        global DATETIME
+        DATETIME = pyshcmd.DATETIME = args.run_id
+    logger = setup_logging(verbose=args.verbose, log_suffix=f"_shard{args.shard.replace('/', 'of')}" if args.shard else "")
 
     csv_files = read_batch_file(args.batch)
     if not csv_files:
@@ -118,11 +504,59 @@ def main():
 
     logger.info(f"Processing {len(valid_csvs)} valid CSV files: {valid_csvs}")
 
-    max_csv_workers = 8
-    with ThreadPoolExecutor(max_workers=max_csv_workers) as executor:
+    if args.merge:
+        if not args.run_id:
+            logger.error("--merge requires --run-id")
+            return
+        shard.merge_shards(args.run_id, [Path(csv_file).stem for csv_file in valid_csvs], args.output_structure, args.metrics)
+        return
+
+    if args.per_csv and (args.shard or args.processes > 1):
+        logger.error("--shard and --processes are not supported with --per-csv")
+        return
+
+    if args.shard:
+        try:
+            shard_spec = shard.parse_shard(args.shard)
+        except ValueError as e:
+            logger.error(str(e))
+            return
+        shard.use_shard_dirs(pyshcmd.DATETIME, *shard_spec)
+        logger.info(f"Run {pyshcmd.DATETIME} shard {args.shard}, merge with: --merge --run-id {pyshcmd.DATETIME}")
+        run_shared_batch(valid_csvs, args, shard_spec=shard_spec)
+        return
+
+    if args.processes > 1:
+        run_processes(valid_csvs, args, pyshcmd.DATETIME)
+        return
+
+    if not args.per_csv:
+        run_shared_batch(valid_csvs, args)
+        return
+
+    # -w caps the sessions of the whole batch as in the shared mode: up to -w CSVs run at once, each with its share
+    auto = args.max_sessions == "auto"
+    csv_workers = min(len(valid_csvs), args.auto_max if auto else args.max_sessions)
+    csv_sessions = "auto" if auto else max(1, args.max_sessions // csv_workers)
+    auto_min = max(1, args.auto_min // csv_workers)
+    auto_max = max(auto_min, args.auto_max // csv_workers)
+    sessions = f"auto {auto_min}-{auto_max}" if auto else csv_sessions
+    logger.info(f"Running {csv_workers} CSV files at a time, {sessions} sessions each")
+    with ThreadPoolExecutor(max_workers=csv_workers) as executor:
         future_to_csv = {
-            executor.submit(run_pyshcmd, csv_file, save_json=args.save_json, save_txt=args.save_txt, 
-                           verbose=args.verbose, output_structure=args.output_structure): csv_file
+            executor.submit(run_pyshcmd, csv_file, max_workers=csv_sessions, save_json=args.save_json, save_txt=args.save_txt, 
+                           verbose=args.verbose, output_structure=args.output_structure, engine=args.engine,
+                           save_jsonl=args.save_jsonl, refresh_detect=args.refresh_detect,
+                           no_detect_cache=args.no_detect_cache, detect_cache_ttl=args.detect_cache_ttl,
+                           metrics=args.metrics, retries=args.retries, retry_backoff=args.retry_backoff,
+                           retry_max_backoff=args.retry_max_backoff, resume=args.resume, no_journal=args.no_journal,
+                           pipeline=args.pipeline, auto_min=auto_min, auto_max=auto_max,
+                           preflight=args.preflight, preflight_timeout=args.preflight_timeout, store=args.store,
+                           conditional=args.conditional, parse=args.parse, parse_workers=args.parse_workers,
+                           parse_map=args.parse_map, capture=args.capture, capture_spill=args.capture_spill,
+                           capture_cap=args.capture_cap, jump_host=args.jump_host, jump_key=args.jump_key,
+                           jump_transports=args.jump_transports, jump_channels=args.jump_channels, order=args.order,
+                           no_history=args.no_history): csv_file
             for csv_file in valid_csvs
         }
         for future in as_completed(future_to_csv):
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+import asyncio
+import ipaddress
+import logging
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from adaptive import AsyncAdaptiveLimit
+version = '20261016'
+# Shared batch scheduler with global, subnet and site session caps (20261016)
+
+# Merge devices from several CSVs into one job per (ip, port); each member keeps its CSV, row and commands
+def merge_devices(csv_devices, read_commands):
+    logger = logging.getLogger(__name__)
+    jobs = OrderedDict()
+    # Rows share a handful of cmdfiles, look each one up once
+    commands_by_file = {}
+    for csv_file, devices in csv_devices.items():
+        for device in devices:
+            key = (device["ip"], device["port"])
+            commands = commands_by_file.get(device["cmdfile"])
+            if commands is None:
+                commands = commands_by_file[device["cmdfile"]] = read_commands(device["cmdfile"])
+            job = jobs.get(key)
+            if job is None:
+                # The row and the cached command tuple are shared until a duplicate needs to change them
+                jobs[key] = {"device": device, "commands": commands, "members": [(csv_file, device, commands)]}
+                continue
+            first = job["device"]
+            if device["username"] != first["username"] or device["password"] != first["password"]:
+                logger.warning(f"Credentials for {device['ip']}:{device['port']} in {csv_file} differ from the first entry, using the first entry")
+            if device["device_type"] and not first["device_type"]:
+                job["device"] = dict(first, device_type=device["device_type"])
+            elif device["device_type"] and device["device_type"] != first["device_type"]:
+                logger.warning(f"Device type {device['device_type']} for {device['ip']} in {csv_file} conflicts with {first['device_type']}, using {first['device_type']}")
+            # Union of all cmdfiles, in first-seen order, so every command runs once in the shared session
+            missing = [command for command in commands if command not in job["commands"]]
+            if missing:
+                job["commands"] = list(job["commands"]) + missing
+            job["members"].append((csv_file, device, commands))
+    merged = sum(len(job["members"]) for job in jobs.values()) - len(jobs)
+    if merged:
+        logger.info(f"Merged {merged} duplicate device entries, {len(jobs)} unique devices to connect")
+    return list(jobs.values())
+
+# Group keys a job is counted against, e.g. (("subnet", "10.1.2.0/24"), ("site", "HK"))
+def job_groups(job, group_caps, subnet_prefix=24):
+    groups = []
+    if group_caps.get("subnet"):
+        try:
+            network = ipaddress.ip_network(f"{job['device']['ip']}/{subnet_prefix}", strict=False)
+            groups.append(("subnet", str(network)))
+        except ValueError:
+            groups.append(("subnet", str(job["device"]["ip"])))
+    if group_caps.get("site"):
+        groups.append(("site", job["device"].get("site", "") or "default"))
+    return tuple(groups)
+
+# Seconds between checks for a raised adaptive limit while no job finishes
+LIMIT_POLL = 0.5
+
+# Thread scheduler: a single dispatcher submits jobs only when both the global and every group cap have room,
+# so a worker never sits idle waiting on a busy subnet. With an AdaptiveLimit the global cap is its current
+# limit and max_sessions its ceiling
+class BatchScheduler:
+    def __init__(self, max_sessions=16, group_caps=None, subnet_prefix=24, limit=None):
+        self.limit = limit
+        self.max_sessions = limit.maximum if limit else max_sessions
+        self.group_caps = {k: v for k, v in (group_caps or {}).items() if v}
+        self.subnet_prefix = subnet_prefix
+
+    def capacity(self):
+        return self.limit.limit if self.limit else self.max_sessions
+
+    def _eligible(self, groups, group_running):
+        return all(group_running[group] < self.group_caps[group[0]] for group in groups)
+
+    # Yield (job, future) as jobs finish
+    def run(self, jobs, fn):
+        logger = logging.getLogger(__name__)
+        pending = OrderedDict()
+        for job in jobs:
+            pending.setdefault(job_groups(job, self.group_caps, self.subnet_prefix), deque()).append(job)
+        running = {}
+        group_running = Counter()
+        with ThreadPoolExecutor(max_workers=self.max_sessions) as executor:
+            while pending or running:
+                # Round-robin over groups so one large subnet or site does not starve the others
+                progress = True
+                capacity = self.capacity()
+                while progress and len(running) < capacity:
+                    progress = False
+                    for groups in list(pending):
+                        if len(running) >= capacity:
+                            break
+                        if not self._eligible(groups, group_running):
+                            continue
+                        job = pending[groups].popleft()
+                        if not pending[groups]:
+                            del pending[groups]
+                        for group in groups:
+                            group_running[group] += 1
+                        running[executor.submit(fn, job)] = (job, groups)
+                        progress = True
+                if not running:
+                    logger.error("Scheduler stalled with pending jobs and nothing running")
+                    break
+                done, _ = wait(running, timeout=LIMIT_POLL if self.limit else None, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job, groups = running.pop(future)
+                    for group in groups:
+                        group_running[group] -= 1
+                    yield job, future
+
+# Async counterpart: the group semaphores are taken before the global one so waiting jobs hold no global slot
+class AsyncGroupLimit:
+    def __init__(self, global_semaphore, group_semaphores):
+        self.global_semaphore = global_semaphore
+        self.group_semaphores = group_semaphores
+
+    async def __aenter__(self):
+        for semaphore in self.group_semaphores:
+            await semaphore.acquire()
+        await self.global_semaphore.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.global_semaphore.release()
+        for semaphore in reversed(self.group_semaphores):
+            semaphore.release()
+
+class AsyncBatchScheduler(BatchScheduler):
+    # Yield (job, result or exception) as jobs finish; fn(job, limit) is a coroutine that enters limit around its session
+    async def run_async(self, jobs, fn):
+        global_semaphore = AsyncAdaptiveLimit(self.limit) if self.limit else asyncio.Semaphore(self.max_sessions)
+        group_semaphores = {}
+
+        def limit_for(job):
+            semaphores = []
+            for group in job_groups(job, self.group_caps, self.subnet_prefix):
+                if group not in group_semaphores:
+                    group_semaphores[group] = asyncio.Semaphore(self.group_caps[group[0]])
+                semaphores.append(group_semaphores[group])
+            return AsyncGroupLimit(global_semaphore, semaphores)
+
+        async def run_job(job):
+            try:
+                return job, await fn(job, limit_for(job))
+            except Exception as e:
+                return job, e
+
+        tasks = [asyncio.create_task(run_job(job)) for job in jobs]
+        completed = asyncio.as_completed(tasks)
+        del tasks
+        for task in completed:
+            yield await task
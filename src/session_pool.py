@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+import logging
+import threading
+import time
+import jumphost
+version = '20261016'
+# Pool of logged-in sessions kept open by the collector daemon (20261016)
+
+# Below the 10 minute exec-timeout of IOS/NX-OS VTY lines, so a pooled session is evicted before the device drops it
+DEFAULT_IDLE_TIMEOUT = 540.0
+DEFAULT_MAX_IDLE = 512
+DEFAULT_HEALTH_INTERVAL = 60.0
+
+# Sessions are exclusive: a checked out session is not in the pool until it is checked in again
+class SessionPool:
+    def __init__(self, idle_timeout=DEFAULT_IDLE_TIMEOUT, max_idle=DEFAULT_MAX_IDLE, health_interval=DEFAULT_HEALTH_INTERVAL):
+        self.idle_timeout = idle_timeout
+        self.max_idle = max_idle
+        self.health_interval = health_interval
+        self.lock = threading.Lock()
+        # key -> (ssh, last used), oldest first
+        self.idle = {}
+        self.closed = False
+        self.stopped = threading.Event()
+        self.reaper = None
+        self.counts = {"reused": 0, "opened": 0, "evicted": 0, "dead": 0}
+
+    # The password is part of the key, so a job only gets a session logged in with the credentials of its own CSV;
+    # the same address behind two jump hosts is two devices
+    @staticmethod
+    def key(device_dict):
+        return (str(device_dict["ip"]), device_dict["port"], device_dict["username"], device_dict["password"], device_dict["device_type"],
+                jumphost.spec_of(device_dict))
+
+    def start(self):
+        self.reaper = threading.Thread(target=self._reap, name="session-reaper", daemon=True)
+        self.reaper.start()
+        return self
+
+    # A healthy idle session for the device (same type and credentials), or None to log in afresh
+    def checkout(self, device_dict):
+        logger = logging.getLogger(__name__)
+        with self.lock:
+            entry = self.idle.pop(self.key(device_dict), None)
+        if entry is None:
+            return None
+        ssh, _ = entry
+        healthy = alive(ssh)
+        with self.lock:
+            self.counts["reused" if healthy else "dead"] += 1
+        if not healthy:
+            logger.info(f"Pooled session to {device_dict['ip']} is dead, logging in again")
+            disconnect(ssh)
+            return None
+        return ssh
+
+    def checkin(self, device_dict, ssh):
+        key = self.key(device_dict)
+        evicted = []
+        with self.lock:
+            if self.closed:
+                evicted.append(ssh)
+            else:
+                # Two jobs may have logged in to the same device at once, the newer session is kept
+                previous = self.idle.pop(key, None)
+                if previous:
+                    evicted.append(previous[0])
+                self.idle[key] = (ssh, time.monotonic())
+                while len(self.idle) > self.max_idle:
+                    oldest = next(iter(self.idle))
+                    evicted.append(self.idle.pop(oldest)[0])
+                    self.counts["evicted"] += 1
+        for session in evicted:
+            disconnect(session)
+
+    # Session of one device for the with block of _execute_commands: checked in when the block ends cleanly and
+    # reusable is still set, closed otherwise
+    def lease(self, device_dict, ssh, reused=False):
+        if not reused:
+            with self.lock:
+                self.counts["opened"] += 1
+        return Lease(self, device_dict, ssh)
+
+    # Close the least recently used idle session behind the jump host (user, host, port), whose channel a new device
+    # needs; pooled sessions keep their jump host channels, which would otherwise starve devices without a session
+    def evict_behind(self, jump_key):
+        logger = logging.getLogger(__name__)
+        with self.lock:
+            key = next((key for key in self.idle if key[5] and jumphost.parse_spec(key[5], key[2]) == jump_key), None)
+            if key is None:
+                return False
+            ssh = self.idle.pop(key)[0]
+            self.counts["evicted"] += 1
+        logger.debug(f"Session pool: idle session to {key[0]} closed for a jump host channel")
+        disconnect(ssh)
+        return True
+
+    # Idle sessions past the idle timeout are closed, the others are health checked so a session the device
+    # closed is not handed to the next job
+    def _reap(self):
+        logger = logging.getLogger(__name__)
+        while not self.stopped.wait(self.health_interval):
+            now = time.monotonic()
+            expired = []
+            dead = []
+            with self.lock:
+                for key, (ssh, last_used) in list(self.idle.items()):
+                    if now - last_used > self.idle_timeout:
+                        expired.append(self.idle.pop(key)[0])
+                    elif not alive(ssh):
+                        dead.append(self.idle.pop(key)[0])
+                self.counts["evicted"] += len(expired)
+                self.counts["dead"] += len(dead)
+            for ssh in expired + dead:
+                disconnect(ssh)
+            if expired or dead:
+                logger.info(f"Session pool: {len(expired)} idle sessions evicted, {len(dead)} dead sessions removed, {len(self.idle)} kept")
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts, idle=len(self.idle))
+
+    def close(self):
+        logger = logging.getLogger(__name__)
+        self.stopped.set()
+        with self.lock:
+            self.closed = True
+            sessions = [ssh for ssh, _ in self.idle.values()]
+            self.idle = {}
+        for ssh in sessions:
+            disconnect(ssh)
+        if self.reaper:
+            self.reaper.join()
+        logger.info(f"Session pool closed, {len(sessions)} sessions disconnected")
+
+class Lease:
+    def __init__(self, pool, device_dict, ssh):
+        self.pool = pool
+        self.device_dict = device_dict
+        self.ssh = ssh
+        self.reusable = True
+
+    def __enter__(self):
+        return self.ssh
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None and self.reusable:
+            self.pool.checkin(self.device_dict, self.ssh)
+        else:
+            disconnect(self.ssh)
+        return False
+
+# Netmiko's is_alive writes a NUL byte, which the CLI ignores, and checks the transport
+def alive(ssh):
+    try:
+        return not getattr(ssh.remote_conn, "closed", False) and ssh.is_alive()
+    except Exception:
+        return False
+
+def disconnect(ssh):
+    try:
+        ssh.disconnect()
+    except Exception:
+        pass
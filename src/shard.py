@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import pyshcmd as pyshcmd
+from result_sink import ResultSink, json_entries
+from metrics import RunMetrics, save_metrics, load_metrics_devices
+from store import STORE_DIR, OBJECTS_DIR, manifest_path
+version = '20261016'
+# Device sharding for run_batch processes and merge of shard outputs (20261016)
+
+SHARD_DIR = 'shards'
+SHARD_NAME = re.compile(r"shard(\d+)of(\d+)$")
+
+# "2/4" -> (2, 4), shards are numbered from 1
+def parse_shard(value):
+    match = re.fullmatch(r"(\d+)/(\d+)", value or "")
+    if not match or not (1 <= int(match.group(1)) <= int(match.group(2))):
+        raise ValueError(f"Invalid shard '{value}', expected i/N with 1 <= i <= N")
+    return int(match.group(1)), int(match.group(2))
+
+# Stable across processes and hosts (unlike hash()), so every host agrees on who owns a device
+def shard_of(device, count):
+    digest = hashlib.sha1(f"{device['ip']}:{device['port']}".encode()).hexdigest()
+    return int(digest, 16) % count + 1
+
+def shard_dir(run_id, index, count, output_root=None):
+    return os.path.join(output_root or pyshcmd.OUTPUT_DIR_FULL, SHARD_DIR, run_id, f"shard{index}of{count}")
+
+# Point pyshcmd's output and report directories at this shard's staging area
+def use_shard_dirs(run_id, index, count):
+    base = shard_dir(run_id, index, count)
+    pyshcmd.OUTPUT_DIR_FULL = os.path.join(base, pyshcmd.OUTPUT_DIR)
+    pyshcmd.REPORT_DIR_FULL = os.path.join(base, pyshcmd.REPORT_DIR)
+    pyshcmd.JOURNAL_DIR_FULL = os.path.join(base, pyshcmd.JOURNAL_DIR)
+    pyshcmd.DATETIME = run_id
+    return base
+
+# Connection report rows in machine-readable form so shards can be merged without parsing the text report, with the
+# shard's -w auto limit changes and device schedule for the report's concurrency and schedule sections
+def save_shard_state(detected_types, output_base, run_id, concurrency=None, schedule=None):
+    logger = logging.getLogger(__name__)
+    os.makedirs(pyshcmd.REPORT_DIR_FULL, exist_ok=True)
+    filename = os.path.join(pyshcmd.REPORT_DIR_FULL, f"report_{output_base}_{run_id}.json")
+    try:
+        with open(filename, "w") as f:
+            json.dump({"devices": {ip: list(entry) for ip, entry in detected_types.items()},
+                       "concurrency": [list(change) for change in concurrency or []], "schedule": schedule}, f)
+    except OSError as e:
+        logger.error(f"Error saving shard state to {filename}: {str(e)}")
+
+# (detected_types, concurrency, schedule) of one shard; a state file holding only the devices has neither section
+def load_shard_state(report_dir, output_base, run_id):
+    filename = os.path.join(report_dir, f"report_{output_base}_{run_id}.json")
+    try:
+        with open(filename, "r") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return {}, [], None
+    if "devices" not in state:
+        state = {"devices": state}
+    detected_types = {ip: tuple(entry) for ip, entry in state["devices"].items()}
+    return detected_types, [tuple(change) for change in state.get("concurrency") or []], state.get("schedule")
+
+# Session limit of the batch over time: each shard's changes in elapsed order, the limit being the sum of the
+# shards' current limits (shards start together, so their elapsed times line up)
+def merge_concurrency(histories):
+    limits = {}
+    merged = []
+    changes = sorted((elapsed, index, limit, reason) for index, history in enumerate(histories, 1) for elapsed, limit, reason in history)
+    for elapsed, index, limit, reason in changes:
+        limits[index] = limit
+        merged.append((elapsed, sum(limits.values()), f"shard {index}: {reason}"))
+    return merged
+
+# Schedule of the batch: shards run side by side, so the makespans are those of the slowest shard
+def merge_schedules(schedules):
+    schedules = [schedule for schedule in schedules if schedule]
+    if not schedules:
+        return None
+    actual = [schedule["actual"] for schedule in schedules if schedule["actual"] is not None]
+    return {
+        "order": schedules[0]["order"],
+        "workers": sum(schedule["workers"] for schedule in schedules),
+        "devices": sum(schedule["devices"] for schedule in schedules),
+        "known": sum(schedule["known"] for schedule in schedules),
+        "predicted": max(schedule["predicted"] for schedule in schedules),
+        "csv_order": max(schedule["csv_order"] for schedule in schedules),
+        "longest_first": max(schedule["longest_first"] for schedule in schedules),
+        "actual": max(actual) if actual else None,
+    }
+
+def find_shards(run_id):
+    shards = []
+    for path in sorted(glob.glob(os.path.join(pyshcmd.OUTPUT_DIR_FULL, SHARD_DIR, run_id, "shard*of*"))):
+        match = SHARD_NAME.search(path)
+        if match:
+            shards.append((int(match.group(1)), int(match.group(2)), path))
+    return sorted(shards)
+
+# Combine every shard's JSON, JSONL, text files and report into output/ and report/ as a single run would
+def merge_shards(run_id, outnames, output_structure, metrics_format="json"):
+    logger = logging.getLogger(__name__)
+    shards = find_shards(run_id)
+    if not shards:
+        logger.error(f"No shard outputs found for run {run_id}")
+        return False
+    counts = {count for _, count, _ in shards}
+    if len(counts) != 1 or len(shards) != counts.pop():
+        logger.warning(f"Merging incomplete shard set for run {run_id}: {[os.path.basename(p) for _, _, p in shards]}")
+    # Objects are content-addressed, a file already in the store is the same output
+    store_root = os.path.join(pyshcmd.OUTPUT_DIR_FULL, STORE_DIR)
+    for _, _, path in shards:
+        shard_objects = os.path.join(path, pyshcmd.OUTPUT_DIR, STORE_DIR, OBJECTS_DIR)
+        for name in glob.glob(os.path.join(shard_objects, "*", "*.gz")):
+            target = os.path.join(store_root, OBJECTS_DIR, os.path.relpath(name, shard_objects))
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copy2(name, target)
+
+    for outname in outnames:
+        json_path = pyshcmd.json_output_path(outname, run_id, output_structure)
+        jsonl_path = pyshcmd.json_output_path(outname, run_id, output_structure, ext="jsonl")
+        json_rel = os.path.relpath(json_path, pyshcmd.OUTPUT_DIR_FULL)
+        jsonl_rel = os.path.relpath(jsonl_path, pyshcmd.OUTPUT_DIR_FULL)
+        text_rel = os.path.relpath(os.path.splitext(json_path)[0], pyshcmd.OUTPUT_DIR_FULL)
+        shard_json = [os.path.join(p, pyshcmd.OUTPUT_DIR, json_rel) for _, _, p in shards]
+        shard_jsonl = [os.path.join(p, pyshcmd.OUTPUT_DIR, jsonl_rel) for _, _, p in shards]
+        shard_text = [os.path.join(p, pyshcmd.OUTPUT_DIR, text_rel) for _, _, p in shards]
+
+        # One device in memory at a time; records are re-streamed in shard order
+        if any(os.path.isfile(path) for path in shard_json):
+            with ResultSink(json_path=json_path) as sink:
+                for path in filter(os.path.isfile, shard_json):
+                    for ip, outputs in json_entries(path):
+                        sink.put({ip: outputs})
+        # Parsed records (--parse) are merged like the JSON output
+        parsed_path = pyshcmd.json_output_path(outname, run_id, output_structure, ext="parsed.json")
+        parsed_rel = os.path.relpath(parsed_path, pyshcmd.OUTPUT_DIR_FULL)
+        shard_parsed = [os.path.join(p, pyshcmd.OUTPUT_DIR, parsed_rel) for _, _, p in shards]
+        if any(os.path.isfile(path) for path in shard_parsed):
+            with ResultSink(json_path=parsed_path) as sink:
+                for path in filter(os.path.isfile, shard_parsed):
+                    for ip, parsed in json_entries(path):
+                        sink.put({ip: parsed})
+        if any(os.path.isfile(path) for path in shard_jsonl):
+            with open(jsonl_path, "w") as out:
+                for path in filter(os.path.isfile, shard_jsonl):
+                    with open(path, "r") as f:
+                        shutil.copyfileobj(f, out)
+            logger.info(f"JSON Lines output saved to {jsonl_path}")
+        # Merged journal lets a plain --resume <run-id> pick up devices any shard left failed
+        shard_journals = [os.path.join(p, pyshcmd.JOURNAL_DIR, os.path.basename(pyshcmd.journal_path(outname, run_id))) for _, _, p in shards]
+        if any(os.path.isfile(path) for path in shard_journals):
+            journal_path = pyshcmd.journal_path(outname, run_id)
+            os.makedirs(os.path.dirname(journal_path), exist_ok=True)
+            with open(journal_path, "w") as out:
+                for path in filter(os.path.isfile, shard_journals):
+                    with open(path, "r") as f:
+                        shutil.copyfileobj(f, out)
+        shard_manifests = [manifest_path(os.path.join(p, pyshcmd.OUTPUT_DIR, STORE_DIR), outname, run_id) for _, _, p in shards]
+        if any(os.path.isfile(path) for path in shard_manifests):
+            target = manifest_path(store_root, outname, run_id)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "w") as out:
+                for path in filter(os.path.isfile, shard_manifests):
+                    with open(path, "r") as f:
+                        shutil.copyfileobj(f, out)
+            logger.info(f"Store manifest saved to {target}")
+        if any(os.path.isdir(path) for path in shard_text):
+            text_dir = pyshcmd.text_output_dir(outname, run_id, output_structure)
+            for path in filter(os.path.isdir, shard_text):
+                for name in os.listdir(path):
+                    shutil.copy2(os.path.join(path, name), os.path.join(text_dir, name))
+
+        detected_types = {}
+        histories = []
+        schedules = []
+        metrics = RunMetrics()
+        for _, _, path in shards:
+            report_dir = os.path.join(path, pyshcmd.REPORT_DIR)
+            shard_detected, history, schedule = load_shard_state(report_dir, outname, run_id)
+            detected_types.update(shard_detected)
+            histories.append(history)
+            schedules.append(schedule)
+            metrics.load_devices(load_metrics_devices(os.path.join(report_dir, f"metrics_{outname}_{run_id}.json")))
+        if detected_types:
+            pyshcmd.save_connection_report(detected_types, outname, run_id, output_structure, metrics,
+                                           merge_concurrency(histories), merge_schedules(schedules))
+            if metrics_format != "none":
+                save_metrics(metrics, pyshcmd.REPORT_DIR_FULL, outname, run_id, metrics_format)
+        logger.info(f"Merged {len(shards)} shards for {outname}")
+    return True
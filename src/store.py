@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+import argparse
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+from capture import is_reference, reference_path
+version = '20261016'
+# Content-addressed output store (20261016)
+
+PARENT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+STORE_DIR = 'store'
+STORE_DIR_FULL = os.path.join(PARENT_DIR, 'output', STORE_DIR)
+OBJECTS_DIR = 'objects'
+MANIFESTS_DIR = 'manifests'
+
+# objects/ab/cdef...gz, split like git so no directory holds every object
+def object_path(root, digest):
+    return os.path.join(root, OBJECTS_DIR, digest[:2], f"{digest[2:]}.gz")
+
+def manifest_path(root, batch, run_id):
+    return os.path.join(root, MANIFESTS_DIR, batch, f"{run_id}.jsonl")
+
+# Write one object unless it is already stored; the temporary name keeps concurrent writers (several CSVs, shards) apart
+def write_object(root, digest, data):
+    path = object_path(root, digest)
+    if os.path.exists(path):
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        # mtime=0 so the same output always compresses to the same bytes
+        f.write(gzip.compress(data, mtime=0))
+    os.replace(tmp_path, path)
+    return True
+
+CHUNK = 1024 * 1024
+
+# Store a --capture spill file without reading it whole: hashed in one pass, compressed in a second one if new;
+# the digest is the same as for the output held as a string
+def write_file_object(root, path):
+    sha = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK), b""):
+            sha.update(block)
+            size += len(block)
+    digest = sha.hexdigest()
+    target = object_path(root, digest)
+    if os.path.exists(target):
+        return digest, size, False
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(path, "rb") as src, open(tmp_path, "wb") as raw, gzip.GzipFile(filename="", fileobj=raw, mode="wb", mtime=0) as dst:
+        shutil.copyfileobj(src, dst, CHUNK)
+    os.replace(tmp_path, target)
+    return digest, size, True
+
+def output_hash(output):
+    return hashlib.sha256(output.encode("utf-8")).hexdigest()
+
+def read_object(root, digest):
+    with open(object_path(root, digest), "rb") as f:
+        return gzip.decompress(f.read()).decode("utf-8")
+
+# Store of one batch run, fed by ResultSink from its writer thread
+class OutputStore:
+    def __init__(self, root, batch, run_id):
+        self.root = root
+        self.batch = batch
+        self.run_id = run_id
+        self.path = manifest_path(root, batch, run_id)
+        self.manifest = None
+        self.outputs = 0
+        self.new_objects = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.manifest = open(self.path, "w")
+        return self
+
+    # links: outputs an Unchanged device did not collect again, {"since": run_id, "outputs": {command: hash}} from the previous manifest
+    def add(self, ip, hostname, device_type, connection_status, outputs, links=None, failed=None):
+        logger = logging.getLogger(__name__)
+        hashes = {}
+        for command, output in outputs.items():
+            if is_reference(output):
+                try:
+                    digest, size, new = write_file_object(self.root, reference_path(output))
+                except OSError as e:
+                    logger.error(f"Error storing {output} for {ip}: {str(e)}")
+                    continue
+            else:
+                data = output.encode("utf-8")
+                digest, size = output_hash(output), len(data)
+                new = write_object(self.root, digest, data)
+            if new:
+                self.new_objects += 1
+                self.stored_bytes += os.path.getsize(object_path(self.root, digest))
+            self.raw_bytes += size
+            self.outputs += 1
+            hashes[command] = digest
+        since = self.run_id
+        if links:
+            hashes.update(links["outputs"])
+            since = links["since"] or since
+        # since: run in which the linked outputs were last collected
+        record = {"ip": ip, "hostname": hostname, "device_type": device_type, "connection": connection_status, "outputs": hashes, "since": since}
+        if failed:
+            record["failed"] = list(failed)
+        self.manifest.write(json.dumps(record) + "\n")
+        self.manifest.flush()
+
+    def close(self):
+        logger = logging.getLogger(__name__)
+        if self.manifest:
+            self.manifest.close()
+            self.manifest = None
+            logger.info(f"Store: {self.outputs} outputs ({self.raw_bytes} bytes), {self.new_objects} new objects "
+                        f"({self.stored_bytes} bytes compressed), manifest saved to {self.path}")
+
+# Last record of each device in a manifest
+def load_manifest(path):
+    devices = {}
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                devices[record["ip"]] = record
+    return devices
+
+def list_runs(root, batch):
+    return sorted(os.path.splitext(os.path.basename(path))[0] for path in glob.glob(os.path.join(root, MANIFESTS_DIR, batch, "*.jsonl")))
+
+# An Unchanged device's record holds the same outputs as a Success one
+def collected(record):
+    return "Success" if record["connection"] == "Unchanged" else record["connection"]
+
+# Per-device changes between two manifests, compared by hash only: (ip, hostname, [change, ...]) for devices that differ
+def diff_manifests(old, new):
+    changes = []
+    for ip in sorted(set(old) | set(new)):
+        before, after = old.get(ip), new.get(ip)
+        if before is None:
+            changes.append((ip, after["hostname"], ["new device"]))
+            continue
+        if after is None:
+            changes.append((ip, before["hostname"], ["device missing"]))
+            continue
+        if collected(before) != collected(after):
+            changes.append((ip, after["hostname"], [f"connection {before['connection']} -> {after['connection']}"]))
+            continue
+        device_changes = []
+        old_outputs, new_outputs = before["outputs"], after["outputs"]
+        for command in new_outputs:
+            if command not in old_outputs:
+                device_changes.append(f"added: {command}")
+            elif old_outputs[command] != new_outputs[command]:
+                device_changes.append(f"changed: {command}")
+        device_changes += [f"removed: {command}" for command in old_outputs if command not in new_outputs]
+        if device_changes:
+            changes.append((ip, after["hostname"], device_changes))
+    return changes
+
+def cmd_runs(args):
+    for run_id in list_runs(args.store_dir, args.batch):
+        print(run_id)
+
+def cmd_diff(args):
+    runs = list_runs(args.store_dir, args.batch)
+    new_run = args.to_run or (runs[-1] if runs else None)
+    old_run = args.from_run or next((run for run in reversed(runs) if run < (new_run or "")), None)
+    if not old_run or not new_run:
+        print(f"Need two runs of {args.batch} in {os.path.join(args.store_dir, MANIFESTS_DIR)}, found {len(runs)}", file=sys.stderr)
+        return 1
+    old = load_manifest(manifest_path(args.store_dir, args.batch, old_run))
+    new = load_manifest(manifest_path(args.store_dir, args.batch, new_run))
+    changes = diff_manifests(old, new)
+    print(f"Changes in {args.batch} from {old_run} to {new_run}")
+    for ip, hostname, device_changes in changes:
+        for change in device_changes:
+            print(f"{ip:<16} {hostname:<20} {change}")
+    print(f"{len(changes)} of {len(set(old) | set(new))} devices changed")
+    return 0
+
+def cmd_show(args):
+    runs = list_runs(args.store_dir, args.batch)
+    run_id = args.run or (runs[-1] if runs else None)
+    if not run_id:
+        print(f"No runs of {args.batch} in {os.path.join(args.store_dir, MANIFESTS_DIR)}", file=sys.stderr)
+        return 1
+    record = load_manifest(manifest_path(args.store_dir, args.batch, run_id)).get(args.ip)
+    if record is None:
+        print(f"{args.ip} not in run {run_id} of {args.batch}", file=sys.stderr)
+        return 1
+    commands = [args.command] if args.command else list(record["outputs"])
+    for command in commands:
+        if command not in record["outputs"]:
+            print(f"'{command}' not collected from {args.ip} in run {run_id}", file=sys.stderr)
+            return 1
+        if not args.command:
+            print(f"##### EXECUTE CMD: {command}")
+        print(read_object(args.store_dir, record["outputs"][command]))
+    return 0
+
+# Remove objects no manifest points at, e.g. after old manifests were deleted
+def cmd_gc(args):
+    referenced = set()
+    for path in glob.glob(os.path.join(args.store_dir, MANIFESTS_DIR, "*", "*.jsonl")):
+        for record in load_manifest(path).values():
+            referenced.update(record["outputs"].values())
+    removed = freed = 0
+    for path in glob.glob(os.path.join(args.store_dir, OBJECTS_DIR, "*", "*.gz")):
+        digest = os.path.basename(os.path.dirname(path)) + os.path.basename(path)[:-len(".gz")]
+        if digest not in referenced:
+            freed += os.path.getsize(path)
+            os.remove(path)
+            removed += 1
+    print(f"Removed {removed} unreferenced objects, {freed} bytes freed, {len(referenced)} objects kept")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the content-addressed output store written by pyshcmd/run_batch --store")
+    parser.add_argument("--store-dir", default=STORE_DIR_FULL, help=f"Store directory (default: {STORE_DIR_FULL})")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    runs = subparsers.add_parser("runs", help="List the stored runs of a batch")
+    runs.add_argument("batch", help="Batch name (CSV stem or -o name)")
+    runs.set_defaults(func=cmd_runs)
+    diff = subparsers.add_parser("diff", help="Devices and commands whose output changed between two runs, from the hashes only")
+    diff.add_argument("batch", help="Batch name (CSV stem or -o name)")
+    diff.add_argument("--from", dest="from_run", default=None, help="Older run yyyymmdd_hhmmss (default: the run before --to)")
+    diff.add_argument("--to", dest="to_run", default=None, help="Newer run yyyymmdd_hhmmss (default: the latest run)")
+    diff.set_defaults(func=cmd_diff)
+    show = subparsers.add_parser("show", help="Print stored outputs of one device")
+    show.add_argument("batch", help="Batch name (CSV stem or -o name)")
+    show.add_argument("ip", help="Device IP")
+    show.add_argument("command", nargs="?", default=None, help="Command (default: every command of the device)")
+    show.add_argument("--run", default=None, help="Run yyyymmdd_hhmmss (default: the latest run)")
+    show.set_defaults(func=cmd_show)
+    gc = subparsers.add_parser("gc", help="Delete objects no manifest points at")
+    gc.set_defaults(func=cmd_gc)
+    args = parser.parse_args()
+    sys.exit(args.func(args) or 0)
+
+if __name__ == "__main__":
+    main()
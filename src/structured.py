@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+try:
+    import textfsm
+    from textfsm import clitable
+except ImportError:
+    textfsm = None
+try:
+    import ntc_templates
+except ImportError:
+    ntc_templates = None
+from capture import is_reference
+version = '20261016'
+# Structured TextFSM parsing stage for --parse (20261016)
+
+PARENT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+CONFIG_DIR_FULL = os.path.join(PARENT_DIR, 'config')
+TEMPLATE_DIR = 'templates'
+TEMPLATE_DIR_FULL = os.path.join(PARENT_DIR, TEMPLATE_DIR)
+DEFAULT_MAP = 'parse_templates.json'
+# One core is left to the SSH workers and the result writer
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+# Devices handed to the pool and not parsed yet, per worker; beyond that the result writer waits
+PENDING_PER_WORKER = 4
+
+def is_available():
+    return textfsm is not None
+
+# {device_type: {command: template}} from a JSON file in config/; a missing default file means ntc-templates only
+def load_template_map(map_file=DEFAULT_MAP):
+    logger = logging.getLogger(__name__)
+    path = map_file if os.path.isabs(map_file) else os.path.join(CONFIG_DIR_FULL, map_file)
+    if not os.path.exists(path):
+        if map_file != DEFAULT_MAP:
+            logger.error(f"Template map {path} not found, using ntc-templates only")
+        return {}
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"Error reading template map {path}: {str(e)}, using ntc-templates only")
+        return {}
+
+# Template lookup of one pool process: the map first (exact command), then the ntc-templates index (abbreviations
+# such as "sh ip int br" match too); lookups and compiled templates are kept for the life of the process
+class TemplateCache:
+    def __init__(self, template_map, use_ntc=True):
+        self.template_map = template_map
+        self.index = None
+        if use_ntc and ntc_templates is not None:
+            self.index = clitable.CliTable("index", os.path.join(os.path.dirname(ntc_templates.__file__), "templates"))
+        self.paths = {}
+        self.compiled = {}
+
+    def template_path(self, device_type, command):
+        key = (device_type, command)
+        if key not in self.paths:
+            self.paths[key] = self._lookup(device_type, command)
+        return self.paths[key]
+
+    def _lookup(self, device_type, command):
+        name = self.template_map.get(device_type, {}).get(command)
+        if name:
+            return name if os.path.isabs(name) else os.path.join(TEMPLATE_DIR_FULL, name)
+        if self.index is None:
+            return None
+        row = self.index.index.GetRowMatch({"Platform": device_type, "Command": command})
+        if not row:
+            return None
+        # Commands parsed by several joined templates are rare, the first one holds the main table
+        return os.path.join(self.index.template_dir, self.index.index.index[row]["Template"].split(":")[0])
+
+    # Compiled TextFSM for the command, or None without a template; a broken template is reported once and skipped
+    def template(self, device_type, command):
+        path = self.template_path(device_type, command)
+        if path is None:
+            return None
+        if path not in self.compiled:
+            try:
+                with open(path, "r") as f:
+                    self.compiled[path] = textfsm.TextFSM(f)
+            except (OSError, textfsm.TextFSMTemplateError) as e:
+                self.compiled[path] = None
+                raise ValueError(f"template {path}: {str(e)}") from e
+        return self.compiled[path]
+
+_cache = None
+
+def _init_worker(template_map, use_ntc):
+    global _cache
+    _cache = TemplateCache(template_map, use_ntc)
+
+# Runs in a pool process: (JSON entry of the device or None, parsed commands, [error, ...], commands without a template, CPU seconds);
+# the entry is serialized here too, so the collecting process only writes it
+def parse_device(ip, device_type, outputs):
+    start = time.process_time()
+    parsed = {}
+    errors = []
+    unmatched = 0
+    for command, output in outputs.items():
+        try:
+            fsm = _cache.template(device_type, command)
+            if fsm is None:
+                unmatched += 1
+                continue
+            fsm.Reset()
+            # Lower-case field names, as Netmiko's use_textfsm returns them
+            parsed[command] = [{key.lower(): value for key, value in record.items()} for record in fsm.ParseTextToDicts(output)]
+        except (ValueError, textfsm.TextFSMError) as e:
+            errors.append(f"'{command}': {str(e)}")
+    # Same layout as json.dump(data, indent=4), one top-level key at a time
+    entry = json.dumps({ip: parsed}, indent=4)[2:-2] if parsed else None
+    return entry, len(parsed), errors, unmatched, time.process_time() - start
+
+# Process pool shared by every parsed output of a run; spawned workers, so no SSH thread state is forked
+class ParsePool:
+    def __init__(self, workers=DEFAULT_WORKERS, map_file=DEFAULT_MAP, use_ntc=True):
+        self.workers = max(1, workers)
+        self.template_map = load_template_map(map_file)
+        self.use_ntc = use_ntc
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_init_worker, initargs=(self.template_map, use_ntc))
+        self.pending = threading.BoundedSemaphore(self.workers * PENDING_PER_WORKER)
+
+    def submit(self, ip, device_type, outputs, callback):
+        self.pending.acquire()
+        future = self.executor.submit(parse_device, ip, device_type, outputs)
+
+        def done(future):
+            self.pending.release()
+            callback(future)
+
+        future.add_done_callback(done)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+# <name>.parsed.json of one batch, fed by ResultSink from its writer thread; same layout as the JSON output,
+# {ip: {command: [record, ...]}} for the commands that have a template
+class ParsedOutput:
+    def __init__(self, path, pool):
+        self.path = path
+        self.pool = pool
+        self.file = None
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.devices = 0
+        self.outputs = 0
+        self.unmatched = 0
+        self.errors = 0
+        self.cpu_seconds = 0.0
+
+    def open(self):
+        self.file = open(self.path, "w")
+        self.file.write("{\n")
+        return self
+
+    def add(self, ip, device_type, outputs, failed=None):
+        # Outputs spilled to a file by --capture are too large to parse in memory
+        outputs = {command: output for command, output in outputs.items()
+                   if output and command not in (failed or ()) and not is_reference(output)}
+        if not device_type or not outputs:
+            return
+        with self.condition:
+            self.in_flight += 1
+        self.pool.submit(ip, device_type, outputs, lambda future: self._write(ip, future))
+
+    # Called in the pool's result thread as each device is parsed
+    def _write(self, ip, future):
+        logger = logging.getLogger(__name__)
+        with self.condition:
+            try:
+                entry, parsed, errors, unmatched, cpu_seconds = future.result()
+                for error in errors:
+                    logger.warning(f"Parse error on {ip}: {error}")
+                self.errors += len(errors)
+                self.unmatched += unmatched
+                self.cpu_seconds += cpu_seconds
+                if entry and self.file:
+                    self.file.write(("" if self.devices == 0 else ",\n") + entry)
+                    self.file.flush()
+                    self.devices += 1
+                    self.outputs += parsed
+            except Exception as e:
+                logger.error(f"Parsing failed for {ip}: {str(e)}")
+                self.errors += 1
+            finally:
+                self.in_flight -= 1
+                self.condition.notify_all()
+
+    def close(self):
+        logger = logging.getLogger(__name__)
+        with self.condition:
+            while self.in_flight:
+                self.condition.wait()
+            if self.file:
+                self.file.write("\n}\n")
+                self.file.close()
+                self.file = None
+                logger.info(f"Parsed {self.outputs} outputs of {self.devices} devices ({self.unmatched} without a template, "
+                            f"{self.errors} errors, {self.cpu_seconds:.1f}s CPU), saved to {self.path}")
@@ -0,0 +1,45 @@
+import os
+import socket
+import subprocess
+import sys
+from types import SimpleNamespace
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC_DIR)
+
+import fakedev  # noqa: E402
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+# Start fakedev.py in its own process, as benchmark.py does; returns the fleet's device rows and the bastion port.
+# options are further fakedev.py arguments, e.g. ("--latency", "0.1")
+@pytest.fixture
+def fake_fleet():
+    procs = []
+
+    def start(count, device_type="cisco_ios", bastion=False, options=()):
+        port = free_port()
+        cmd = [sys.executable, os.path.join(SRC_DIR, "fakedev.py"), "-n", str(count), "-p", str(port), "-t", device_type, *options]
+        bastion_port = free_port() if bastion else 0
+        if bastion:
+            cmd += ["--bastion", str(bastion_port)]
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+        procs.append(proc)
+        # The fleet prints one line once all listeners are up, after the bastion's
+        for line in proc.stdout:
+            if "Serving" in line:
+                break
+        else:
+            pytest.fail(f"fakedev exited with {proc.wait()}")
+        return SimpleNamespace(devices=fakedev.fleet_devices(count, port, device_type), bastion=bastion_port, proc=proc)
+
+    yield start
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        proc.wait()
+        proc.stdout.close()
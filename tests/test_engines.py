@@ -0,0 +1,56 @@
+import json
+import pytest
+import async_engine
+import pyshcmd
+from result_sink import ResultSink
+
+# Round-robin over the fleet; the fourth device is a fake IOS listed as "generic", a Netmiko type without an async
+# driver that the async engine runs through its Netmiko fallback. Autodetection is left out, SSHDetect takes minutes here
+DEVICE_TYPES = "cisco_ios,cisco_nxos,f5_tmsh"
+FALLBACK_TYPE = "generic"
+
+# JSON output, text files and report entries of one run over the fleet
+def collect(devices, engine, pipeline, tmp_path):
+    name = f"{engine}_pipeline{pipeline}"
+    text_dir = tmp_path / name
+    text_dir.mkdir()
+    json_path = tmp_path / f"{name}.json"
+    with ResultSink(json_path=str(json_path)) as sink:
+        _, detected_types = pyshcmd.send_command_to_devices(devices, max_workers=4, output_dir=str(text_dir), save_txt=True, engine=engine,
+                                                            sink=sink, pipeline=pipeline)
+    texts = {path.name: path.read_text() for path in text_dir.iterdir()}
+    return json.loads(json_path.read_text()), texts, detected_types
+
+@pytest.fixture
+def fleet(fake_fleet):
+    fleet = fake_fleet(4, DEVICE_TYPES)
+    fleet.devices[3]["device_type"] = FALLBACK_TYPE
+    return fleet
+
+@pytest.fixture
+def baseline(fleet, tmp_path):
+    return collect(fleet.devices, "thread", 0, tmp_path)
+
+def test_fleet_covers_the_fallback(fleet):
+    assert FALLBACK_TYPE not in async_engine.ASYNC_PLATFORMS
+    assert set(DEVICE_TYPES.split(",")) <= set(async_engine.ASYNC_PLATFORMS)
+
+def test_baseline_collects_every_device(fleet, baseline):
+    data, texts, detected_types = baseline
+    assert set(data) == {device["ip"] for device in fleet.devices}
+    assert {entry[3] for entry in detected_types.values()} == {"Success"}
+    assert [detected_types[device["ip"]][2] for device in fleet.devices] == DEVICE_TYPES.split(",") + [FALLBACK_TYPE]
+    assert len(texts) == len(fleet.devices)
+    # fakedev names the command in every line it answers with, so an output split at the wrong prompt shows up here
+    for device in fleet.devices:
+        for command, output in data[device["ip"]].items():
+            lines = [line for line in output.splitlines() if line.startswith(f"{device['hostname']} ")]
+            assert all(line.startswith(f"{device['hostname']} {command} line ") for line in lines)
+
+@pytest.mark.parametrize("engine,pipeline", [("async", 0), ("thread", 4), ("async", 4)])
+def test_engines_match_thread_engine(fleet, baseline, tmp_path, engine, pipeline):
+    data, texts, detected_types = collect(fleet.devices, engine, pipeline, tmp_path)
+    expected_data, expected_texts, expected_types = baseline
+    assert data == expected_data
+    assert texts == expected_texts
+    assert detected_types == expected_types
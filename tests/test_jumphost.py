@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import jumphost
+import pyshcmd
+from result_sink import ResultSink
+
+DEVICES = 8
+# Each command waits a little, so every device holds its channel while the others log in
+LATENCY = "0.1"
+SUMMARY = re.compile(r"Jump host .*: (\d+) device \w+ over (\d+) transports")
+
+@pytest.fixture
+def bastion_fleet(fake_fleet, monkeypatch):
+    monkeypatch.setenv(jumphost.PASSWORD_ENV, "password")
+    fleet = fake_fleet(DEVICES, bastion=True, options=("--latency", LATENCY))
+    fleet.devices = jumphost.apply_default(fleet.devices, f"admin@127.0.0.1:{fleet.bastion}")
+    yield fleet
+    jumphost.configure()
+
+# (device channels, transports) from the summary logged when the run's jump hosts are closed
+def jump_summary(caplog):
+    summaries = [SUMMARY.search(record.getMessage()) for record in caplog.records if record.name == "jumphost"]
+    summaries = [summary for summary in summaries if summary]
+    assert len(summaries) == 1
+    return int(summaries[0].group(1)), int(summaries[0].group(2))
+
+# Transports open only when every open one has no free channel: with room for the whole fleet on one transport a
+# single one is used, with half of that two
+@pytest.mark.parametrize("engine", ["thread", "async"])
+@pytest.mark.parametrize("channels,transports", [(DEVICES, 1), (DEVICES // 2, 2)])
+def test_devices_share_jump_transports(bastion_fleet, caplog, engine, channels, transports):
+    caplog.set_level(logging.INFO, logger="jumphost")
+    jumphost.configure(transports=4, channels=channels)
+    jumphost.open_run()
+    try:
+        with ResultSink() as sink:
+            _, detected_types = pyshcmd.send_command_to_devices(bastion_fleet.devices, max_workers=DEVICES, engine=engine, sink=sink)
+    finally:
+        jumphost.close_run()
+    assert {entry[3] for entry in detected_types.values()} == {"Success"}
+    assert jump_summary(caplog) == (DEVICES, transports)
+
+# Close every transport to the bastion as if it had dropped them
+def drop_transports(jump):
+    for entry in jump.transports:
+        entry["client"].get_transport().close()
+
+def test_dropped_transport_is_reopened(bastion_fleet):
+    devices = bastion_fleet.devices
+    jumphost.configure(transports=1, channels=DEVICES)
+    # One run holds the transports for the next, as the collector daemon and run_batch --per-csv do
+    jumphost.open_run()
+    try:
+        with ResultSink() as sink:
+            _, first = pyshcmd.send_command_to_devices(devices[:DEVICES // 2], max_workers=DEVICES, sink=sink)
+        jump = jumphost.jump_for(devices[0])
+        assert jump.opened == 1
+        drop_transports(jump)
+        with ResultSink() as sink:
+            _, second = pyshcmd.send_command_to_devices(devices[DEVICES // 2:], max_workers=DEVICES, sink=sink)
+        assert jump.opened == 2
+        assert jump.channels_opened == DEVICES
+    finally:
+        jumphost.close_run()
+    assert {entry[3] for entry in list(first.values()) + list(second.values())} == {"Success"}
+
+async def collect_async_dropping_transports(devices):
+    detected_types = {}
+    semaphore = asyncio.Semaphore(DEVICES)
+    half = DEVICES // 2
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        await asyncio.gather(*(pyshcmd.execute_commands_async(dict(device), "", False, detected_types, semaphore, executor) for device in devices[:half]))
+        jump = jumphost.async_jump_for(devices[0])
+        before = jump.opened
+        for conn in list(jump.transports):
+            conn.close()
+            await conn.wait_closed()
+        await asyncio.gather(*(pyshcmd.execute_commands_async(dict(device), "", False, detected_types, semaphore, executor) for device in devices[half:]))
+        after = jump.opened
+        await jumphost.close_async()
+    return detected_types, (before, after)
+
+def test_dropped_transport_is_reopened_async(bastion_fleet):
+    jumphost.configure(transports=1, channels=DEVICES)
+    detected_types, opened = asyncio.run(collect_async_dropping_transports(bastion_fleet.devices))
+    assert opened == (1, 2)
+    assert {entry[3] for entry in detected_types.values()} == {"Success"}